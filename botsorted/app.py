@@ -1,11 +1,13 @@
 from typing import Optional
 import datetime
+import hmac
+import os
 import pandas as pd
 import pytz
 
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, HTTPException, Header, Query
 from threading import Thread
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.openapi.utils import get_openapi
@@ -16,20 +18,44 @@ from .config import config
 from .trading.cli import TradingClient
 
 # arbitrage
-from .fred.scripts import find_tennis_opportunities
+from .fred.arb import arb_engine
+from .fred.scanner import tennis_scanner
 
 #vis
+from .bsutils.render import chart_pool
 from .bsutils.viz import DataVisualiser
-from .ml.dr import DirectReinforcementModel
+from .ml.features import feature_key
+from .ml.batch import batch_Ft
+from .ml.registry import registry, register_configured_models, ModelRegistryException
 
-trader = TradingEngine(model_path=config["modelLocation"])
+from .trading.state import EngineStateReader, EngineStateException
+from .trading.stream import EngineStateStream
+
+register_configured_models()
+engine_state = EngineStateReader()
+engine_stream = EngineStateStream()
+market_scan = EngineStateReader(config["marketScanFile"])
+tennis_scan = EngineStateReader(config["tennisScanFile"])
+arb_scan = EngineStateReader(config["arbScanFile"])
 
 app = FastAPI()
 
-app.mount("/static", StaticFiles(directory="build/static"), name="static")
-templates = Jinja2Templates(directory="build")
+# the frontend build isn't in the repo, without it the page routes have no
+# templates but the API still runs (e.g. for botsorted.loadtest)
+if os.path.isdir(os.path.join(config["buildDir"], "static")):
+    app.mount(
+        "/static",
+        StaticFiles(directory=os.path.join(config["buildDir"], "static")),
+        name="static",
+    )
+templates = Jinja2Templates(directory=config["buildDir"])
 
-app.trading_thread = Thread(target=trader.run_trading_loop)
+# the trader normally runs in its own process (botsorted.trading.run, next
+# to this one under botsorted.serve) so the web workers can scale,
+# runTraderInWeb keeps it in process for one worker
+if config["runTraderInWeb"]:
+    trader = TradingEngine(model_path=config["modelLocation"])
+    app.trading_thread = Thread(target=trader.run_trading_loop, daemon=True)
 
 
 def custom_openapi():
@@ -51,10 +77,26 @@ def custom_openapi():
 app.openapi = custom_openapi
 
 # start trading
-if config["runTrader"]:
+if config["runTrader"] and config["runTraderInWeb"]:
     app.trading_thread.start()
 
 
+# one scanner for all workers runs in the engine process, see botsorted.fred.scanner
+@app.on_event("startup")
+def start_tennis_scanner():
+    if config["tennisScanInWeb"]:
+        tennis_scanner.start()
+        if config["arbScanEnabled"]:
+            arb_engine.start()
+
+
+@app.on_event("shutdown")
+def shutdown_chart_pool():
+    chart_pool.shutdown()
+    tennis_scanner.stop()
+    arb_engine.stop()
+
+
 @app.get("/ping", include_in_schema=False)
 async def ping():
     return {"message": "hello"}
@@ -63,18 +105,30 @@ async def ping():
 
 @app.get('/tennis',response_class=HTMLResponse, include_in_schema=False)
 async def tennis(request: Request):
-    opps = find_tennis_opportunities()
+    # served from the last background scan, never fetched inline
+    try:
+        snap = tennis_scan.read()
+    except EngineStateException:
+        snap = {}
+    if not snap.get("scannedAt"):
+        return templates.TemplateResponse("tennis_page.html", {
+            'request':request,
+            'homeBaseUrl':'https://botsorted.herokuapp.com',
+            'currentDate':'No data yet',
+            'results':'<p>No data yet, the first scan hasn\'t finished</p>'
+        })
     # turn into html
-    html= pd.DataFrame(opps).to_html(
+    html= pd.DataFrame(snap["opportunities"]).to_html(
         index=False,
         justify='center',
         classes=['arbtable']
     )
     local_tz = pytz.timezone("Europe/London")
+    scannedAt = datetime.datetime.fromtimestamp(snap["scannedAt"], datetime.timezone.utc)
     return templates.TemplateResponse("tennis_page.html", {
         'request':request,
         'homeBaseUrl':'https://botsorted.herokuapp.com',
-        'currentDate':datetime.datetime.now(local_tz).strftime("%d/%m/%Y, %H:%M:%S %Z"),
+        'currentDate':scannedAt.astimezone(local_tz).strftime("%d/%m/%Y, %H:%M:%S %Z"),
         'results':html
     })
 
@@ -83,41 +137,204 @@ async def get_performance(request: Request):
     cli = TradingClient()
     data = cli.df_candles(config["symbolTraded"], limit=1500)
     data.close = data.close.astype(float)
-    chartHtml, chartData = DataVisualiser.plot_perf(data, trader.model)
-    start_date = datetime.datetime.fromisoformat(
-        chartData.closeTimeIso[chartData.index[1]]
-    ).date()
-    start_price = chartData.close[chartData.index[0]]
 
-    # compute extra charts data depending on what we have configed
+    # main model plus any extra charts we have configed, rendered off the event loop
+    mainSpec = {
+        "modelName": config["modelName"],
+        "modelVersion": config["modelVersion"],
+        "modelLocation": config["modelLocation"],
+    }
+    mainChart, *rendered = await chart_pool.render(
+        data, [mainSpec] + config["extraCharts"]
+    )
     extraCharts = [
-        {
-            **ec,
-            **{
-                "html": DataVisualiser.plot_perf(
-                    data,
-                    DirectReinforcementModel.from_json(ec["modelLocation"]),
-                    modelName=f"{ec['modelName']} v{ec['modelVersion']}",
-                )[0]
-            },
-        }
-        for ec in config["extraCharts"]
+        {**ec, **{"html": r["html"]}}
+        for ec, r in zip(config["extraCharts"], rendered)
     ]
+    if mainChart["startDate"] is None:
+        # the page is built around the main chart, don't show it without one
+        raise HTTPException(
+            status_code=503, detail="Chart could not be rendered, try again shortly"
+        )
+    start_date = mainChart["startDate"]
+    start_price = mainChart["startPrice"]
     return templates.TemplateResponse(
         "chart_page.html",
         {
             "request": request,
             "homeBaseUrl": "https://botsorted.herokuapp.com",
-            "chartHtml": chartHtml,
+            "chartHtml": mainChart["html"],
             "modelVersion": config["modelVersion"],
             "modelName": config["modelName"],
             "extraCharts": extraCharts,
             "startDate": start_date,
-            "startPrice": round(start_price, 2),
+            "startPrice": start_price,
         },
     )
 
 
+def _performance_series(data, model_name, model_version, max_points, Ft=None):
+    return {
+        "modelName": model_name,
+        "modelVersion": model_version,
+        **DataVisualiser.perf_series(
+            data,
+            registry.get(model_name, model_version),
+            max_points=max_points,
+            symbol=config["symbolTraded"].conc(),
+            Ft=Ft,
+        ),
+    }
+
+
+# plain defs so these run in the threadpool rather than on the event loop
+@app.get("/api/performance")
+def get_performance_data(maxPoints: Optional[int] = Query(None, ge=1)):
+    cli = TradingClient()
+    data = cli.df_candles(config["symbolTraded"], limit=1500)
+    data.close = data.close.astype(float)
+    models = [(config["modelName"], config["modelVersion"])] + [
+        (ec["modelName"], ec["modelVersion"]) for ec in config["extraCharts"]
+    ]
+    # Ft of every model over the chart tail in one batched pass
+    close = data.close.to_numpy()[-config["chartTail"] :]
+    key = feature_key(
+        config["symbolTraded"].conc(),
+        config["interval"],
+        data.closeTime.iloc[-1],
+        close,
+    )
+    mods = [registry.get(name, version) for name, version in models]
+    fts = batch_Ft(mods, close, key)
+    stats = DataVisualiser.perf_stats(
+        close,
+        fts,
+        [getattr(mod, "commission", 0.001) for mod in mods],
+        # where the earliest chart starts, the others are still flat there
+        start=min(mod.M for mod in mods) - 1,
+    )
+    return {
+        "symbol": config["symbolTraded"].conc(),
+        "models": [
+            {**_performance_series(data, name, version, maxPoints, Ft), "stats": s}
+            for (name, version), Ft, s in zip(models, fts, stats)
+        ],
+    }
+
+
+@app.get("/api/performance/{model_name}/{model_version}")
+def get_model_performance_data(
+    model_name: str, model_version: str, maxPoints: Optional[int] = Query(None, ge=1)
+):
+    cli = TradingClient()
+    data = cli.df_candles(config["symbolTraded"], limit=1500)
+    data.close = data.close.astype(float)
+    try:
+        return _performance_series(data, model_name, model_version, maxPoints)
+    except ModelRegistryException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/engine/state")
+async def get_engine_state():
+    try:
+        return engine_state.read()
+    except EngineStateException as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@app.get("/engine/health")
+async def get_engine_health():
+    return engine_state.health()
+
+
+@app.get("/engine/stream")
+async def stream_engine_state(request: Request):
+    """
+    Server sent events: a `snapshot` of the chart tail on connect, then an
+    `update` whenever the engine's candle, Ft or position changes
+    """
+    return StreamingResponse(
+        engine_stream.events(request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/arb")
+async def get_arb_opportunities(includeInPlay: bool = False):
+    """
+    Arbitrage opportunities over every configured odds page at the last
+    scan, best margin first
+    """
+    try:
+        scan = arb_scan.read()
+    except EngineStateException:
+        raise HTTPException(status_code=503, detail="No arbitrage scan published yet")
+    opps = scan["opportunities"]
+    if not includeInPlay:
+        opps = [o for o in opps if not o["inPlay"]]
+    return {**scan, "opportunities": opps}
+
+
+@app.get("/market/scan")
+async def get_market_scan(
+    limit: Optional[int] = Query(None, ge=1), changedOnly: bool = False
+):
+    """
+    Latest scan of every USDT perpetual, ranked by Ft
+    """
+    try:
+        scan = market_scan.read()
+    except EngineStateException:
+        raise HTTPException(status_code=503, detail="No market scan published yet")
+    rows = scan["rows"]
+    if changedOnly:
+        rows = [r for r in rows if r["signalChanged"]]
+    return {**scan, "rows": rows[:limit]}
+
+
+@app.get("/models")
+async def list_models():
+    return registry.list()
+
+
+@app.get("/models/{model_name}/{model_version}")
+async def get_model_info(model_name: str, model_version: str):
+    try:
+        return registry.info(model_name, model_version)
+    except ModelRegistryException as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+# only registered when enabled so a disabled profiler costs nothing
+if config["profilingEnabled"]:
+    from .bsutils.profiling import profile, ProfilingException
+
+    @app.get("/admin/profile", include_in_schema=False)
+    def get_profile(
+        seconds: float = Query(10, gt=0, le=config["profilingMaxSeconds"]),
+        interval: float = Query(0.005, gt=0),
+        memory: bool = True,
+        format: str = "json",
+        x_admin_token: Optional[str] = Header(None),
+    ):
+        """
+        Sample every thread of this process for `seconds`. format=collapsed
+        returns only the collapsed stacks, for flamegraph.pl or speedscope
+        """
+        token = os.environ.get("ADMIN_TOKEN")
+        if not token or not hmac.compare_digest(x_admin_token or "", token):
+            raise HTTPException(status_code=403, detail="Not authorised")
+        try:
+            result = profile(seconds, interval=interval, trace_memory=memory)
+        except ProfilingException as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if format == "collapsed":
+            return PlainTextResponse(result["collapsed"])
+        return result
+
+
 @app.get("/", response_class=HTMLResponse, include_in_schema=False)
 async def read_root(request: Request):
     return templates.TemplateResponse(
@@ -0,0 +1,280 @@
+"""
+Locally maintained futures order book.
+
+Built from a REST depth snapshot and kept up to date from the
+`<symbol>@depth@100ms` diff stream following Binance's procedure for
+managing a local order book. Each side is a pair of sorted numpy arrays
+(prices, quantities) so "what would a market order of size Q fill at"
+is a couple of binary searches over cached cumulative sums.
+
+The stream is the one of the exchange the client trades on, mainnet or
+testnet, and every snapshot is charged to the shared API weight budget.
+"""
+from threading import Event, Lock, Thread
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import time
+
+import numpy as np
+import websocket
+
+from ..logger import get_logger
+from ..config import config
+from .conn import BASE_URL_FUTURES, weight_budget
+
+log = get_logger(__name__)
+
+STREAM_URL_FUTURES = "wss://fstream.binance.com/ws"
+STREAM_URL_FUTURES_TEST = os.environ.get(
+    "BINANCE_TESTNET_STREAM_URL", "wss://stream.binancefuture.com/ws"
+)
+
+
+def stream_url(client) -> str:
+    """
+    Depth stream of the exchange the client's REST calls go to, so the
+    diffs and the snapshot they're applied to come from the same book
+    """
+    if client.url == BASE_URL_FUTURES:
+        return STREAM_URL_FUTURES
+    return STREAM_URL_FUTURES_TEST
+
+
+def depth_weight(limit: int) -> int:
+    if limit <= 50:
+        return 2
+    if limit <= 100:
+        return 5
+    if limit <= 500:
+        return 10
+    return 20
+
+
+class OrderBookException(Exception):
+    pass
+
+
+class BookSide(object):
+    """
+    One side of the book. Levels are stored best first, so for bids the
+    sort key is the negated price
+    """
+
+    def __init__(self, is_bid: bool):
+        self.is_bid = is_bid
+        self._keys = np.empty(0)
+        self.qtys = np.empty(0)
+        self._cum_qty = None
+        self._cum_notional = None
+
+    @property
+    def prices(self) -> np.ndarray:
+        return -self._keys if self.is_bid else self._keys
+
+    def load(self, levels: List[Tuple[str, str]]) -> None:
+        arr = np.array(levels, dtype=np.float64).reshape(-1, 2)
+        arr = arr[arr[:, 1] > 0]
+        keys = -arr[:, 0] if self.is_bid else arr[:, 0]
+        order = np.argsort(keys)
+        self._keys, self.qtys = keys[order], arr[order, 1]
+        self._cum_qty = self._cum_notional = None
+
+    def update(self, levels: List[Tuple[str, str]]) -> None:
+        """
+        Apply diff levels, a quantity of 0 removes the level
+        """
+        if not levels:
+            return
+        keys, qtys = self._keys, self.qtys
+        for px, qty in levels:
+            key = -float(px) if self.is_bid else float(px)
+            qty = float(qty)
+            i = np.searchsorted(keys, key)
+            exists = i < len(keys) and keys[i] == key
+            if qty == 0:
+                if exists:
+                    keys = np.delete(keys, i)
+                    qtys = np.delete(qtys, i)
+            elif exists:
+                qtys[i] = qty
+            else:
+                keys = np.insert(keys, i, key)
+                qtys = np.insert(qtys, i, qty)
+        self._keys, self.qtys = keys, qtys
+        self._cum_qty = self._cum_notional = None
+
+    def _cums(self) -> Tuple[np.ndarray, np.ndarray]:
+        if self._cum_qty is None:
+            self._cum_qty = np.cumsum(self.qtys)
+            self._cum_notional = np.cumsum(self.qtys * self.prices)
+        return self._cum_qty, self._cum_notional
+
+    def best(self) -> Optional[float]:
+        return float(self.prices[0]) if len(self._keys) else None
+
+    def fill(self, qty: float) -> Tuple[float, float]:
+        """
+        (average fill price, quantity filled) for a market order of qty
+        walking this side. Quantity filled is less than qty if the book
+        isn't deep enough
+        """
+        cum_qty, cum_notional = self._cums()
+        if not len(cum_qty) or qty <= 0:
+            return np.nan, 0.0
+        i = int(np.searchsorted(cum_qty, qty))
+        if i >= len(cum_qty):
+            return cum_notional[-1] / cum_qty[-1], float(cum_qty[-1])
+        prev_qty = cum_qty[i - 1] if i else 0.0
+        prev_notional = cum_notional[i - 1] if i else 0.0
+        notional = prev_notional + (qty - prev_qty) * self.prices[i]
+        return notional / qty, qty
+
+    def max_qty_within(self, limit_price: float) -> float:
+        """
+        Largest quantity that fills entirely at or better than limit_price
+        """
+        key = -limit_price if self.is_bid else limit_price
+        i = int(np.searchsorted(self._keys, key, side="right"))
+        cum_qty, _ = self._cums()
+        return float(cum_qty[i - 1]) if i else 0.0
+
+
+class OrderBook(object):
+    def __init__(self, symbol: str):
+        self.symbol = symbol
+        self.bids = BookSide(is_bid=True)
+        self.asks = BookSide(is_bid=False)
+        self.last_update_id: Optional[int] = None
+        self.updated_at: Optional[float] = None
+        self._lock = Lock()
+
+    def load_snapshot(self, snapshot: dict) -> None:
+        with self._lock:
+            self.bids.load(snapshot["bids"])
+            self.asks.load(snapshot["asks"])
+            self.last_update_id = snapshot["lastUpdateId"]
+            self.updated_at = time.time()
+
+    def apply_diff(self, event: dict) -> bool:
+        """
+        Apply a depth diff event. Returns False if the event shows the
+        book has lost sync and must be rebuilt from a new snapshot
+        """
+        with self._lock:
+            if self.last_update_id is None:
+                return False
+            if event["u"] < self.last_update_id:
+                # already in the snapshot
+                return True
+            if event["pu"] != self.last_update_id and not (
+                event["U"] <= self.last_update_id <= event["u"]
+            ):
+                return False
+            self.bids.update(event["b"])
+            self.asks.update(event["a"])
+            self.last_update_id = event["u"]
+            self.updated_at = time.time()
+        return True
+
+    @property
+    def is_live(self) -> bool:
+        return (
+            self.updated_at is not None
+            and time.time() - self.updated_at < config["orderBookMaxAgeSeconds"]
+        )
+
+    def mid(self) -> Optional[float]:
+        bid, ask = self.bids.best(), self.asks.best()
+        if bid is None or ask is None:
+            return None
+        return (bid + ask) / 2
+
+    def expected_fill(self, side: str, qty: float) -> Dict[str, float]:
+        """
+        Expected average fill price and slippage (in bps from the touch)
+        for a market order of qty base units on side BUY or SELL
+        """
+        book_side = self.asks if side == "BUY" else self.bids
+        with self._lock:
+            touch = book_side.best()
+            price, filled = book_side.fill(qty)
+        if touch is None:
+            raise OrderBookException(f"{self.symbol} book is empty")
+        slippage = abs(price - touch) / touch * 1e4
+        return {"price": price, "filled": filled, "touch": touch, "slippageBps": slippage}
+
+    def max_qty_for_slippage(self, side: str, bps: float) -> float:
+        """
+        Largest market order on side whose worst fill is within bps of
+        the touch
+        """
+        book_side = self.asks if side == "BUY" else self.bids
+        with self._lock:
+            touch = book_side.best()
+            if touch is None:
+                return 0.0
+            sign = 1 if side == "BUY" else -1
+            return book_side.max_qty_within(touch * (1 + sign * bps / 1e4))
+
+
+class OrderBookStream(object):
+    """
+    Keeps an OrderBook in sync from the diff stream on a background thread
+    """
+
+    def __init__(self, client, symbol: str, depth_limit: int = 1000):
+        self.client = client
+        self.book = OrderBook(symbol)
+        self.depth_limit = depth_limit
+        self._stop = Event()
+        self._ws: Optional[websocket.WebSocketApp] = None
+        self._thread: Optional[Thread] = None
+
+    def _resync(self):
+        # diffs already in the snapshot are skipped by apply_diff and the
+        # socket holds the rest until this returns
+        weight_budget.acquire(depth_weight(self.depth_limit))
+        snapshot = self.client.depth(self.book.symbol, limit=self.depth_limit).json()
+        self.book.load_snapshot(snapshot)
+        log.info(
+            "Synced %s order book at update %s", self.book.symbol, self.book.last_update_id
+        )
+
+    def _on_message(self, ws, message: str):
+        event = json.loads(message)
+        if event.get("e") != "depthUpdate":
+            return
+        if not self.book.apply_diff(event):
+            log.warning("%s order book out of sync, resyncing", self.book.symbol)
+            self._resync()
+
+    def _on_open(self, ws):
+        # the snapshot has to come after the stream is open so no diffs are missed
+        self._resync()
+
+    def _run(self):
+        symbol = self.book.symbol.lower()
+        url = f"{stream_url(self.client)}/{symbol}@depth@100ms"
+        while not self._stop.is_set():
+            self._ws = websocket.WebSocketApp(
+                url, on_open=self._on_open, on_message=self._on_message
+            )
+            self._ws.run_forever(ping_interval=60)
+            if not self._stop.is_set():
+                log.warning("%s depth stream closed, reconnecting", self.book.symbol)
+                time.sleep(1)
+
+    def start(self) -> OrderBook:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = Thread(
+                target=self._run, name=f"book-{self.book.symbol}", daemon=True
+            )
+            self._thread.start()
+        return self.book
+
+    def stop(self):
+        self._stop.set()
+        if self._ws is not None:
+            self._ws.close()
@@ -1,14 +1,15 @@
 import os
 import functools
 import hmac
+import threading
 import time
 import hashlib
 import requests
+from requests.adapters import HTTPAdapter
 import json
 from urllib.parse import urlencode
 
-from pydantic import BaseModel  # pylint: disable=no-name-in-module
-from typing import Optional
+from typing import NamedTuple, Optional
 import pandas as pd
 
 # customs
@@ -34,7 +35,10 @@ BASE_URL_FUTURES = "https://fapi.binance.com"
 BINANCE_API_KEY = os.environ["BINANCE_API_KEY"]
 BINANCE_API_SECRET = os.environ["BINANCE_API_SECRET"]
 
-BASE_URL_FUTURES_TEST = "https://testnet.binancefuture.com"
+# overridable to point the testnet client at a stand in, e.g. botsorted.loadtest
+BASE_URL_FUTURES_TEST = os.environ.get(
+    "BINANCE_TESTNET_URL", "https://testnet.binancefuture.com"
+)
 BINANCE_TESTNET_API_KEY = os.environ["BINANCE_TESTNET_API_KEY"]
 BINANCE_TESTNET_API_SECRET = os.environ["BINANCE_TESTNET_API_SECRET"]
 
@@ -42,6 +46,11 @@ BINANCE_TESTNET_API_SECRET = os.environ["BINANCE_TESTNET_API_SECRET"]
 RECV_WINDOW = 5000
 MAX_LEVERAGE = 5
 
+# connections kept per host on a client's session: every thread that can
+# share one at once, the market scan or tick download workers plus the
+# engine loop. requests keeps 10 by default and drops the rest after use
+POOL_MAXSIZE = max(config["marketScanWorkers"], config["tickDownloadWorkers"]) + 1
+
 log = get_logger(__name__)
 
 
@@ -49,24 +58,92 @@ class MicroServiceException(Exception):
     pass
 
 
-class BinanceRequest(BaseModel):
+class WeightBudget(object):
+    """
+    Token bucket over Binance's per minute request weight shared by
+    every thread in the process. Bulk callers (market scan, tick
+    download) acquire before each call, which blocks until the weight is
+    available without going into the `reserve` kept for the engine.
+    Every client response syncs the budget with the weight the exchange
+    says is used, so the engine's own calls are charged to it as well
+    without its orders ever waiting on it
+    """
+
+    def __init__(
+        self,
+        per_minute: int = config["apiWeightPerMinute"],
+        reserve: int = config["apiWeightReserve"],
+    ):
+        self.per_minute = per_minute
+        self.reserve = reserve
+        self._available = float(per_minute)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(
+            self.per_minute,
+            self._available + (now - self._last) * self.per_minute / 60.0,
+        )
+        self._last = now
+
+    def acquire(self, weight: int) -> None:
+        while True:
+            with self._lock:
+                self._refill()
+                if self._available - self.reserve >= weight:
+                    self._available -= weight
+                    return
+                short = weight + self.reserve - self._available
+                wait = short * 60.0 / self.per_minute
+            time.sleep(wait)
+
+    def sync(self, response) -> None:
+        """
+        Pull our view of the budget down to what the exchange says has
+        been used this minute, e.g. by other processes on the same IP
+        """
+        used = response.headers.get("X-MBX-USED-WEIGHT-1M")
+        if used is None:
+            return
+        with self._lock:
+            self._refill()
+            self._available = min(self._available, self.per_minute - float(used))
+
+
+weight_budget = WeightBudget()
+
+
+class BinanceRequest(NamedTuple):
+    # a plain tuple rather than a pydantic model as one is built per call
     endpoint: str
-    params: Optional[dict]
+    params: Optional[dict] = None
+
+
+class EndpointSpec(NamedTuple):
+    name: str
+    method_type: str
+    sig_required: bool
+    as_df: bool
 
 
 def make_request(method_type, sig_required=False, as_df=False):
     def decorator_repeat(method):
+        # everything about the call that doesn't depend on its args is fixed here
+        spec = EndpointSpec(method.__name__, method_type, sig_required, as_df)
+
         @functools.wraps(method)
         def inner(self, *args, **kwargs):
             # get method-specific params
-            breq = method(self, *args, **kwargs)
-            endpoint, params = breq.endpoint, breq.params
+            endpoint, params = method(self, *args, **kwargs)
 
-            if sig_required:
-                resp = self.send_signed_request(method_type, endpoint, params)
+            if spec.sig_required:
+                resp = self.send_signed_request(spec.method_type, endpoint, params)
             else:
                 resp = self.send_public_request(endpoint, params)
-            if as_df:
+            weight_budget.sync(resp)
+            if spec.as_df:
                 resp = pd.DataFrame(resp.json())
             # if not (resp.status_code > 199 and resp.status_code < 300):
             #     msg = f'API FAILURE: {method} call FAILED - api return: {resp.json()}'
@@ -74,13 +151,54 @@ def make_request(method_type, sig_required=False, as_df=False):
             #     raise MicroServiceException(msg)
             return resp
 
+        inner.spec = spec
         return inner
 
     return decorator_repeat
 
 
+class ServerClock(object):
+    """
+    Offset between the exchange's clock and ours, shared by every client
+    in the process and re-synced every clockSyncSeconds so signed
+    requests stay inside recvWindow
+    """
+
+    def __init__(self, sync_seconds: float = config["clockSyncSeconds"]):
+        self.sync_seconds = sync_seconds
+        self.offset_ms = 0
+        self.synced_at = None
+        self._lock = threading.Lock()
+
+    def is_stale(self) -> bool:
+        return self.synced_at is None or time.time() - self.synced_at > self.sync_seconds
+
+    def sync(self, client) -> None:
+        with self._lock:
+            if not self.is_stale():
+                return
+            try:
+                before = time.time()
+                server_ms = client.server_time().json()["serverTime"]
+                after = time.time()
+            except Exception as e:
+                log.error("Could not sync with the exchange clock: %s", e)
+                # don't retry on every request
+                self.synced_at = time.time()
+                return
+            self.offset_ms = int(server_ms - (before + after) / 2 * 1000)
+            self.synced_at = after
+        log.debug("Exchange clock offset %dms", self.offset_ms)
+
+    def timestamp(self) -> int:
+        return int(time.time() * 1000) + self.offset_ms
+
+
+server_clock = ServerClock()
+
+
 class BinanceClient(object):
-    def __init__(self, url=BASE_URL):
+    def __init__(self, url=BASE_URL, pool_maxsize: int = POOL_MAXSIZE):
         if USE_LIVE and os.environ["DEPLOY_ENV"] == "HEROKU":
             self.api_key = BINANCE_API_KEY
             self.secret_key = BINANCE_API_SECRET
@@ -89,6 +207,18 @@ class BinanceClient(object):
             self.api_key = BINANCE_TESTNET_API_KEY
             self.secret_key = BINANCE_TESTNET_API_SECRET
             self.url = BASE_URL_FUTURES_TEST
+        # keyed once, copied for each signature
+        self._hmac = hmac.new(self.secret_key.encode("utf-8"), digestmod=hashlib.sha256)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {
+                "Content-Type": "application/json;charset=utf-8",
+                "X-MBX-APIKEY": self.api_key,
+            }
+        )
 
     # used for sending request requires the signature
     def send_signed_request(self, http_method, url_path, payload={}):
@@ -99,14 +229,11 @@ class BinanceClient(object):
                 payload
             )  # filter out optional none so not encoded as none
         query_string = urlencode(payload)
-        # replace single quote to double quote
-        query_string = query_string.replace("%27", "%22")
-        if query_string:
-            query_string = "{}&timestamp={}".format(
-                query_string, self.__get_timestamp()
-            )
-        else:
-            query_string = "timestamp={}".format(self.__get_timestamp())
+        if "%27" in query_string:
+            # replace single quote to double quote
+            query_string = query_string.replace("%27", "%22")
+        ts = "recvWindow={}&timestamp={}".format(RECV_WINDOW, self.__get_timestamp())
+        query_string = "{}&{}".format(query_string, ts) if query_string else ts
 
         url = (
             self.url
@@ -116,7 +243,8 @@ class BinanceClient(object):
             + "&signature="
             + self.__hashing(query_string)
         )
-        log.debug("{} {}".format(http_method, url))
+        # never log the signed query string
+        log.debug("%s %s", http_method, url_path)
         params = {"url": url, "params": {}}
 
         if os.environ["DEPLOY_ENV"] == "HEROKU" and USE_LIVE:
@@ -138,34 +266,27 @@ class BinanceClient(object):
         url = self.url + url_path
         if query_string:
             url = url + "?" + query_string
-        log.debug("{}".format(url))
+        log.debug("GET %s", url)
         response = self.__dispatch_request("GET")(url=url)
         return response
 
     def __dispatch_request(self, http_method):
-        session = requests.Session()
-        session.headers.update(
-            {
-                "Content-Type": "application/json;charset=utf-8",
-                "X-MBX-APIKEY": self.api_key,
-            }
-        )
         return {
-            "GET": session.get,
-            "DELETE": session.delete,
-            "PUT": session.put,
-            "POST": session.post,
+            "GET": self.session.get,
+            "DELETE": self.session.delete,
+            "PUT": self.session.put,
+            "POST": self.session.post,
         }.get(http_method, "GET")
 
     def __hashing(self, query_string):
-        return hmac.new(
-            self.secret_key.encode("utf-8"),
-            query_string.encode("utf-8"),
-            hashlib.sha256,
-        ).hexdigest()
+        h = self._hmac.copy()
+        h.update(query_string.encode("utf-8"))
+        return h.hexdigest()
 
     def __get_timestamp(self):
-        return int(time.time() * 1000)
+        if server_clock.is_stale() and hasattr(self, "server_time"):
+            server_clock.sync(self)
+        return server_clock.timestamp()
 
     @staticmethod
     def filter_dict(dic):
@@ -1,3 +1,7 @@
+import threading
+import time
+from typing import Dict, List, Optional
+
 import pandas as pd
 from .conn import (
     BinanceClient,
@@ -7,13 +11,50 @@ from .conn import (
     MicroServiceException,
     MAX_LEVERAGE,
 )
-from .models import Interval
+from .models import validate_interval
+from ..config import config
 
 from ..logger import get_logger
 
 log = get_logger(__name__)
 
 
+class SymbolInfoCache(object):
+    """
+    Per symbol entries of exchangeInfo (precisions and filters), shared by
+    all clients and refreshed every exchangeInfoCacheSeconds
+    """
+
+    def __init__(self, ttl: float = config["exchangeInfoCacheSeconds"]):
+        self.ttl = ttl
+        self.symbols = {}
+        self.fetched_at = None
+        self._lock = threading.Lock()
+
+    def _refresh_if_stale(self, client) -> None:
+        if self.fetched_at is None or time.time() - self.fetched_at > self.ttl:
+            resp = client.exchange_info()
+            if resp.status_code > 199 and resp.status_code < 300:
+                self.symbols = {s["symbol"]: s for s in resp.json()["symbols"]}
+            else:
+                log.error("exchangeInfo failed: %s", resp.text)
+            # on failure keep whatever we had rather than hammering the api
+            self.fetched_at = time.time()
+
+    def get(self, client, symbol: str) -> Optional[dict]:
+        with self._lock:
+            self._refresh_if_stale(client)
+            return self.symbols.get(symbol)
+
+    def all(self, client) -> Dict[str, dict]:
+        with self._lock:
+            self._refresh_if_stale(client)
+            return dict(self.symbols)
+
+
+symbol_info_cache = SymbolInfoCache()
+
+
 class FuturesClient(BinanceClient):
     def __init__(self):
         super().__init__(BASE_URL_FUTURES)
@@ -35,6 +76,32 @@ class FuturesClient(BinanceClient):
         endpoint = "/fapi/v1/exchangeInfo"
         return BinanceRequest(endpoint=endpoint)
 
+    def symbol_info(self, symbol: str) -> Optional[dict]:
+        return symbol_info_cache.get(self, symbol)
+
+    def usdt_perpetuals(self) -> List[str]:
+        """
+        Every USDT margined perpetual currently trading
+        """
+        return sorted(
+            name
+            for name, info in symbol_info_cache.all(self).items()
+            if info.get("contractType") == "PERPETUAL"
+            and info.get("quoteAsset") == "USDT"
+            and info.get("status") == "TRADING"
+        )
+
+    def quantity_precision(self, symbol: str) -> int:
+        """
+        Decimal places order quantities for symbol must be rounded to,
+        falling back to config["quantityPrecision"] if exchangeInfo isn't
+        available
+        """
+        info = self.symbol_info(symbol)
+        if info is None or "quantityPrecision" not in info:
+            return config["quantityPrecision"]
+        return int(info["quantityPrecision"])
+
     @make_request("GET", sig_required=False)
     def recent_trades(self, symbol, limit=500):
         endpoint = "/fapi/v1/trades"
@@ -57,7 +124,7 @@ class FuturesClient(BinanceClient):
         endTime: int = None,
     ):
         endpoint = "/fapi/v1/klines"
-        interval = Interval(value=interval).value
+        interval = validate_interval(interval)
         params = {
             "symbol": symbol,
             "limit": limit,
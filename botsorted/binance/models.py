@@ -12,3 +12,17 @@ class Interval(BaseModel):
                 f"{v} not a valid interval. Must be one of: {list(config['validIntervals'].keys())}"
             )
         return v
+
+
+VALID_INTERVALS = frozenset(config["validIntervals"])
+
+
+def validate_interval(v: str) -> str:
+    """
+    Same check as Interval without building a model on every call
+    """
+    if v not in VALID_INTERVALS:
+        raise ValueError(
+            f"{v} not a valid interval. Must be one of: {list(config['validIntervals'].keys())}"
+        )
+    return v
@@ -0,0 +1,290 @@
+"""
+Bulk download of futures trades into a local tick store.
+
+Trades are fetched by walking trade IDs through `historical_trades` with
+several concurrent workers under the shared API weight budget. Each
+round of batches is deduplicated and written as one part per UTC day:
+
+    <root>/<SYMBOL>/<YYYY-MM-DD>/<firstId>-<lastId>/<column>.npy
+
+so an interrupted download keeps what it had. Once the download moves
+past a day its parts are compacted into one, leaving a single part per
+complete day.
+
+Parts are plain .npy columns rather than compressed files so reads can
+memory map them and scan months of ticks without loading them.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
+import datetime
+import os
+import shutil
+
+import numpy as np
+
+from ..config import config
+from ..logger import get_logger
+from .conn import weight_budget
+from .futures import FuturesClient
+
+log = get_logger(__name__)
+
+# max trades per historicalTrades call and its request weight
+TRADES_PER_CALL = 500
+HISTORICAL_TRADES_WEIGHT = 20
+
+COLUMNS = {
+    "id": np.int64,
+    "price": np.float64,
+    "qty": np.float64,
+    "quoteQty": np.float64,
+    "time": np.int64,
+    "isBuyerMaker": np.bool_,
+}
+
+MS_PER_DAY = 86400000
+
+
+class TickStoreException(Exception):
+    pass
+
+
+def day_name(day: int) -> str:
+    """
+    YYYY-MM-DD of a day number, time // MS_PER_DAY
+    """
+    return datetime.datetime.utcfromtimestamp(day * 86400).strftime("%Y-%m-%d")
+
+
+class TickStore(object):
+    def __init__(self, root: str = config["tickStoreLocation"]):
+        self.root = root
+
+    def _symbol_dir(self, symbol: str) -> str:
+        return os.path.join(self.root, symbol.upper())
+
+    def days(self, symbol: str) -> List[str]:
+        path = self._symbol_dir(symbol)
+        if not os.path.isdir(path):
+            return []
+        return sorted(d for d in os.listdir(path) if not d.startswith("."))
+
+    def parts(self, symbol: str, day: str) -> List[Tuple[int, int, str]]:
+        """
+        (first id, last id, path) of each part of a day in id order.
+        Parts inside another part's ids, left by a compaction that didn't
+        finish, are skipped
+        """
+        path = os.path.join(self._symbol_dir(symbol), day)
+        found = []
+        for name in os.listdir(path):
+            if name.startswith("."):
+                continue
+            first, last = name.split("-")
+            found.append((int(first), int(last), os.path.join(path, name)))
+        out = []
+        for part in sorted(found, key=lambda p: (p[0], -p[1])):
+            if not out or part[1] > out[-1][1]:
+                out.append(part)
+        return out
+
+    def last_id(self, symbol: str) -> Optional[int]:
+        for day in reversed(self.days(symbol)):
+            parts = self.parts(symbol, day)
+            if parts:
+                return parts[-1][1]
+        return None
+
+    def write(self, symbol: str, trades: Dict[str, np.ndarray]) -> None:
+        """
+        Write trades (columns as in COLUMNS, sorted by id) as one part per
+        UTC day. Parts are written to a hidden dir and renamed into place
+        so a crash never leaves a half written part
+        """
+        if not len(trades["id"]):
+            return
+        days = trades["time"] // MS_PER_DAY
+        bounds = np.flatnonzero(np.diff(days)) + 1
+        for start, end in zip(
+            np.concatenate([[0], bounds]), np.concatenate([bounds, [len(days)]])
+        ):
+            day = day_name(days[start])
+            ids = trades["id"][start:end]
+            day_dir = os.path.join(self._symbol_dir(symbol), day)
+            final = os.path.join(day_dir, f"{ids[0]}-{ids[-1]}")
+            tmp = os.path.join(day_dir, f".{ids[0]}-{ids[-1]}.tmp")
+            os.makedirs(tmp, exist_ok=True)
+            for col, dtype in COLUMNS.items():
+                np.save(
+                    os.path.join(tmp, f"{col}.npy"),
+                    trades[col][start:end].astype(dtype, copy=False),
+                )
+            if os.path.exists(final):
+                shutil.rmtree(final)
+            os.rename(tmp, final)
+
+    def compact(self, symbol: str, day: str) -> None:
+        """
+        Merge a day's parts into one, column by column through memory
+        mapped files so a busy day is never held in memory. The merged
+        part is renamed into place before the old parts are removed, and
+        parts skips any the merged one covers until they are
+        """
+        day_dir = os.path.join(self._symbol_dir(symbol), day)
+        parts = self.parts(symbol, day)
+        covered = [
+            os.path.join(day_dir, name)
+            for name in os.listdir(day_dir)
+            if not name.startswith(".")
+            and os.path.join(day_dir, name) not in {p[2] for p in parts}
+        ]
+        if len(parts) > 1:
+            first, last = parts[0][0], parts[-1][1]
+            sizes = [
+                len(np.load(os.path.join(p[2], "id.npy"), mmap_mode="r")) for p in parts
+            ]
+            final = os.path.join(day_dir, f"{first}-{last}")
+            tmp = os.path.join(day_dir, f".{first}-{last}.tmp")
+            os.makedirs(tmp, exist_ok=True)
+            for col, dtype in COLUMNS.items():
+                out = np.lib.format.open_memmap(
+                    os.path.join(tmp, f"{col}.npy"),
+                    mode="w+",
+                    dtype=dtype,
+                    shape=(sum(sizes),),
+                )
+                offset = 0
+                for (_, _, path), size in zip(parts, sizes):
+                    out[offset : offset + size] = self.read_part(path, [col])[col]
+                    offset += size
+                out.flush()
+                del out
+            os.rename(tmp, final)
+            covered.extend(p[2] for p in parts)
+            log.info("%s %s compacted %d parts", symbol, day, len(parts))
+        for path in covered:
+            shutil.rmtree(path)
+
+    def read_part(self, path: str, columns: List[str] = None) -> Dict[str, np.ndarray]:
+        return {
+            col: np.load(os.path.join(path, f"{col}.npy"), mmap_mode="r")
+            for col in (columns or list(COLUMNS))
+        }
+
+    def scan(
+        self,
+        symbol: str,
+        start: str = None,
+        end: str = None,
+        columns: List[str] = None,
+    ) -> Iterator[Dict[str, np.ndarray]]:
+        """
+        Memory mapped parts for days start to end inclusive
+        (YYYY-MM-DD), in trade id order
+        """
+        for day in self.days(symbol):
+            if (start and day < start) or (end and day > end):
+                continue
+            for _, _, path in self.parts(symbol, day):
+                yield self.read_part(path, columns)
+
+    def read(
+        self, symbol: str, start: str = None, end: str = None, columns: List[str] = None
+    ) -> Dict[str, np.ndarray]:
+        """
+        Like scan but concatenated into memory
+        """
+        parts = list(self.scan(symbol, start, end, columns))
+        return {
+            col: np.concatenate([p[col] for p in parts])
+            if parts
+            else np.empty(0, dtype=COLUMNS[col])
+            for col in (columns or list(COLUMNS))
+        }
+
+
+def trades_to_columns(trades: List[dict]) -> Dict[str, np.ndarray]:
+    return {
+        "id": np.fromiter((t["id"] for t in trades), np.int64, len(trades)),
+        "price": np.fromiter((float(t["price"]) for t in trades), np.float64, len(trades)),
+        "qty": np.fromiter((float(t["qty"]) for t in trades), np.float64, len(trades)),
+        "quoteQty": np.fromiter(
+            (float(t["quoteQty"]) for t in trades), np.float64, len(trades)
+        ),
+        "time": np.fromiter((t["time"] for t in trades), np.int64, len(trades)),
+        "isBuyerMaker": np.fromiter(
+            (t["isBuyerMaker"] for t in trades), np.bool_, len(trades)
+        ),
+    }
+
+
+class TradeDownloader(object):
+    def __init__(
+        self,
+        client: FuturesClient = None,
+        store: TickStore = None,
+        workers: int = config["tickDownloadWorkers"],
+    ):
+        self.client = client or FuturesClient()
+        self.store = store or TickStore()
+        self.workers = workers
+
+    def _fetch(self, symbol: str, from_id: int) -> List[dict]:
+        weight_budget.acquire(HISTORICAL_TRADES_WEIGHT)
+        resp = self.client.historical_trades(
+            symbol, limit=TRADES_PER_CALL, fromId=from_id
+        )
+        if not (resp.status_code > 199 and resp.status_code < 300):
+            raise TickStoreException(
+                f"historicalTrades {symbol} fromId={from_id} failed: {resp.text}"
+            )
+        return resp.json()
+
+    def latest_id(self, symbol: str) -> int:
+        return self.client.recent_trades(symbol, limit=1).json()[-1]["id"]
+
+    def download(
+        self, symbol: str, from_id: int = None, to_id: int = None
+    ) -> int:
+        """
+        Download trades from from_id (default: resume after the last
+        stored id, or start from 0) up to to_id (default: the latest trade
+        now). Returns the number of trades written
+        """
+        if from_id is None:
+            last = self.store.last_id(symbol)
+            from_id = 0 if last is None else last + 1
+        if to_id is None:
+            to_id = self.latest_id(symbol)
+        written = 0
+        round_size = self.workers * TRADES_PER_CALL
+        # days written to that may still get more trades
+        open_days = set(self.store.days(symbol)[-1:])
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while from_id <= to_id:
+                starts = range(from_id, min(from_id + round_size, to_id + 1), TRADES_PER_CALL)
+                batches = list(pool.map(lambda s: self._fetch(symbol, s), starts))
+                trades = [t for batch in batches for t in batch]
+                if not trades:
+                    break
+                cols = trades_to_columns(trades)
+                # batches overlap at the edges and can run past to_id
+                _, keep = np.unique(cols["id"], return_index=True)
+                keep = keep[(cols["id"][keep] >= from_id) & (cols["id"][keep] <= to_id)]
+                cols = {k: v[keep] for k, v in cols.items()}
+                if not len(keep):
+                    break
+                self.store.write(symbol, cols)
+                written += len(keep)
+                open_days.update(
+                    day_name(d) for d in np.unique(cols["time"] // MS_PER_DAY)
+                )
+                last_day = max(open_days)
+                for day in sorted(open_days - {last_day}):
+                    self.store.compact(symbol, day)
+                open_days = {last_day}
+                log.info(
+                    "%s trades %d-%d stored", symbol, cols["id"][0], cols["id"][-1]
+                )
+                from_id = int(cols["id"][-1]) + 1
+        return written
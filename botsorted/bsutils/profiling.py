@@ -0,0 +1,209 @@
+"""
+On-demand profiling of the running process.
+
+Nothing here runs until a profile is requested: the sampler runs in the
+requesting thread for the length of one profile and tracemalloc is only
+started for that window (unless it was already tracing), so there is no
+cost while profiling is not in use.
+
+Samples of every thread's stack are taken from sys._current_frames and
+folded into the collapsed stack format flamegraph.pl and speedscope read:
+
+    thread;outer_func (file:line);...;inner_func (file:line) <count>
+
+The web app serves profiles on /admin/profile. Processes without an HTTP
+server, like the trading engine, dump one to a file on a signal instead:
+
+    kill -USR1 <engine pid>   # pid is in the engine state file
+"""
+from collections import Counter
+from typing import Dict, List
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+
+from ..logger import get_logger
+
+log = get_logger(__name__)
+
+
+class ProfilingException(Exception):
+    pass
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _thread_cpu_times() -> Dict[int, float]:
+    """
+    CPU seconds used so far by each live thread, keyed by thread ident.
+    Empty where the platform has no per thread CPU clocks
+    """
+    times = {}
+    for thread in threading.enumerate():
+        try:
+            clock = time.pthread_getcpuclockid(thread.ident)
+            times[thread.ident] = time.clock_gettime(clock)
+        except (AttributeError, OSError, TypeError):
+            continue
+    return times
+
+
+class SamplingProfiler(object):
+    def __init__(self, interval: float = 0.005, max_depth: int = 128):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples: Counter = Counter()
+        self.sample_count = 0
+
+    def _sample(self, skip: int, names: Dict[int, str]) -> None:
+        for ident, frame in sys._current_frames().items():
+            if ident == skip:
+                continue
+            stack = []
+            while frame is not None and len(stack) < self.max_depth:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            self.samples[";".join(reversed(stack))] += 1
+        self.sample_count += 1
+
+    def run(self, seconds: float) -> Counter:
+        """
+        Sample every other thread's stack each interval for `seconds`,
+        blocking the calling thread meanwhile
+        """
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            self._sample(me, names)
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            time.sleep(self.interval)
+        return self.samples
+
+    def collapsed(self) -> str:
+        return "\n".join(f"{stack} {n}" for stack, n in self.samples.most_common())
+
+
+def top_allocations(snapshot: tracemalloc.Snapshot, limit: int) -> List[dict]:
+    stats = snapshot.filter_traces(
+        [
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, __file__),
+        ]
+    ).statistics("lineno")
+    return [
+        {
+            "location": f"{s.traceback[0].filename}:{s.traceback[0].lineno}",
+            "sizeBytes": s.size,
+            "count": s.count,
+        }
+        for s in stats[:limit]
+    ]
+
+
+_profile_lock = threading.Lock()
+
+
+def profile(
+    seconds: float,
+    interval: float = 0.005,
+    trace_memory: bool = True,
+    top: int = 25,
+) -> dict:
+    """
+    Time boxed profile of the whole process: collapsed stacks of all
+    threads, CPU time used by each thread over the window and, if
+    trace_memory, the top allocations made during it.
+    Only one profile runs at a time
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilingException("A profile is already running")
+    started_tracing = False
+    try:
+        started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        cpu_before = _thread_cpu_times()
+        wall_start = time.monotonic()
+
+        profiler = SamplingProfiler(interval)
+        profiler.run(seconds)
+
+        wall = time.monotonic() - wall_start
+        cpu_after = _thread_cpu_times()
+        names.update({t.ident: t.name for t in threading.enumerate()})
+        allocations = None
+        if trace_memory:
+            allocations = top_allocations(tracemalloc.take_snapshot(), top)
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+        _profile_lock.release()
+
+    threads = [
+        {
+            "thread": names.get(ident, f"thread-{ident}"),
+            "cpuSeconds": round(cpu_after[ident] - cpu_before.get(ident, 0.0), 4),
+            "cpuSecondsTotal": round(cpu_after[ident], 4),
+        }
+        for ident in cpu_after
+        if ident != threading.get_ident()
+    ]
+    threads.sort(key=lambda t: t["cpuSeconds"], reverse=True)
+    log.info("Profiled %.1fs, %d samples", wall, profiler.sample_count)
+    return {
+        "seconds": round(wall, 3),
+        "samples": profiler.sample_count,
+        "threads": threads,
+        "allocations": allocations,
+        "collapsed": profiler.collapsed(),
+    }
+
+
+def dump_profile(path: str, seconds: float, **kwargs) -> None:
+    """
+    profile() written to path as JSON, replacing it atomically
+    """
+    try:
+        result = profile(seconds, **kwargs)
+    except ProfilingException as e:
+        log.warning("Profile dump skipped: %s", e)
+        return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(result, f)
+    os.replace(tmp, path)
+    log.info("Profile written to %s", path)
+
+
+def install_dump_signal(path: str, seconds: float, signum: int = None) -> bool:
+    """
+    Dump a profile of `seconds` to path whenever the process gets signum
+    (default SIGUSR1). The profile runs in a new thread so the one the
+    signal interrupted, usually the main loop, is among those sampled.
+    False where the platform has no such signal
+    """
+    signum = signum or getattr(signal, "SIGUSR1", None)
+    if signum is None:
+        return False
+
+    def handler(signum, frame):
+        threading.Thread(
+            target=dump_profile, args=(path, seconds), name="profile-dump", daemon=True
+        ).start()
+
+    signal.signal(signum, handler)
+    return True
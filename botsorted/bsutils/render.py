@@ -0,0 +1,243 @@
+"""
+Renders performance charts for several models in a pool of worker
+processes so the event loop isn't blocked by Ft calcs, pandas and Bokeh.
+
+The candles are written once per request to a shared memory block that
+every worker maps rather than being pickled to each of them.
+
+At most `workers` renders are submitted at once so the timeout only
+counts a render's own run time, not time queued behind others. A render
+that times out can't be cancelled in its worker, so the pool is killed
+and a fresh one started for the next request.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import get_context, resource_tracker, shared_memory
+from typing import List, Optional
+import asyncio
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from ..config import config
+from ..logger import get_logger
+
+log = get_logger(__name__)
+
+# columns shared with the workers, in order
+SHARED_COLUMNS = ["close", "closeTime"]
+
+
+class ChartRenderException(Exception):
+    pass
+
+
+class SharedCandles(object):
+    """
+    close and closeTime of a candles frame laid out in one shared
+    memory block as a (2, n) float64 array
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        self.n = len(data)
+        self.shm = shared_memory.SharedMemory(create=True, size=max(16 * self.n, 1))
+        arr = np.ndarray((2, self.n), dtype=np.float64, buffer=self.shm.buf)
+        arr[0] = data.close.astype(float).values
+        arr[1] = data.closeTime.astype(float).values
+        del arr
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def release(self):
+        self.shm.close()
+        self.shm.unlink()
+
+
+def _attach_shared(shm_name: str) -> shared_memory.SharedMemory:
+    """
+    Map the parent's block without registering it with the resource
+    tracker (bpo-39959), which would otherwise treat the worker as an
+    owner and warn about a leak or unlink it early. The parent created
+    it and is the only one to unlink it
+    """
+    register = resource_tracker.register
+    resource_tracker.register = lambda *args: None
+    try:
+        return shared_memory.SharedMemory(name=shm_name)
+    finally:
+        resource_tracker.register = register
+
+
+def _candles_from_shared(shm_name: str, n: int, tail: int) -> pd.DataFrame:
+    shm = _attach_shared(shm_name)
+    try:
+        arr = np.ndarray((2, n), dtype=np.float64, buffer=shm.buf)
+        # only the tail is charted so that's all that gets copied out
+        close = arr[0, -tail:].copy()
+        close_time = arr[1, -tail:].astype(np.int64)
+        del arr
+    finally:
+        shm.close()
+    return pd.DataFrame(
+        {
+            "close": close,
+            "closeTime": close_time,
+            "closeTimeIso": [
+                datetime.datetime.fromtimestamp(t / 1000).isoformat()
+                for t in close_time
+            ],
+        }
+    )
+
+
+def render_chart(
+    shm_name: str,
+    n: int,
+    model_name: str,
+    model_version: str,
+    model_path: str,
+    tail: int = config["chartTail"],
+) -> dict:
+    """
+    Runs in the worker. Models come from the worker's own registry so
+    they're only loaded once per worker process
+    """
+    # imported here so the parent doesn't need bokeh to create the pool
+    from ..ml.registry import registry
+    from .viz import DataVisualiser
+
+    data = _candles_from_shared(shm_name, n, tail)
+    registry.register(model_name, model_version, model_path)
+    # no symbol so the feature cache is skipped, see ml.features
+    html, chartData = DataVisualiser.plot_perf(
+        data,
+        registry.get(model_name, model_version),
+        tail=tail,
+        modelName=f"{model_name} v{model_version}",
+    )
+    return {
+        "html": html,
+        "startDate": datetime.datetime.fromisoformat(
+            chartData.closeTimeIso[chartData.index[1]]
+        ).date(),
+        "startPrice": round(chartData.close[chartData.index[0]], 2),
+    }
+
+
+class ChartRenderPool(object):
+    def __init__(
+        self,
+        workers: int = config["chartWorkers"],
+        timeout: float = config["chartRenderTimeoutSeconds"],
+    ):
+        self.workers = workers
+        self.timeout = timeout
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn rather than fork as the trading thread may be running
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=get_context("spawn")
+            )
+        return self._pool
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # created lazily so it belongs to the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    def _kill(self, pool: ProcessPoolExecutor) -> None:
+        """
+        Kill a pool with a stuck render in it. Other renders running in
+        it fail and the next render starts a fresh pool
+        """
+        if self._pool is pool:
+            self._pool = None
+        # there's no public way to stop a running task, so kill its workers
+        for proc in list((pool._processes or {}).values()):
+            proc.terminate()
+        pool.shutdown(wait=False)
+
+    async def _render_one(
+        self, candles: SharedCandles, spec: dict, futures: list
+    ) -> dict:
+        args = (
+            candles.name,
+            candles.n,
+            spec["modelName"],
+            spec["modelVersion"],
+            spec["modelLocation"],
+        )
+        async with self.slots:
+            pool = self.pool
+            try:
+                fut = pool.submit(render_chart, *args)
+            except BrokenProcessPool:
+                # a worker died outside a render, e.g. killed by the OS
+                self._kill(pool)
+                pool = self.pool
+                fut = pool.submit(render_chart, *args)
+            futures.append((pool, fut))
+            try:
+                return await asyncio.wait_for(asyncio.wrap_future(fut), self.timeout)
+            except asyncio.TimeoutError:
+                log.error(
+                    "Rendering %s v%s timed out after %ss, restarting the render pool",
+                    spec["modelName"],
+                    spec["modelVersion"],
+                    self.timeout,
+                )
+                self._kill(pool)
+                msg = "Chart took too long to render, try again shortly"
+            except Exception as e:
+                log.error(
+                    "Rendering %s v%s failed: %s",
+                    spec["modelName"],
+                    spec["modelVersion"],
+                    e,
+                )
+                msg = "Chart could not be rendered"
+        return {"html": f"<p>{msg}</p>", "startDate": None, "startPrice": None}
+
+    async def render(self, data: pd.DataFrame, specs: List[dict]) -> List[dict]:
+        """
+        Render one chart per spec (dicts with modelName, modelVersion and
+        modelLocation as in config["extraCharts"]), each bounded by the
+        pool timeout. Results are in the same order as specs, failed ones
+        have a message as html and no startDate or startPrice
+        """
+        candles = SharedCandles(data)
+        futures = []
+        try:
+            return await asyncio.gather(
+                *[self._render_one(candles, spec, futures) for spec in specs]
+            )
+        finally:
+            # only unlink once no worker can still be attaching to it.
+            # Timed out renders have had their workers killed already,
+            # this covers the request itself being cancelled mid render
+            running = [(p, f) for p, f in futures if not f.done()]
+            if running:
+                await asyncio.wait(
+                    [asyncio.wrap_future(f) for _, f in running], timeout=self.timeout
+                )
+                for pool in {p for p, f in running if not f.done()}:
+                    self._kill(pool)
+                await asyncio.wait([asyncio.wrap_future(f) for _, f in running])
+            candles.release()
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+
+chart_pool = ChartRenderPool()
@@ -10,11 +10,15 @@ from bokeh.models.tools import (
     CrosshairTool,
 )
 
+from typing import List, Optional, Sequence, Tuple
 import numpy as np
 import pandas as pd
 
 from ..config import config
+from ..ml import analytics
 from ..ml.dr import DirectReinforcementModel
+from ..ml.features import feature_key
+from ..ml.batch import batch_Ft
 
 
 def datet(x):
@@ -28,10 +32,9 @@ class DataVisualiser:
         mod: DirectReinforcementModel,
         tail: int = config["chartTail"],
         modelName: str = f"{config['modelName']} v{config['modelVersion']}",
+        symbol: Optional[str] = None,
     ) -> str:  # returns HTML str
-        data = data.tail(tail)
-        data = DataVisualiser.add_positions_to_data(mod, data)
-        data = DataVisualiser.add_performance_to_data(mod, data)
+        data = DataVisualiser.build_perf_data(mod, data, tail, symbol)
         p1 = figure(
             x_axis_type="datetime",
             title="Cumulative Returns by Strategy",
@@ -67,24 +70,152 @@ class DataVisualiser:
         return file_html(p1, CDN), data
 
     @staticmethod
-    def add_positions_to_data(mod, data, addip1=False):
-        if addip1:
-            data["close"] = pd.Series(
-                list(data.close.astype(float))
-                + [data.close.astype(float)[data.close.index[-1]]]
-            )
-        fts = mod.calc_Ft(mod.get_x(data.close.astype(float)), mod.theta)
-        data["posFt"] = [0] + list(np.sign(fts))
-        data["pos"] = ["L" if f > 0 else "S" if f < 0 else np.NaN for f in data.posFt]
+    def perf_series(
+        data: pd.DataFrame,
+        mod: DirectReinforcementModel,
+        tail: int = config["chartTail"],
+        max_points: Optional[int] = None,
+        decimals: int = 4,
+        symbol: Optional[str] = None,
+        Ft: Optional[np.ndarray] = None,
+    ) -> dict:
+        """
+        Same series as plot_perf but as compact columns for charting
+        client-side rather than as a Bokeh document.
+        If max_points is given the series are decimated to at most that
+        many points, always keeping the latest one
+        """
+        data = DataVisualiser.build_perf_data(mod, data, tail, symbol, Ft=Ft)
+
+        idx = np.arange(len(data))
+        if max_points and len(data) > max_points:
+            step = int(np.ceil(len(data) / max_points))
+            idx = idx[::-1][::step][::-1]
+        rows = data.iloc[idx]
+        return {
+            "closeTime": rows.closeTime.astype(np.int64).tolist(),
+            "modelReturns": rows.modelReturnsCumSum.fillna(0)
+            .round(decimals)
+            .tolist(),
+            "buyHoldReturns": rows.buyHoldReturns.fillna(0).round(decimals).tolist(),
+            "position": rows.posFt.astype(np.int8).tolist(),
+        }
+
+    @staticmethod
+    def build_perf_data(
+        mod: DirectReinforcementModel,
+        data: pd.DataFrame,
+        tail: int = config["chartTail"],
+        symbol: Optional[str] = None,
+        interval: str = config["interval"],
+        Ft: Optional[np.ndarray] = None,
+    ) -> pd.DataFrame:
+        """
+        Tail of data with the position and performance columns added.
+        Everything is computed on numpy arrays and the frame is copied
+        once, when the columns are assigned, so `data` is never mutated.
+        If symbol is given the model inputs go through the feature cache.
+        Ft can be passed in when it was already computed over the same
+        tail, e.g. by batch_Ft for several models at once
+        """
+        close = data.close.to_numpy(dtype=np.float64)[-tail:]
+        key = None
+        if symbol is not None:
+            key = feature_key(symbol, interval, data.closeTime.iloc[-1], close)
+        posFt = DataVisualiser.positions(mod, close, key, Ft)
 
         # remove time when model is computing first M window as not relevant for assessment
-        data = data.tail(
-            len(data) - mod.M + 1
-        )  # minus the lookback window +1 to inlcude the one where it starts off which is 0
-        return data
+        # minus the lookback window +1 to inlcude the one where it starts off which is 0
+        start = mod.M - 1
+        close, posFt = close[start:], posFt[start:]
+        modelReturnsCumSum, buyHoldReturns = DataVisualiser.performance(close, posFt)
+        return data.iloc[-len(close) :].assign(
+            close=close,
+            posFt=posFt,
+            pos=DataVisualiser.position_labels(posFt),
+            modelReturnsCumSum=modelReturnsCumSum,
+            buyHoldReturns=buyHoldReturns,
+        )
+
+    @staticmethod
+    def perf_stats(
+        close: np.ndarray,
+        Fts: Sequence[np.ndarray],
+        commissions: Sequence[float],
+        start: int = 0,
+        decimals: int = 4,
+    ) -> List[dict]:
+        """
+        analytics.metrics of every model's Ft (as batch_Ft gives, one
+        shorter than close) in one pass over the (models, T) array,
+        trading the chart's positions: sign(Ft_k) held from close k to
+        close k+1. With no commission totalReturn is the chart's last
+        cumulative return when `start` is the chart's, mod.M - 1. Bars
+        before `start` are left out so the warm up, where Ft is still 0,
+        doesn't count
+        """
+        pos = np.sign(np.stack(Fts))
+        # no position is taken at the last close, only its return is scored
+        pos = np.concatenate([pos, pos[:, -1:]], axis=1)
+        rets = np.r_[0.0, close[1:] / close[:-1] - 1]
+        stats = analytics.metrics(
+            pos[:, start:], rets[start:], np.asarray(commissions)
+        )
+        return [
+            {name: round(float(values[i]), decimals) for name, values in stats.items()}
+            for i in range(len(Fts))
+        ]
+
+    @staticmethod
+    def positions(
+        mod, close: np.ndarray, key=None, Ft: Optional[np.ndarray] = None
+    ) -> np.ndarray:
+        """
+        sign of Ft for each bar, 0 for the first as it has no return
+        """
+        if Ft is None:
+            Ft = batch_Ft([mod], close, key)[0]
+        posFt = np.zeros(len(close))
+        np.sign(Ft, out=posFt[1:])
+        return posFt
+
+    @staticmethod
+    def position_labels(posFt: np.ndarray) -> np.ndarray:
+        labels = np.full(len(posFt), np.nan, dtype=object)
+        labels[posFt > 0] = "L"
+        labels[posFt < 0] = "S"
+        return labels
+
+    @staticmethod
+    def performance(close: np.ndarray, posFt: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        cumulative model and buy/hold returns as analytics.cumulative_returns
+        of relative close to close returns, the model's times posFt on the
+        same bar. NaN on the first bar, which has no return
+        """
+        rets = close[1:] / close[:-1] - 1
+        buyHoldReturns = np.r_[np.nan, analytics.cumulative_returns(rets)]
+        modelReturnsCumSum = np.r_[
+            np.nan, analytics.cumulative_returns(rets * posFt[1:])
+        ]
+        return modelReturnsCumSum, buyHoldReturns
+
+    @staticmethod
+    def add_positions_to_data(mod, data):
+        close = data.close.to_numpy(dtype=np.float64)
+        posFt = DataVisualiser.positions(mod, close)
+        start = mod.M - 1
+        return data.iloc[start:].assign(
+            close=close[start:],
+            posFt=posFt[start:],
+            pos=DataVisualiser.position_labels(posFt[start:]),
+        )
 
     @staticmethod
     def add_performance_to_data(mod, data):
-        data["modelReturnsCumSum"] = (data.close.diff() * data.posFt).cumsum()
-        data["buyHoldReturns"] = data.close.diff().cumsum()  # [0]+list(x.cumsum())
-        return data
+        modelReturnsCumSum, buyHoldReturns = DataVisualiser.performance(
+            data.close.to_numpy(dtype=np.float64), data.posFt.to_numpy()
+        )
+        return data.assign(
+            modelReturnsCumSum=modelReturnsCumSum, buyHoldReturns=buyHoldReturns
+        )
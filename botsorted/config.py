@@ -1,9 +1,22 @@
 from .models import Symbol
+import json
 import os
 
 DEPLOY_ENV = os.environ["DEPLOY_ENV"]
 
 config = {
+    "apiWeightPerMinute": 2400,  # binance futures request weight limit per IP
+    "apiWeightReserve": 240,  # left free by bulk calls for the trading engine's own requests
+    "arbHostConcurrency": 2,  # max in flight requests to any one bookie/odds site
+    "arbPages": [
+        {"sport": "tennis", "market": "match-winner", "url": "https://www.oddschecker.com/tennis"},
+        {"sport": "football", "market": "match-result", "url": "https://www.oddschecker.com/football"},
+        {"sport": "basketball", "market": "match-winner", "url": "https://www.oddschecker.com/basketball"},
+    ],
+    "arbScanEnabled": True,  # runs alongside the tennis scanner, served by /arb
+    "arbScanFile": "data/arb_scan.json",
+    "arbScanIntervalSeconds": 120,
+    "buildDir": "build",  # frontend build: page templates and static/
     "candleColumns": [  # these are in order
         "openTime",
         "open",
@@ -18,11 +31,22 @@ config = {
         "takerBuyQuoteAssetVolume",
         "ignore",
     ],
+    "chartRenderTimeoutSeconds": 20,  # per model, so one slow model can't hold up the page
     "chartTail": 1000,
+    "chartWorkers": 2,
+    "clockSyncSeconds": 600,  # how often the exchange clock offset is refreshed
+    "datasetDir": "data/datasets",  # ingested training datasets, see botsorted.ml.datasets
     "dbUrl": "DATABASE_URL"
     if DEPLOY_ENV == "HEROKU"
     else "HEROKU_POSTGRESQL_COBALT_URL",
+    "engineHeartbeatFile": "data/engine_heartbeat.json",  # rewritten every sleepInterval, kept apart from the state
+    "engineHeartbeatTimeoutSeconds": 120,
+    "engineStateFile": "data/engine_state.json",  # published by the trading engine process, read by the web workers
+    "engineStreamKeepaliveSeconds": 15,
+    "engineStreamPollSeconds": 1,  # how often /engine/stream checks the state file while anyone is connected
+    "engineStreamQueueSize": 64,  # messages buffered per client before a slow one is dropped
     "exchange": "Binance",
+    "exchangeInfoCacheSeconds": 3600,
     "execute_strat": False,
     "interval": "1d",
     "extraCharts": [
@@ -39,25 +63,56 @@ config = {
             "description": "First iteration of an LTC futures trading agent",
         },
     ],
+    "featureCacheMaxBytes": 64 * 1024 * 1024,  # model inputs shared between models on the same candles
+    "loadTestResultsDir": "data/loadtest",  # botsorted.loadtest results, one file per run
+    "logDebugSampling": {  # module: keep 1 in N debug records per call site
+        "botsorted.trading.engine": 15,
+    },
+    "logFile": "logs/botsorted.log",  # one per process with the pid added, not used on heroku
     "logLevel": "info",
+    "logLevels": {},  # per module overrides of logLevel e.g. {"botsorted.binance.conn": "debug"}
+    "marketScanCandles": 499,  # klines per symbol, under 500 keeps each call at weight 2
+    "marketScanEnabled": False,  # scan every USDT perpetual on each candle close
+    "marketScanFile": "data/market_scan.json",
+    "marketScanWorkers": 16,
+    "maxSlippageBps": 10,  # split market orders expected to slip more than this from the touch
     "maxTradeSizeUSDT": 15000,
     "modelLocation": "botsorted/ml/static/grid-boy-wonder.json",
     "modelName": "Reggie",
+    "modelRegistryPollSeconds": 30,  # how often loaded model files are checked for changes
     "modelStrategy": "futures",
     "modelType": "autogression",
     "modelVersion": "2.0",
-    "quantityPrecision": 3,  # rounding required for order API
+    "orderBookMaxAgeSeconds": 5,  # local book only used for sizing if updated this recently
+    "orderSplitMaxChunks": 4,
+    "orderSplitWaitSeconds": 2,  # between child orders to let the book refill
+    "profilingDumpFile": "data/engine_profile.json",  # written by the engine process on SIGUSR1
+    "profilingDumpSeconds": 10,
+    "profilingEnabled": False,  # /admin/profile, also needs the ADMIN_TOKEN env var
+    "profilingMaxSeconds": 30,
+    "quantityPrecision": 3,  # fallback rounding for the order API if exchangeInfo is unavailable
+    "robustnessChunkPaths": 500,  # paths evaluated at once per worker, bounds memory
+    "robustnessWorkers": 2,
     "runTrader": True
     if DEPLOY_ENV == "HEROKU"
     else False,  # only run the trader on the remote host, not locally as likely testing other stuff
+    "runTraderInWeb": False,  # run the trader as a thread of the web app instead of its own process
     "sleepInterval": 20,
     "symbolTraded": Symbol(base="BTC", quote="USDT"),
+    "tennisScanFile": "data/tennis_scan.json",  # published by the engine process on the same host, read by /tennis
+    "tennisScanInWeb": False
+    if DEPLOY_ENV == "HEROKU"
+    else True,  # scan from the web app, only for a single local worker
+    "tennisScanIntervalSeconds": 120,
+    "tickStoreLocation": "data/ticks",
+    "tickDownloadWorkers": 4,
     "tradeMarginRatio": 0.98,  # amount of margin balance to use to calculate base qty required for short trade
     "tradeCallMaxRetries": 2,
     "tradeCallWaitTimeSeconds": 5,
     # ##################
     "useLiveAccount": True,
     # ##################
+    "useOrderBook": True,  # maintain a local order book for the traded symbol when execute_strat
     "validIntervals": {
         "1m": 60,
         "3m": 180,
@@ -74,6 +129,10 @@ config = {
         "3d": 259200,
         "1w": 604800,
     },
+    "warmRestart": True,  # resume the engine from its last snapshot if still valid
     'version':'1.6.2'
     
 }
+
+# JSON overrides of any of the above for one run, e.g. by the load test harness
+config.update(json.loads(os.environ.get("BOTSORTED_CONFIG", "{}")))
@@ -1,7 +1,7 @@
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Float
+from sqlalchemy import Column, String, Integer, BigInteger, DateTime, Float, Text
 from .config import config
 import os
 
@@ -23,5 +23,15 @@ class FtScores(Base):
     currentPrice = Column(Float)
 
 
+class EngineSnapshots(Base):
+    __tablename__ = "engine_snapshots"
+    __table_args__ = {"schema": "main"}
+
+    # one row per symbol, interval and model, overwritten on each save
+    snapshotKey = Column(String, primary_key=True)
+    savedAt = Column(DateTime)
+    payload = Column(Text)
+
+
 # create
 Base.metadata.create_all(engine)
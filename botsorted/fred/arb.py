@@ -0,0 +1,270 @@
+"""
+Arbitrage engine over any number of oddschecker sport/market pages.
+
+Pages are fetched concurrently with a cap on in-flight requests per host,
+every market row is normalised into one padded odds matrix and n-way
+arbitrage plus stake splits are evaluated for all markets in a single
+numpy pass. Only markets whose odds changed since the last scan are
+re-evaluated.
+
+Like the tennis scanner it runs in the engine process and publishes each
+scan to arbScanFile, served by /arb.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, Semaphore, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+import datetime
+import json
+import os
+
+import numpy as np
+import requests
+
+from ..config import config
+from ..logger import get_logger
+from .scripts import (
+    headers,
+    parse_page,
+    parse_odds,
+    _get_matches,
+    _get_players,
+    _get_odds,
+    _get_time,
+    _is_in_play,
+)
+
+log = get_logger(__name__)
+
+
+class ArbitrageEngineException(Exception):
+    pass
+
+
+def fetch_page(url: str) -> str:
+    resp = requests.get(url, headers=headers, timeout=20)
+    resp.raise_for_status()
+    return resp.text
+
+
+def _get_outcomes(match, n: int) -> Optional[List[str]]:
+    """
+    Name of each of the n priced outcomes of a market row. 1X2 rows only
+    name the two sides with the draw priced between them. None if the
+    names can't be matched to the prices
+    """
+    names = _get_players(match)
+    if len(names) == n:
+        return names
+    if n == 3 and len(names) == 2:
+        return [names[0], "Draw", names[1]]
+    return None
+
+
+def parse_markets(html: str, sport: str, market: str) -> List[dict]:
+    """
+    One dict per market row on the page with its outcomes' odds as
+    given on the page. Rows whose outcomes can't be told apart are
+    skipped, so stakes are never put against the wrong name
+    """
+    rows = []
+    for match in _get_matches(parse_page(html)):
+        odds = tuple(_get_odds(match, as_str=True))
+        names = _get_outcomes(match, len(odds))
+        if names is None:
+            log.debug(
+                "Skipping a %s/%s row with %d names for %d prices",
+                sport,
+                market,
+                len(_get_players(match)),
+                len(odds),
+            )
+            continue
+        day = match.get("data-day", "")
+        kickoff = _get_time(match) if match.find("td", {"class": "time"}) else ""
+        rows.append(
+            {
+                "key": f"{sport}/{market}/{day}/{kickoff}/{'|'.join(names)}",
+                "sport": sport,
+                "market": market,
+                "day": day,
+                "kickoff": kickoff,
+                "outcomes": names,
+                "odds": odds,
+                "inPlay": _is_in_play(match) is not None,
+            }
+        )
+    return rows
+
+
+def odds_matrix(odds: List[Tuple[str, ...]]) -> np.ndarray:
+    """
+    (markets x max outcomes) decimal odds, NaN padded. Markets with any
+    unreadable price are all NaN so they're never flagged
+    """
+    width = max((len(o) for o in odds), default=0)
+    mat = np.full((len(odds), width), np.nan)
+    for i, row in enumerate(odds):
+        fracs = [parse_odds(o) for o in row]
+        if len(fracs) > 1 and None not in fracs:
+            mat[i, : len(fracs)] = fracs
+    return mat + 1
+
+
+def evaluate(mat: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    For each market (row) of decimal odds:
+    - book: sum of implied probabilities, an arb when < 1
+    - margin: guaranteed return on total stake, 1/book - 1
+    - stakes: fraction of the total stake to put on each outcome so the
+      payout is the same whichever wins
+    """
+    implied = 1.0 / mat
+    with np.errstate(invalid="ignore", divide="ignore"):
+        book = np.nansum(implied, axis=1)
+        book[np.isnan(mat).all(axis=1)] = np.nan
+        margin = 1.0 / book - 1.0
+        stakes = implied / book[:, None]
+    return book, margin, stakes
+
+
+class ArbitrageEngine(object):
+    def __init__(
+        self,
+        pages: List[dict] = config["arbPages"],
+        host_concurrency: int = config["arbHostConcurrency"],
+        fetch: Callable[[str], str] = fetch_page,
+        interval: float = config["arbScanIntervalSeconds"],
+        path: str = config["arbScanFile"],
+    ):
+        """
+        pages: dicts with sport, market and url keys
+        """
+        self.pages = pages
+        self.host_concurrency = host_concurrency
+        self.fetch = fetch
+        self.interval = interval
+        self.path = path
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+        self._host_locks: Dict[str, Semaphore] = defaultdict(
+            lambda: Semaphore(self.host_concurrency)
+        )
+        self._lock = Lock()
+        # market key -> odds strings at the last scan
+        self.history: Dict[str, Tuple[str, ...]] = {}
+        # market key -> evaluated market at the last scan
+        self.results: Dict[str, dict] = {}
+        self.last_scan: Optional[datetime.datetime] = None
+
+    def _fetch_limited(self, url: str) -> Optional[str]:
+        with self._lock:
+            host_lock = self._host_locks[urlparse(url).netloc]
+        with host_lock:
+            try:
+                return self.fetch(url)
+            except Exception as e:
+                log.error("Failed to fetch %s: %s", url, e)
+                return None
+
+    def fetch_all(self) -> List[Optional[str]]:
+        if not self.pages:
+            return []
+        with ThreadPoolExecutor(max_workers=len(self.pages)) as pool:
+            return list(pool.map(self._fetch_limited, [p["url"] for p in self.pages]))
+
+    def scan(self) -> List[dict]:
+        """
+        Fetch every page and return the arbitrage opportunities found,
+        best margin first
+        """
+        rows = []
+        seen = set()
+        for page, html in zip(self.pages, self.fetch_all()):
+            if html is None:
+                # keep the markets of a page we couldn't fetch as they were
+                prefix = f"{page['sport']}/{page['market']}/"
+                seen.update(k for k in self.results if k.startswith(prefix))
+                continue
+            rows.extend(parse_markets(html, page["sport"], page["market"]))
+
+        changed = []
+        for row in rows:
+            seen.add(row["key"])
+            if self.history.get(row["key"]) != row["odds"]:
+                changed.append(row)
+            else:
+                # odds the same, only the in play flag can have moved
+                self.results[row["key"]]["inPlay"] = row["inPlay"]
+
+        if changed:
+            book, margin, stakes = evaluate(odds_matrix([r["odds"] for r in changed]))
+            for i, row in enumerate(changed):
+                n = len(row["odds"])
+                self.history[row["key"]] = row["odds"]
+                self.results[row["key"]] = {
+                    **row,
+                    "book": float(book[i]),
+                    "margin": float(margin[i]),
+                    "stakes": [float(s) for s in stakes[i, :n]],
+                }
+        log.debug("Re-evaluated %d of %d markets", len(changed), len(rows))
+
+        # drop markets no longer listed
+        for key in list(self.results):
+            if key not in seen:
+                del self.results[key]
+                self.history.pop(key, None)
+        self.last_scan = datetime.datetime.now(datetime.timezone.utc)
+        return self.opportunities()
+
+    def opportunities(self, include_in_play: bool = False) -> List[dict]:
+        opps = [
+            r
+            for r in self.results.values()
+            if r["book"] < 1 and (include_in_play or not r["inPlay"])
+        ]
+        return sorted(opps, key=lambda r: r["margin"], reverse=True)
+
+    def write(self) -> None:
+        """
+        Every evaluated arb of the last scan, in play ones included and
+        flagged, for the web tier to filter
+        """
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "scannedAt": self.last_scan.timestamp() if self.last_scan else None,
+                    "markets": len(self.results),
+                    "opportunities": self.opportunities(include_in_play=True),
+                },
+                f,
+            )
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.scan()
+                self.write()
+            except Exception:
+                log.exception("Arbitrage scan failed")
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="arb-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+
+arb_engine = ArbitrageEngine()
@@ -0,0 +1,118 @@
+"""
+Background scanner of the latest tennis arbitrage opportunities.
+
+One scanner runs, in the trading engine process (botsorted.trading.run),
+and writes each snapshot atomically to tennisScanFile. The /tennis
+handler only reads that file so it never waits on oddschecker, and adding
+web workers doesn't add scanners. tennisScanInWeb runs it in the web app
+instead, for a single local worker.
+"""
+from threading import Event, Thread
+from typing import Callable, List, Optional
+import datetime
+import json
+import os
+import time
+
+from ..config import config
+from ..logger import get_logger
+from .scripts import fetch_tennis_page, parse_tennis_opportunities
+
+log = get_logger(__name__)
+
+
+class ScanSnapshot(object):
+    def __init__(
+        self,
+        opportunities: List[dict],
+        scannedAt: Optional[datetime.datetime] = None,
+        error: Optional[str] = None,
+    ):
+        self.opportunities = opportunities
+        self.scannedAt = scannedAt
+        self.error = error
+
+
+class TennisScanner(object):
+    def __init__(
+        self,
+        interval: float = config["tennisScanIntervalSeconds"],
+        fetch: Callable[[], str] = fetch_tennis_page,
+        path: str = config["tennisScanFile"],
+    ):
+        self.interval = interval
+        self.fetch = fetch
+        self.path = path
+        self._snapshot = ScanSnapshot([])
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    @property
+    def snapshot(self) -> ScanSnapshot:
+        return self._snapshot
+
+    def scan(self) -> ScanSnapshot:
+        start = time.time()
+        try:
+            opps = parse_tennis_opportunities(self.fetch())
+        except Exception as e:
+            # keep serving the last good results, just flag the failure
+            log.error("Tennis scan failed: %s", e)
+            snap = ScanSnapshot(
+                self._snapshot.opportunities, self._snapshot.scannedAt, str(e)
+            )
+        else:
+            snap = ScanSnapshot(opps, datetime.datetime.now(datetime.timezone.utc))
+            log.debug(
+                "Tennis scan found %d opportunities in %.2fs",
+                len(opps),
+                time.time() - start,
+            )
+        # a single assignment so readers always see a whole snapshot
+        self._snapshot = snap
+        try:
+            self.write(snap)
+        except OSError as e:
+            log.error("Writing the tennis scan failed: %s", e)
+        return snap
+
+    def write(self, snap: ScanSnapshot) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(
+                {
+                    "opportunities": snap.opportunities,
+                    "scannedAt": snap.scannedAt.timestamp() if snap.scannedAt else None,
+                    "error": snap.error,
+                },
+                f,
+            )
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.scan()
+            self._stop.wait(self.interval)
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="tennis-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def join(self):
+        """
+        Block until the scanner is stopped, straight away if it isn't running
+        """
+        if self._thread is not None:
+            self._thread.join()
+
+
+tennis_scanner = TennisScanner()
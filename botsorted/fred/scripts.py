@@ -1,14 +1,24 @@
 import bs4
+from functools import lru_cache
 from typing import (
-    List
+    List,
+    Optional
 )
 import requests
 import math
+import os
 
-tennis_url = r'https://www.oddschecker.com/tennis'
+tennis_url = os.environ.get('ODDSCHECKER_TENNIS_URL', r'https://www.oddschecker.com/tennis')
 headers = headers = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_11_5) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/50.0.2661.102 Safari/537.36'}
 
 
+# only the match rows are built into the tree, the rest of the page is skipped
+match_rows = bs4.SoupStrainer('tr', {'class': 'match-on'})
+
+
+def parse_page(html: str) -> bs4.BeautifulSoup:
+    return bs4.BeautifulSoup(html, 'lxml', parse_only=match_rows)
+
 def _get_matches(page: bs4.BeautifulSoup):
     return page.find_all('tr',{'class':'match-on'})
 
@@ -16,9 +26,28 @@ def _get_players(match: bs4.element.Tag) -> List[str]:
     ps = match.find_all('p',{'class':'fixtures-bet-name'})
     return [p.text for p in ps]
 
+@lru_cache(maxsize=1024)
+def parse_odds(odds: str) -> Optional[float]:
+    """
+    Fractional odds string (e.g. "5/2", "EVS") to its decimal
+    fraction (2.5, 1.0). None if it can't be read
+    """
+    odds = odds.strip().lower()
+    if odds in ('evs', 'evens'):
+        return 1.0
+    num, _, den = odds.partition('/')
+    try:
+        num = float(num)
+        den = float(den) if den else 1.0
+    except ValueError:
+        return None
+    if den <= 0 or num < 0:
+        return None
+    return num / den
+
 def _get_odds(match: bs4.element.Tag, as_str=False) -> List[float]:
     odds = [t.text for t in match.find_all('td',{'class':'basket-add'})]
-    return [eval(o) if not as_str else o for o in odds]
+    return [parse_odds(o) if not as_str else o for o in odds]
 
 def _is_arbitrage(odds: List[float]) -> bool:
     if not len(odds) > 1:
@@ -31,17 +60,23 @@ def _is_in_play(match):
 def _get_time(match: bs4.element.Tag, as_str=False):
     return match.find('td',{'class':'time'}).text
 
-def find_tennis_opportunities():
-    tennis_html = requests.get(tennis_url,headers=headers).text
-    page = bs4.BeautifulSoup(tennis_html, 'html.parser')
+def fetch_tennis_page() -> str:
+    resp = requests.get(tennis_url, headers=headers, timeout=20)
+    resp.raise_for_status()
+    return resp.text
+
+def parse_tennis_opportunities(tennis_html: str):
+    page = parse_page(tennis_html)
     matches = _get_matches(page)
     opps = []
     for match in matches:
-        odds = _get_odds(match)
+        str_odds = _get_odds(match, True)
+        odds = [parse_odds(o) for o in str_odds]
+        if None in odds:
+            continue
         if _is_arbitrage(odds) and not _is_in_play(match):
             # only take not in play matches with an arb
             names = _get_players(match)
-            str_odds = _get_odds(match, True)
             result = math.prod(odds)
             opps.append({
                 'Day':match['data-day'],
@@ -53,3 +88,6 @@ def find_tennis_opportunities():
                 'Arb Indicator':round(result,2)
             })
     return opps
+
+def find_tennis_opportunities():
+    return parse_tennis_opportunities(fetch_tennis_page())
@@ -0,0 +1,4 @@
+"""
+Load testing harness: botsorted.app against local fakes of Binance and
+oddschecker, see botsorted.loadtest.run
+"""
@@ -0,0 +1,193 @@
+"""
+Local stand ins for Binance futures and oddschecker.
+
+Both serve recorded responses when a recording exists and otherwise
+generate plausible ones, so the app can be loaded without touching the
+real services. Recordings are plain files in a directory:
+
+    fapi_v1_klines.json    body for GET /fapi/v1/klines (any params)
+    tennis.html            page for the oddschecker tennis url
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+import json
+import os
+import time
+import zlib
+
+import numpy as np
+
+from ..config import config
+
+
+def recording_name(path: str) -> str:
+    return path.strip("/").replace("/", "_")
+
+
+def synthetic_klines(symbol: str, interval: str, limit: int) -> list:
+    """
+    Random walk candles for symbol, the same on every call, with the last
+    one open at the current time like the real endpoint
+    """
+    period = config["validIntervals"][interval] * 1000
+    now = int(time.time() * 1000)
+    open_times = (now // period - np.arange(limit)[::-1]) * period
+    rng = np.random.RandomState(zlib.crc32(symbol.encode()))
+    closes = 20000 * np.exp(np.cumsum(rng.randn(limit) * 0.02))
+    opens = np.r_[closes[0], closes[:-1]]
+    return [
+        [
+            int(t),
+            f"{o:.2f}",
+            f"{max(o, c) * 1.005:.2f}",
+            f"{min(o, c) * 0.995:.2f}",
+            f"{c:.2f}",
+            "1000.0",
+            int(t + period - 1),
+            "20000000.0",
+            1000,
+            "500.0",
+            "10000000.0",
+            "0",
+        ]
+        for t, o, c in zip(open_times, opens, closes)
+    ]
+
+
+def synthetic_tennis_page(matches: int = 40) -> str:
+    rng = np.random.RandomState(0)
+    rows = []
+    for i in range(matches):
+        a, b = rng.randint(1, 12, size=2)
+        rows.append(
+            f'<tr class="match-on" data-day="Today">'
+            f'<td class="time">{10 + i % 12}:00</td>'
+            f'<td><p class="fixtures-bet-name">Player {2 * i}</p>'
+            f'<p class="fixtures-bet-name">Player {2 * i + 1}</p></td>'
+            f'<td class="basket-add">{a}/4</td><td class="basket-add">{b}/4</td>'
+            f"</tr>"
+        )
+    return f"<html><body><table>{''.join(rows)}</table></body></html>"
+
+
+class _FakeServer(object):
+    def __init__(self, recordings: Optional[str] = None, latency: float = 0.0):
+        self.recordings = recordings
+        self.latency = latency
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def recorded(self, name: str) -> Optional[bytes]:
+        if self.recordings is None:
+            return None
+        path = os.path.join(self.recordings, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def respond(self, method: str, path: str, params: dict):
+        """
+        (status, content type, body) for a request
+        """
+        raise NotImplementedError
+
+    def start(self, port: int = 0) -> str:
+        """
+        Serve on localhost in a background thread, returns the base url
+        """
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self, method):
+                url = urlparse(self.path)
+                params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+                if fake.latency:
+                    time.sleep(fake.latency)
+                status, ctype, body = fake.respond(method, url.path, params)
+                self.send_response(status)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("X-MBX-USED-WEIGHT-1M", "0")
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def do_DELETE(self):
+                self._handle("DELETE")
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self._server.daemon_threads = True
+        Thread(target=self._server.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+class FakeBinance(_FakeServer):
+    def respond(self, method, path, params):
+        body = self.recorded(f"{recording_name(path)}.json")
+        if body is not None:
+            return 200, "application/json", body
+        if path == "/fapi/v1/klines":
+            data = synthetic_klines(
+                params.get("symbol", "BTCUSDT"),
+                params.get("interval", "1d"),
+                min(int(params.get("limit", 500)), 1500),
+            )
+        elif path == "/fapi/v1/time":
+            data = {"serverTime": int(time.time() * 1000)}
+        elif path == "/fapi/v1/exchangeInfo":
+            data = {
+                "symbols": [
+                    {
+                        "symbol": s,
+                        "status": "TRADING",
+                        "contractType": "PERPETUAL",
+                        "quoteAsset": "USDT",
+                        "quantityPrecision": 3,
+                    }
+                    for s in ("BTCUSDT", "ETHUSDT", "LTCUSDT")
+                ]
+            }
+        elif path == "/fapi/v1/depth":
+            data = {
+                "lastUpdateId": 1,
+                "bids": [["19999.0", "5.0"]],
+                "asks": [["20001.0", "5.0"]],
+            }
+        elif path == "/fapi/v1/premiumIndex":
+            data = {"symbol": params.get("symbol"), "markPrice": "20000.0"}
+        elif path == "/fapi/v1/account":
+            # flat, so the trader never has a position to close
+            data = {"totalMarginBalance": "10000.0", "positions": []}
+        elif path == "/fapi/v1/balance":
+            data = [{"asset": "USDT", "balance": "10000.0"}]
+        elif path == "/fapi/v1/leverage":
+            data = {"symbol": params.get("symbol"), "leverage": params.get("leverage")}
+        elif path == "/fapi/v1/order":
+            data = {"orderId": 1, "status": "FILLED"}
+        else:
+            return 404, "application/json", b'{"code": -1, "msg": "not faked"}'
+        return 200, "application/json", json.dumps(data).encode()
+
+
+class FakeOddschecker(_FakeServer):
+    def respond(self, method, path, params):
+        sport = path.strip("/") or "tennis"
+        body = self.recorded(f"{sport}.html")
+        if body is None:
+            body = synthetic_tennis_page().encode()
+        return 200, "text/html", body
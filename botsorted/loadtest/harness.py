@@ -0,0 +1,356 @@
+"""
+Starts the app against the fakes, drives load at its routes and measures
+what that does to the trading loop.
+
+The app runs as it's deployed: uvicorn for the web tier and the engine
+(with the odds scanners) as its own process, botsorted.trading.run, so
+load reaches the loop through the CPU and exchange they share rather than
+the GIL. Its health is measured from the heartbeats it writes to its
+heartbeat file every sleepInterval: drift is how much later than
+sleepInterval each heartbeat lands.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import requests
+
+from ..config import config
+from ..ml.dr import DirectReinforcementModel
+from .fakes import FakeBinance, FakeOddschecker
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HEARTBEAT_SECONDS = 1
+
+
+class LoadTestException(Exception):
+    pass
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def write_models(workdir: str, count: int = 3, M: int = 15) -> List[dict]:
+    """
+    Random DR models to serve, as chart specs like config["extraCharts"]
+    """
+    rng = np.random.RandomState(0)
+    specs = []
+    for i in range(count):
+        path = os.path.join(workdir, f"model-{i}.json")
+        mod = DirectReinforcementModel(
+            theta=rng.randn(M + 2) * 0.3, mean=0.0, std=400.0, M=M, commission=0.001
+        )
+        mod.save_model(path)
+        specs.append(
+            {"modelName": f"Load{i}", "modelVersion": "1.0", "modelLocation": path}
+        )
+    return specs
+
+
+def percentiles(values: List[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "p99": None, "max": None, "mean": None}
+    arr = np.asarray(values)
+    p50, p95, p99 = np.percentile(arr, [50, 95, 99])
+    return {
+        "p50": round(float(p50), 4),
+        "p95": round(float(p95), 4),
+        "p99": round(float(p99), 4),
+        "max": round(float(arr.max()), 4),
+        "mean": round(float(arr.mean()), 4),
+    }
+
+
+PAGE_TEMPLATES = {
+    "chart_page.html": "<html><body>{{ chartHtml | safe }}"
+    "{% for c in extraCharts %}{{ c.html | safe }}{% endfor %}</body></html>",
+    "tennis_page.html": "<html><body><p>{{ currentDate }}</p>{{ results | safe }}</body></html>",
+    "splash.html": "<html><body>{{ modelName }} v{{ modelVersion }}</body></html>",
+}
+
+
+def write_templates(workdir: str) -> str:
+    """
+    Bare page templates for when there's no frontend build, so the page
+    routes still render their content. Returns the directory to use as
+    buildDir
+    """
+    directory = os.path.join(workdir, "build")
+    os.makedirs(directory, exist_ok=True)
+    for name, body in PAGE_TEMPLATES.items():
+        with open(os.path.join(directory, name), "w") as f:
+            f.write(body)
+    return directory
+
+
+class AppProcess(object):
+    """
+    botsorted.app under uvicorn and the trading engine in its own process,
+    with every external url pointed at the fakes
+    """
+
+    def __init__(self, workdir: str, binance_url: str, odds_url: str, port: int = None):
+        self.workdir = workdir
+        self.port = port or free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.state_file = os.path.join(workdir, "engine_state.json")
+        self.heartbeat_file = os.path.join(workdir, "engine_heartbeat.json")
+        models = write_models(workdir)
+        build = os.path.join(REPO_ROOT, config["buildDir"])
+        if not os.path.isdir(build):
+            build = write_templates(workdir)
+        overrides = {
+            "runTrader": True,
+            "runTraderInWeb": False,
+            "tennisScanInWeb": False,
+            "buildDir": build,
+            "execute_strat": False,
+            "useOrderBook": False,
+            "warmRestart": False,
+            "interval": "1m",
+            "sleepInterval": HEARTBEAT_SECONDS,
+            "engineStateFile": self.state_file,
+            "engineHeartbeatFile": self.heartbeat_file,
+            "tennisScanFile": os.path.join(workdir, "tennis_scan.json"),
+            "arbScanFile": os.path.join(workdir, "arb_scan.json"),
+            "marketScanFile": os.path.join(workdir, "market_scan.json"),
+            "logFile": os.path.join(workdir, "botsorted.log"),
+            "modelName": models[0]["modelName"],
+            "modelVersion": models[0]["modelVersion"],
+            "modelLocation": models[0]["modelLocation"],
+            "extraCharts": models[1:],
+            "arbPages": [
+                {"sport": "tennis", "market": "match-winner", "url": f"{odds_url}/tennis"}
+            ],
+        }
+        self.env = {
+            **os.environ,
+            "DEPLOY_ENV": "LOCAL",
+            "BINANCE_API_KEY": "loadtest",
+            "BINANCE_API_SECRET": "loadtest",
+            "BINANCE_TESTNET_API_KEY": "loadtest",
+            "BINANCE_TESTNET_API_SECRET": "loadtest",
+            "BINANCE_TESTNET_URL": binance_url,
+            "ODDSCHECKER_TENNIS_URL": f"{odds_url}/tennis",
+            "HEROKU_POSTGRESQL_COBALT_URL": f"sqlite:///{os.path.join(workdir, 'loadtest.db')}",
+            "BOTSORTED_CONFIG": json.dumps(overrides),
+        }
+        self._proc: Optional[subprocess.Popen] = None
+        self._engine: Optional[subprocess.Popen] = None
+
+    def start(self, timeout: float = 60) -> None:
+        self._engine = subprocess.Popen(
+            [sys.executable, "-m", "botsorted.trading.run"],
+            cwd=REPO_ROOT,
+            env=self.env,
+        )
+        self._proc = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "botsorted.app:app",
+                "--port",
+                str(self.port),
+                "--workers",
+                "1",
+                "--log-level",
+                "warning",
+            ],
+            cwd=REPO_ROOT,
+            env=self.env,
+        )
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self._proc.poll() is not None:
+                self.stop()
+                raise LoadTestException(f"app exited with {self._proc.returncode}")
+            if self._engine.poll() is not None:
+                self.stop()
+                raise LoadTestException(
+                    f"engine exited with {self._engine.returncode}"
+                )
+            try:
+                if requests.get(f"{self.url}/ping", timeout=1).ok:
+                    return
+            except requests.RequestException:
+                pass
+            time.sleep(0.5)
+        self.stop()
+        raise LoadTestException(f"app did not come up within {timeout}s")
+
+    def stop(self) -> None:
+        for proc in (self._proc, self._engine):
+            if proc is not None and proc.poll() is None:
+                proc.terminate()
+                try:
+                    proc.wait(10)
+                except subprocess.TimeoutExpired:
+                    proc.kill()
+
+
+class HeartbeatMonitor(object):
+    def __init__(self, heartbeat_file: str, expected: float = HEARTBEAT_SECONDS):
+        self.heartbeat_file = heartbeat_file
+        self.expected = expected
+        self.beats: List[float] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self):
+        last = None
+        while not self._stop.wait(0.05):
+            try:
+                with open(self.heartbeat_file) as f:
+                    beat = json.load(f).get("heartbeatAt")
+            except (OSError, ValueError):
+                continue  # not written yet
+            if beat is not None and beat != last:
+                self.beats.append(beat)
+                last = beat
+
+    def start(self):
+        self.beats = []
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self) -> dict:
+        self._stop.set()
+        self._thread.join()
+        drift = (np.diff(self.beats) - self.expected).tolist() if len(self.beats) > 1 else []
+        return {"heartbeats": len(self.beats), **percentiles(drift)}
+
+
+def drive(url: str, concurrency: int, duration: float, timeout: float = 60) -> dict:
+    """
+    `concurrency` clients requesting url back to back for `duration`
+    seconds. Latencies are in seconds
+    """
+    latencies: List[float] = []
+    errors = []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def client():
+        with requests.Session() as sess:
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    ok = sess.get(url, timeout=timeout).ok
+                except requests.RequestException:
+                    ok = False
+                elapsed = time.perf_counter() - start
+                with lock:
+                    (latencies if ok else errors).append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client)
+    wall = time.perf_counter() - start
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": round(len(latencies) / wall, 2),
+        "latency": percentiles(latencies),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return (
+            subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=REPO_ROOT)
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(
+    routes: List[str],
+    concurrency: List[int],
+    duration: float,
+    workdir: str,
+    recordings: Optional[str] = None,
+    exchange_latency: float = 0.05,
+) -> dict:
+    """
+    A baseline with no load, then every route at every concurrency level.
+    Returns the results, see save_results
+    """
+    os.makedirs(workdir, exist_ok=True)
+    binance = FakeBinance(recordings, exchange_latency)
+    odds = FakeOddschecker(recordings, exchange_latency)
+    app = AppProcess(workdir, binance.start(), odds.start())
+    monitor = HeartbeatMonitor(app.heartbeat_file)
+    phases = []
+    try:
+        app.start()
+        monitor.start()
+        time.sleep(duration)
+        phases.append({"route": None, "concurrency": 0, "drift": monitor.stop()})
+        for route in routes:
+            for level in concurrency:
+                monitor.start()
+                result = drive(f"{app.url}{route}", level, duration)
+                phases.append(
+                    {"route": route, "concurrency": level, **result, "drift": monitor.stop()}
+                )
+    finally:
+        app.stop()
+        binance.stop()
+        odds.stop()
+    return {
+        "version": config["version"],
+        "commit": git_commit(),
+        "ranAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "durationSeconds": duration,
+        "exchangeLatencySeconds": exchange_latency,
+        "recordings": recordings,
+        "phases": phases,
+    }
+
+
+def save_results(results: dict, directory: str = config["loadTestResultsDir"]) -> str:
+    os.makedirs(directory, exist_ok=True)
+    stamp = results["ranAt"].replace(":", "").split(".")[0]
+    path = os.path.join(directory, f"{results['version']}-{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def compare(old: dict, new: dict) -> List[Dict]:
+    """
+    Per phase change in p95 latency, throughput and p95 drift between two
+    saved results
+    """
+    key = lambda p: (p["route"], p["concurrency"])
+    before = {key(p): p for p in old["phases"]}
+    rows = []
+    for phase in new["phases"]:
+        prev = before.get(key(phase))
+        if prev is None:
+            continue
+        row = {"route": phase["route"], "concurrency": phase["concurrency"]}
+        if phase["route"] is not None:
+            row["p95"] = (prev["latency"]["p95"], phase["latency"]["p95"])
+            row["throughput"] = (prev["throughput"], phase["throughput"])
+        row["driftP95"] = (prev["drift"]["p95"], phase["drift"]["p95"])
+        rows.append(row)
+    return rows
@@ -0,0 +1,125 @@
+"""
+Micro-benchmark of the logging on the trading thread: the log calls one
+futures_strategy iteration makes (4 info, 6 debug at info level), timed
+on the calling thread.
+
+    python -m botsorted.loadtest.logbench --iterations 5000
+
+"sync" is the logging botsorted had before botsorted.logger, handlers
+called on the logging thread with f-string messages built whether or not
+the record is kept. "queue" is botsorted.logger with %-style args. stdout
+goes to /dev/null and files to a temporary directory, so the numbers are
+the logging's own cost, not the terminal's.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+# the benchmark itself never talks to an exchange
+os.environ.setdefault("DEPLOY_ENV", "LOCAL")
+
+
+def sync_logger(logdir: str) -> logging.Logger:
+    logger = logging.getLogger("logbench.sync")
+    logger.propagate = False
+    logger.setLevel(logging.INFO)
+    formatter = logging.Formatter(
+        "[%(asctime)s][%(name)s.%(funcName)s:%(lineno)d][%(levelname)s] %(message)s",
+        datefmt="%Y-%m-%dT%H:%M:%S",
+    )
+    for h in (
+        RotatingFileHandler(
+            os.path.join(logdir, "sync.log"), maxBytes=500000, backupCount=10
+        ),
+        logging.StreamHandler(sys.stdout),
+    ):
+        h.setFormatter(formatter)
+        logger.addHandler(h)
+    return logger
+
+
+def strategy_sync(log: logging.Logger, Ft: float, last_close: float) -> None:
+    log.debug(f"got {499} candles")
+    log.debug(f"{last_close=}")
+    log.info(
+        f"last_close in iso: {datetime.datetime.fromtimestamp(last_close).isoformat()}"
+    )
+    next_poll_time = last_close + 86400
+    log.debug(f"{next_poll_time=}")
+    log.info(
+        f"next_poll_time in iso: {datetime.datetime.fromtimestamp(next_poll_time).isoformat()}"
+    )
+    log.debug(f"Waiting next poll time at {datetime.datetime.fromtimestamp(next_poll_time+10)}")
+    log.debug(f"Last checked: {datetime.datetime.now().isoformat()}")
+    log.debug(f"Checking for signal")
+    log.info(f"{Ft=}")
+    log.info(f"signal={'buy' if Ft > 0 else 'sell'}")
+
+
+def strategy_queue(log: logging.Logger, Ft: float, last_close: float) -> None:
+    log.debug("got %d candles", 499)
+    log.debug("last_close=%s", last_close)
+    log.info(
+        "last_close in iso: %s", datetime.datetime.fromtimestamp(last_close).isoformat()
+    )
+    next_poll_time = last_close + 86400
+    log.debug("next_poll_time=%s", next_poll_time)
+    log.info(
+        "next_poll_time in iso: %s",
+        datetime.datetime.fromtimestamp(next_poll_time).isoformat(),
+    )
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            "Waiting next poll time at %s",
+            datetime.datetime.fromtimestamp(next_poll_time + 10),
+        )
+        log.debug("Last checked: %s", datetime.datetime.now().isoformat())
+    log.debug("Checking for signal")
+    log.info("Ft=%s", Ft)
+    log.info("signal=%s", "buy" if Ft > 0 else "sell")
+
+
+def bench(strategy, log: logging.Logger, iterations: int) -> float:
+    """
+    mean microseconds per strategy call
+    """
+    last_close = time.time()
+    start = time.perf_counter()
+    for i in range(iterations):
+        strategy(log, 0.5 - (i % 2), last_close)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    logdir = tempfile.mkdtemp(prefix="botsorted-logbench-")
+    out = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    os.environ["BOTSORTED_CONFIG"] = json.dumps(
+        {"logFile": os.path.join(logdir, "queue.log"), "logLevel": "info"}
+    )
+    # imported once stdout and the config are redirected, as the listener
+    # captures both when it starts
+    from ..logger import get_logger
+
+    results = {
+        "sync": bench(strategy_sync, sync_logger(logdir), args.iterations),
+        "queue": bench(strategy_queue, get_logger("logbench.queue"), args.iterations),
+    }
+    sys.stdout = out
+    for name, us in results.items():
+        print(f"{name:<6} {us:8.1f} us per futures_strategy call")
+    print(f"speedup {results['sync'] / results['queue']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
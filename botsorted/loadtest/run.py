@@ -0,0 +1,64 @@
+"""
+Load test the app's routes and record latency, throughput and the trading
+loop's drift under load:
+
+    python -m botsorted.loadtest.run --routes /getPerformance /tennis \
+        --concurrency 1 4 16 --duration 20
+
+Results are saved under loadTestResultsDir, one file per run named by
+version and time. Pass --compare with an earlier file to see how the
+p95s moved, e.g. botsorted/loadtest/baseline.json, a run of the defaults
+above on one CPU without the frontend build.
+"""
+import argparse
+import json
+import os
+import tempfile
+
+# the harness process itself never talks to an exchange
+os.environ.setdefault("DEPLOY_ENV", "LOCAL")
+
+from .harness import run, save_results, compare  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--routes", nargs="+", default=["/getPerformance", "/tennis", "/api/performance"]
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=20, help="seconds per phase")
+    parser.add_argument(
+        "--exchange-latency", type=float, default=0.05, help="added by the fakes"
+    )
+    parser.add_argument("--recordings", help="directory of recorded responses")
+    parser.add_argument("--workdir", default=None)
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="botsorted-loadtest-")
+    results = run(
+        args.routes,
+        args.concurrency,
+        args.duration,
+        workdir,
+        recordings=args.recordings,
+        exchange_latency=args.exchange_latency,
+    )
+    print(f"Saved {save_results(results)}")
+    for phase in results["phases"]:
+        latency = phase.get("latency", {})
+        print(
+            f"{phase['route'] or 'idle':<20} c={phase['concurrency']:<4}"
+            f" rps={phase.get('throughput', '-')!s:<8}"
+            f" p50={latency.get('p50', '-')!s:<8} p95={latency.get('p95', '-')!s:<8}"
+            f" p99={latency.get('p99', '-')!s:<8} drift p95={phase['drift']['p95']}"
+        )
+    if args.compare:
+        with open(args.compare) as f:
+            for row in compare(json.load(f), results):
+                print(row)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,29 @@
+"""
+Logging for all of botsorted.
+
+Loggers only put records on an in-memory queue. A single listener thread
+takes them off, renders them as JSON lines and does the file and stdout
+I/O, so the trading thread and request handlers never block on it.
+
+Rotation isn't safe across processes, so each process (web worker,
+engine, render worker) logs to its own file with its pid in the name.
+On Heroku, where the filesystem doesn't outlive the dyno, logs only go
+to stdout for the platform to collect.
+
+Use %-style args rather than f-strings in log calls so nothing is
+formatted for records that are filtered out.
+"""
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
-import os, sys
-from .config import config
+import os
+import queue
+import sys
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Tuple
+
+from .config import config, DEPLOY_ENV
 
 levels = {
     "debug": logging.DEBUG,
@@ -12,25 +34,120 @@ levels = {
 }
 
 
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        out = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "func": record.funcName,
+            "line": record.lineno,
+            "thread": record.threadName,
+            "msg": record.getMessage(),
+        }
+        if record.exc_text:
+            out["exc"] = record.exc_text
+        return json.dumps(out, default=str)
+
+
+class LazyQueueHandler(QueueHandler):
+    """
+    Only merges the args into the message on the calling thread (so
+    later changes to them aren't logged) and leaves the JSON rendering to
+    the listener
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Lets through 1 in every `every` records at or below `level` from
+    each call site. Records above `level` always pass
+    """
+
+    def __init__(self, every: int, level: int = logging.DEBUG):
+        super().__init__()
+        self.every = every
+        self.level = level
+        self._counts: Dict[Tuple[str, int], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.level:
+            return True
+        site = (record.pathname, record.lineno)
+        n = self._counts.get(site, 0)
+        self._counts[site] = n + 1
+        return n % self.every == 0
+
+
+_log_queue = queue.Queue(-1)
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def process_log_file(path: str) -> str:
+    """
+    path with this process's pid before the extension,
+    logs/botsorted.log -> logs/botsorted.1234.log
+    """
+    root, ext = os.path.splitext(path)
+    return f"{root}.{os.getpid()}{ext}"
+
+
+def _start_listener(maxBytes: int, backupCount: int) -> None:
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            return
+        formatter = JsonFormatter()
+        handlers = [logging.StreamHandler(sys.stdout)]
+        if DEPLOY_ENV != "HEROKU":
+            handlers.append(
+                RotatingFileHandler(
+                    process_log_file(config["logFile"]),
+                    maxBytes=maxBytes,
+                    backupCount=backupCount,
+                )
+            )
+        for h in handlers:
+            h.setFormatter(formatter)
+        _listener = QueueListener(_log_queue, *handlers)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+        root = logging.getLogger()
+        for h in list(root.handlers):
+            root.removeHandler(h)
+        root.addHandler(LazyQueueHandler(_log_queue))
+        root.setLevel(levels[config["logLevel"]])
+
+
 def get_logger(
     name: str,
-    level: str = config["logLevel"],
+    level: str = None,
     maxBytes: int = 500000,
     backupCount: int = 10,
 ):
-    logging.basicConfig(
-        handlers=[
-            RotatingFileHandler(
-                f"logs/{name}.log", maxBytes=maxBytes, backupCount=backupCount
-            ),
-            logging.StreamHandler(sys.stdout),
-        ],
-        level=levels[level],
-        format="[%(asctime)s][%(name)s.%(funcName)s:%(lineno)d][%(levelname)s] %(message)s",
-        datefmt="%Y-%m-%dT%H:%M:%S",
-    )
+    """
+    Logger for a module. Its level is, in order of precedence, `level`,
+    config["logLevels"][name] or config["logLevel"], and debug records
+    are sampled if the module is in config["logDebugSampling"]
+    """
+    _start_listener(maxBytes, backupCount)
     logger = logging.getLogger(name)
+    level = level or config["logLevels"].get(name, config["logLevel"])
+    logger.setLevel(levels[level])
 
+    every = config["logDebugSampling"].get(name)
+    if every and not any(isinstance(f, SamplingFilter) for f in logger.filters):
+        logger.addFilter(SamplingFilter(every))
     return logger
 
 
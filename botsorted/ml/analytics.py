@@ -0,0 +1,245 @@
+"""
+Performance analytics of trading strategies.
+
+Everything works along the last axis, so a (strategies, T) array scores
+every strategy at once with one vectorised pass per metric, and a 1-D
+array gives scalars. Returns are per bar and summed (not compounded).
+
+botsorted's convention for returns is relative close to close returns,
+close_t / close_{t-1} - 1, so commission is a fraction of the trade and
+totals and drawdowns are fractions of the price. DR training is the
+exception: it optimises on normalised price differences, see ml.dr.
+
+Strategy returns hold the position Ft_{t-1} over return r_t and pay
+commission on every change of position, see strategy_returns. The
+charts, the engine stream and perf_stats trade sign(Ft_k), which batch_Ft
+computes from the closes up to close k, from close k to close k+1: that
+is Ft_{t-1} here with r_t = close_t / close_{t-1} - 1.
+
+    R = strategy_returns(Ft, rets, commission)
+    sharpe(R), max_drawdown(R), rolling_sharpe(R, 50)
+    metrics(Ft, rets, commission)  # all of them as a dict
+"""
+from typing import Dict, Union
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+METRICS = (
+    "sharpe",
+    "sortino",
+    "maxDrawdown",
+    "turnover",
+    "hitRate",
+    "commissionDrag",
+    "totalReturn",
+)
+
+Commission = Union[float, np.ndarray]
+
+
+class AnalyticsException(Exception):
+    pass
+
+
+def _divide(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    """
+    num / den, 0 where den is 0 (no variance, no trades)
+    """
+    num, den = np.broadcast_arrays(
+        np.asarray(num, dtype=np.float64), np.asarray(den, dtype=np.float64)
+    )
+    out = np.zeros(num.shape)
+    np.divide(num, den, out=out, where=den > 0)
+    return out[()]
+
+
+def _commission(commission: Commission) -> np.ndarray:
+    """
+    commission per strategy, (S,) or a scalar, shaped to broadcast over
+    a (S, T) array
+    """
+    commission = np.asarray(commission, dtype=np.float64)
+    return commission[..., None] if commission.ndim else commission
+
+
+def _rolling_sum(a: np.ndarray, window: int) -> np.ndarray:
+    if not 0 < window <= a.shape[-1]:
+        raise AnalyticsException(
+            f"window must be between 1 and {a.shape[-1]}, got {window}"
+        )
+    csum = np.cumsum(a, axis=-1)
+    out = csum[..., window - 1 :].copy()
+    out[..., 1:] -= csum[..., :-window]
+    return out
+
+
+def _windows(a: np.ndarray, window: int) -> np.ndarray:
+    """
+    read only (..., T - window + 1, window) view of a's sliding windows
+    """
+    if not 0 < window <= a.shape[-1]:
+        raise AnalyticsException(
+            f"window must be between 1 and {a.shape[-1]}, got {window}"
+        )
+    a = np.ascontiguousarray(a, dtype=np.float64)
+    shape = a.shape[:-1] + (a.shape[-1] - window + 1, window)
+    return as_strided(a, shape, a.strides + a.strides[-1:], writeable=False)
+
+
+# returns #####################################################################
+def strategy_returns(
+    Ft: np.ndarray, rets: np.ndarray, commission: Commission = 0.0
+) -> np.ndarray:
+    """
+    R_t = Ft_{t-1} * rets_t - commission * |Ft_t - Ft_{t-1}| for Ft and
+    rets of the same length T, giving T - 1 returns. commission can be
+    one per strategy for a (S, T) Ft
+    """
+    Ft = np.asarray(Ft, dtype=np.float64)
+    rets = np.asarray(rets, dtype=np.float64)
+    turn = np.abs(np.diff(Ft, axis=-1))
+    return Ft[..., :-1] * rets[..., 1:] - _commission(commission) * turn
+
+
+def cumulative_returns(R: np.ndarray) -> np.ndarray:
+    return np.cumsum(R, axis=-1)
+
+
+def drawdowns(R: np.ndarray) -> np.ndarray:
+    """
+    distance of the cumulative return below its running peak, the peak
+    starting at 0 so a strategy that only loses is in drawdown from bar 1
+    """
+    cum = cumulative_returns(R)
+    return np.maximum.accumulate(np.maximum(cum, 0), axis=-1) - cum
+
+
+# metrics #####################################################################
+def sharpe(R: np.ndarray, ddof: int = 0) -> np.ndarray:
+    """
+    mean over standard deviation of R, per bar (not annualised). ddof=0
+    is the Sharpe the DR model is trained to maximise
+    """
+    R = np.asarray(R, dtype=np.float64)
+    return _divide(R.mean(axis=-1), R.std(axis=-1, ddof=ddof))
+
+
+def sortino(R: np.ndarray) -> np.ndarray:
+    """
+    mean over downside deviation (root mean square of the losses) of R
+    """
+    R = np.asarray(R, dtype=np.float64)
+    downside = np.sqrt(np.mean(np.square(np.minimum(R, 0)), axis=-1))
+    return _divide(R.mean(axis=-1), downside)
+
+
+def max_drawdown(R: np.ndarray) -> np.ndarray:
+    return drawdowns(R).max(axis=-1)[()]
+
+
+def total_return(R: np.ndarray) -> np.ndarray:
+    return np.sum(R, axis=-1)[()]
+
+
+def hit_rate(R: np.ndarray) -> np.ndarray:
+    """
+    share of bars with a non zero return that made money
+    """
+    R = np.asarray(R)
+    return _divide((R > 0).sum(axis=-1), (R != 0).sum(axis=-1))
+
+
+def turnover(Ft: np.ndarray) -> np.ndarray:
+    """
+    mean absolute change in position per bar, 2 for a flip from long to
+    short
+    """
+    return np.abs(np.diff(Ft, axis=-1)).mean(axis=-1)[()]
+
+
+def commission_drag(Ft: np.ndarray, commission: Commission) -> np.ndarray:
+    """
+    total return given up to commission over the period
+    """
+    turn = np.abs(np.diff(np.asarray(Ft, dtype=np.float64), axis=-1))
+    return np.sum(_commission(commission) * turn, axis=-1)[()]
+
+
+def returns_metrics(R: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    the metrics that only need the returns, for when there are no
+    positions e.g. a simulated portfolio's value
+    """
+    return {
+        "sharpe": sharpe(R),
+        "sortino": sortino(R),
+        "maxDrawdown": max_drawdown(R),
+        "hitRate": hit_rate(R),
+        "totalReturn": total_return(R),
+    }
+
+
+def metrics(
+    Ft: np.ndarray, rets: np.ndarray, commission: Commission = 0.0
+) -> Dict[str, np.ndarray]:
+    """
+    every metric in METRICS of holding Ft over rets
+    """
+    R = strategy_returns(Ft, rets, commission)
+    return {
+        **returns_metrics(R),
+        "turnover": turnover(Ft),
+        "commissionDrag": commission_drag(Ft, commission),
+    }
+
+
+# rolling #####################################################################
+# value i of a rolling metric covers the `window` bars R[..., i : i + window]
+def rolling_mean(R: np.ndarray, window: int) -> np.ndarray:
+    return _rolling_sum(np.asarray(R, dtype=np.float64), window) / window
+
+
+def rolling_sharpe(R: np.ndarray, window: int) -> np.ndarray:
+    R = np.asarray(R, dtype=np.float64)
+    mean = rolling_mean(R, window)
+    var = np.maximum(rolling_mean(np.square(R), window) - mean ** 2, 0)
+    return _divide(mean, np.sqrt(var))
+
+
+def rolling_sortino(R: np.ndarray, window: int) -> np.ndarray:
+    R = np.asarray(R, dtype=np.float64)
+    downside = np.sqrt(rolling_mean(np.square(np.minimum(R, 0)), window))
+    return _divide(rolling_mean(R, window), downside)
+
+
+def rolling_max_drawdown(R: np.ndarray, window: int) -> np.ndarray:
+    """
+    max drawdown within each window, measured from the window's start.
+    Materialises (..., T - window + 1, window) so keep windows modest on
+    long (S, T) inputs
+    """
+    cum = np.cumsum(_windows(R, window), axis=-1)
+    peak = np.maximum.accumulate(np.maximum(cum, 0), axis=-1)
+    return (peak - cum).max(axis=-1)
+
+
+def rolling_hit_rate(R: np.ndarray, window: int) -> np.ndarray:
+    R = np.asarray(R)
+    return _divide(
+        _rolling_sum((R > 0).astype(np.float64), window),
+        _rolling_sum((R != 0).astype(np.float64), window),
+    )
+
+
+def rolling_turnover(Ft: np.ndarray, window: int) -> np.ndarray:
+    """
+    window counts position changes, so covers window + 1 values of Ft
+    """
+    return rolling_mean(np.abs(np.diff(Ft, axis=-1)), window)
+
+
+def rolling_commission_drag(
+    Ft: np.ndarray, commission: Commission, window: int
+) -> np.ndarray:
+    turn = np.abs(np.diff(np.asarray(Ft, dtype=np.float64), axis=-1))
+    return _rolling_sum(_commission(commission) * turn, window)
@@ -0,0 +1,127 @@
+"""
+Batched inference for several DirectReinforcementModels over the same
+price series.
+
+Models are grouped by lag length M. Within a group the autoregressive
+part of every model's Ft is one matrix product over the shared return
+windows, with each model's normalisation folded into its weights, and
+only the Ft_{t-1} feedback is stepped through time, for all models of
+the group at once.
+"""
+from collections import defaultdict
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .dr import DirectReinforcementModel
+from .features import feature_cache, FeatureKey
+
+
+def return_windows(rets: np.ndarray, M: int) -> np.ndarray:
+    """
+    (T-M, M) read only view where row i is rets[i : i+M]
+    """
+    T = len(rets)
+    if T <= M:
+        return np.empty((0, M))
+    stride = rets.strides[0]
+    return np.lib.stride_tricks.as_strided(
+        rets, shape=(T - M, M), strides=(stride, stride), writeable=False
+    )
+
+
+def batch_Ft_same_M(
+    rets: np.ndarray, thetas: np.ndarray, means: np.ndarray, stds: np.ndarray
+) -> np.ndarray:
+    """
+    Ft for K models sharing M over raw returns rets (length T), as
+    DirectReinforcementModel.calc_Ft(get_x(...), theta) gives per model.
+    thetas is (K, M+2), means and stds are (K,). Returns (K, T)
+    """
+    K, width = thetas.shape
+    M = width - 2
+    T = len(rets)
+    ar = thetas[:, 1 : M + 1]
+    # theta . (r - mean) / std = r . (theta / std) - mean / std * sum(theta)
+    weights = ar / stds[:, None]
+    bias = thetas[:, 0] - means / stds * ar.sum(axis=1)
+    # (T-M, K) autoregressive part of the activation for every t >= M
+    A = return_windows(rets, M) @ weights.T + bias
+    fb = thetas[:, -1]
+
+    Ft = np.zeros((T, K))
+    prev = np.zeros(K)
+    for i in range(len(A)):
+        prev = np.tanh(A[i] + fb * prev)
+        Ft[M + i] = prev
+    return Ft.T
+
+
+def batch_Ft_rows(
+    diffs: np.ndarray, theta: np.ndarray, mean: float, std: float
+) -> np.ndarray:
+    """
+    Ft of one model over every row of diffs, (series, T) price
+    differences of e.g. resampled paths or several symbols, as
+    calc_Ft(get_x(...)) gives for a single series
+    """
+    S, T = diffs.shape
+    M = len(theta) - 2
+    x = (diffs - mean) / std
+    # (S, T-M, M) windows x[t-M:t] for every t >= M
+    windows = np.lib.stride_tricks.as_strided(
+        x, shape=(S, T - M, M), strides=(x.strides[0], x.strides[1], x.strides[1])
+    )
+    A = windows @ theta[1:-1] + theta[0]
+    fb = theta[-1]
+    Ft = np.zeros((S, T))
+    prev = np.zeros(S)
+    for i in range(A.shape[1]):
+        prev = np.tanh(A[:, i] + fb * prev)
+        Ft[:, M + i] = prev
+    return Ft
+
+
+def group_by_M(models: Sequence[DirectReinforcementModel]) -> Dict[int, List[int]]:
+    groups = defaultdict(list)
+    for i, mod in enumerate(models):
+        groups[len(mod.theta) - 2].append(i)
+    return groups
+
+
+def batch_Ft(
+    models: Sequence[DirectReinforcementModel],
+    closes,
+    cache_key: Optional[FeatureKey] = None,
+) -> List[np.ndarray]:
+    """
+    Ft series of every model over closes, in the order of models.
+    Each is the same as calc_Ft(mod.get_x(closes), mod.theta)
+    """
+    if cache_key is not None:
+        rets = feature_cache.returns(cache_key, closes)
+    else:
+        rets = np.diff(np.asarray(closes, dtype=np.float64))
+    out: List[Optional[np.ndarray]] = [None] * len(models)
+    for M, idx in group_by_M(models).items():
+        thetas = np.stack([np.asarray(models[i].theta, dtype=np.float64) for i in idx])
+        means = np.array([models[i].mean for i in idx], dtype=np.float64)
+        stds = np.array([models[i].std for i in idx], dtype=np.float64)
+        Ft = batch_Ft_same_M(rets, thetas, means, stds)
+        for row, i in enumerate(idx):
+            out[i] = Ft[row]
+    return out
+
+
+def batch_signals(
+    models: Sequence[DirectReinforcementModel],
+    closes,
+    cache_key: Optional[FeatureKey] = None,
+) -> List[Tuple[str, float]]:
+    """
+    Latest (signal, Ft) of every model, as get_signal gives one at a time
+    """
+    return [
+        ("SELL" if Ft[-1] < 0 else "BUY", Ft[-1])
+        for Ft in batch_Ft(models, closes, cache_key)
+    ]
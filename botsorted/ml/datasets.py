@@ -0,0 +1,403 @@
+"""
+Ingestion of historical price data into named, reproducible datasets.
+
+Sources are CSV exports (e.g. coindesk history, anything with a date and
+close column) or Binance kline archives from data.binance.vision (.zip
+or the .csv inside). They are read, put on the interval's grid (times
+floored to it, duplicates dropped keeping the last source's bar), gaps
+filled or flagged, and written once as plain .npy columns:
+
+    <root>/<name>/<hash>/<column>.npy
+    <root>/<name>/<hash>/meta.json
+    <root>/<name>/latest              hash of the last version ingested
+
+The hash is of the column contents, so ingesting the same data again is
+a no-op and `name@hash` always refers to the same bars. Columns are
+memory mapped on load, which takes milliseconds whatever the size.
+
+    ingest("btc-1d", ["coindesk-btc.csv"], "1d")
+    mod.train_dataset("btc-1d")  # train_dataset_name becomes btc-1d@<hash>
+"""
+from typing import Dict, List, Optional, Sequence, Tuple
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+
+from ..config import config
+from ..logger import get_logger
+from ..trading.resample import bucket_starts, interval_ms
+
+log = get_logger(__name__)
+
+COLUMNS = {
+    "openTime": np.int64,
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "volume": np.float64,
+    "gap": np.bool_,  # no source had this bar
+}
+
+FILL_METHODS = ("ffill", "flag")
+
+# lower cased CSV headers understood for each column
+ALIASES = {
+    "openTime": ("opentime", "open_time", "date", "datetime", "timestamp", "time"),
+    "open": ("open", "24h open (usd)", "open price"),
+    "high": ("high", "24h high (usd)", "high price"),
+    "low": ("low", "24h low (usd)", "low price"),
+    "close": ("close", "closing price (usd)", "close price", "price"),
+    "volume": ("volume", "vol"),
+}
+
+HASH_CHARS = 16
+
+
+class DatasetException(Exception):
+    pass
+
+
+# sources #####################################################################
+def _to_ms(times: pd.Series) -> np.ndarray:
+    """
+    epoch ms from dates or from epoch seconds, ms or us
+    """
+    numeric = pd.to_numeric(times, errors="coerce")
+    if numeric.notna().all():
+        t = numeric.to_numpy(dtype=np.int64)
+        if t.max() < 1e11:
+            return t * 1000
+        if t.max() >= 1e14:
+            return t // 1000
+        return t
+    dates = pd.to_datetime(times, utc=True)
+    return dates.values.astype("datetime64[ms]").astype(np.int64)
+
+
+def read_csv_export(path: str) -> pd.DataFrame:
+    """
+    openTime plus whichever of open/high/low/close/volume the file has,
+    matched on the headers in ALIASES. Needs a time and a close column
+    """
+    raw = pd.read_csv(path)
+    headers = {c.strip().lower(): c for c in raw.columns}
+    cols = {}
+    for col, aliases in ALIASES.items():
+        match = next((headers[a] for a in aliases if a in headers), None)
+        if match is not None:
+            cols[col] = raw[match]
+    missing = {"openTime", "close"} - set(cols)
+    if missing:
+        raise DatasetException(f"{path} has no column for {sorted(missing)}")
+    frame = pd.DataFrame(
+        {c: pd.to_numeric(v, errors="coerce") for c, v in cols.items() if c != "openTime"}
+    )
+    frame.insert(0, "openTime", _to_ms(cols["openTime"]))
+    return frame.dropna(subset=["close"])
+
+
+def read_kline_archive(path: str) -> pd.DataFrame:
+    """
+    A Binance kline archive: rows of [openTime, open, high, low, close,
+    volume, closeTime, ...], with or without the header newer ones have
+    """
+    raw = pd.read_csv(path, header=None, usecols=range(6))
+    raw = raw.apply(pd.to_numeric, errors="coerce").dropna()
+    raw.columns = ["openTime", "open", "high", "low", "close", "volume"]
+    raw["openTime"] = _to_ms(raw["openTime"])
+    return raw
+
+
+def read_source(path: str) -> pd.DataFrame:
+    """
+    kline archive if the first value of the file is an epoch time or the
+    archive header, else a CSV export
+    """
+    first = pd.read_csv(path, header=None, nrows=1).iloc[0, 0]
+    if str(first).strip().lower() in ("open_time", "opentime"):
+        return read_kline_archive(path)
+    try:
+        float(first)
+    except ValueError:
+        return read_csv_export(path)
+    return read_kline_archive(path)
+
+
+# cleaning ####################################################################
+def clean(
+    frame: pd.DataFrame, interval: str, fill: str = "ffill"
+) -> Tuple[Dict[str, np.ndarray], dict]:
+    """
+    Bars of frame on a gapless grid of interval, as COLUMNS, plus a
+    report of what was fixed. Gaps are forward filled with flat, zero
+    volume bars at the last close (fill="ffill") or left NaN (fill="flag"),
+    flagged in the gap column either way
+    """
+    if fill not in FILL_METHODS:
+        raise DatasetException(f"fill must be one of {FILL_METHODS}, got {fill}")
+    if frame.empty:
+        raise DatasetException("No bars to ingest")
+    ms = interval_ms(interval)
+    times = frame["openTime"].to_numpy(dtype=np.int64)
+    aligned = bucket_starts(times, interval)
+    misaligned = int((aligned != times).sum())
+    order = np.argsort(aligned, kind="stable")
+    aligned = aligned[order]
+    # last of each run of equal times, i.e. the last source's bar
+    keep = np.r_[aligned[1:] != aligned[:-1], True]
+    rows = order[keep]
+    times = aligned[keep]
+
+    slot = (times - times[0]) // ms
+    n = int(slot[-1]) + 1
+    present = np.zeros(n, dtype=np.bool_)
+    present[slot] = True
+    cols = {"openTime": times[0] + np.arange(n, dtype=np.int64) * ms}
+    for col in ("open", "high", "low", "close", "volume"):
+        out = np.full(n, np.nan)
+        if col in frame:
+            out[slot] = frame[col].to_numpy(dtype=np.float64)[rows]
+        cols[col] = out
+    if fill == "ffill":
+        # index of the last present bar at or before each bar
+        last = np.maximum.accumulate(np.where(present, np.arange(n), 0))
+        close = cols["close"][last]
+        for col in ("open", "high", "low"):
+            cols[col] = np.where(present & ~np.isnan(cols[col]), cols[col], close)
+        cols["close"] = close
+        cols["volume"] = np.where(present, cols["volume"], 0.0)
+    cols["gap"] = ~present
+
+    gaps = np.flatnonzero(np.diff(slot) > 1)
+    report = {
+        "rows": n,
+        "duplicates": int(len(order) - len(rows)),
+        "misaligned": misaligned,
+        "gapBars": int(n - len(rows)),
+        "gaps": int(len(gaps)),
+        "longestGapBars": int((np.diff(slot) - 1).max()) if len(slot) > 1 else 0,
+    }
+    return cols, report
+
+
+def content_hash(cols: Dict[str, np.ndarray], interval: str) -> str:
+    sha = hashlib.sha256(interval.encode())
+    for col, dtype in COLUMNS.items():
+        sha.update(col.encode())
+        sha.update(np.ascontiguousarray(cols[col], dtype=dtype).tobytes())
+    return sha.hexdigest()
+
+
+# storage #####################################################################
+class Dataset(object):
+    def __init__(self, path: str, meta: dict):
+        self.path = path
+        self.meta = meta
+        self._cols: Dict[str, np.ndarray] = {}
+
+    @property
+    def name(self) -> str:
+        return self.meta["name"]
+
+    @property
+    def hash(self) -> str:
+        return self.meta["hash"]
+
+    @property
+    def ref(self) -> str:
+        """
+        name@hash, loads exactly this version
+        """
+        return f"{self.name}@{self.hash[:HASH_CHARS]}"
+
+    def __len__(self) -> int:
+        return self.meta["rows"]
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        if col not in COLUMNS:
+            raise KeyError(col)
+        if col not in self._cols:
+            self._cols[col] = np.load(
+                os.path.join(self.path, f"{col}.npy"), mmap_mode="r"
+            )
+        return self._cols[col]
+
+    def series(self, drop_gaps: bool = False) -> Tuple[pd.Series, pd.Series]:
+        """
+        (close, open time as ISO strings) as train takes them for
+        train_series and train_date_series, in a form save_model can
+        write. drop_gaps leaves out bars no source had, needed to train
+        on a dataset ingested with fill="flag"
+        """
+        keep = ~np.asarray(self["gap"]) if drop_gaps else slice(None)
+        # copies, training needs them in memory and pandas won't take a
+        # read only map
+        close = pd.Series(np.array(self["close"][keep]))
+        dates = pd.Series(
+            np.datetime_as_string(self["openTime"][keep].astype("datetime64[ms]"), "s")
+        )
+        return close, dates
+
+    def verify(self) -> bool:
+        cols = {c: self[c] for c in COLUMNS}
+        return content_hash(cols, self.meta["interval"]) == self.hash
+
+
+class DatasetStore(object):
+    def __init__(self, root: str = config["datasetDir"]):
+        self.root = root
+
+    def _name_dir(self, name: str) -> str:
+        return os.path.join(self.root, name)
+
+    def names(self) -> List[str]:
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(d for d in os.listdir(self.root) if not d.startswith("."))
+
+    def versions(self, name: str) -> List[dict]:
+        """
+        meta of every version of name, oldest first
+        """
+        path = self._name_dir(name)
+        if not os.path.isdir(path):
+            return []
+        metas = []
+        for version in os.listdir(path):
+            meta_path = os.path.join(path, version, "meta.json")
+            if not version.startswith(".") and os.path.exists(meta_path):
+                with open(meta_path) as f:
+                    metas.append(json.load(f))
+        return sorted(metas, key=lambda m: m["createdAt"])
+
+    def write(
+        self, name: str, cols: Dict[str, np.ndarray], interval: str, meta: dict
+    ) -> Dataset:
+        """
+        Write cols as a version of name and make it the latest. Written to
+        a hidden dir and renamed into place so a crash never leaves a
+        half written version
+        """
+        digest = content_hash(cols, interval)
+        final = os.path.join(self._name_dir(name), digest[:HASH_CHARS])
+        if not os.path.exists(final):
+            tmp = os.path.join(self._name_dir(name), f".{digest[:HASH_CHARS]}.tmp")
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+            os.makedirs(tmp)
+            for col, dtype in COLUMNS.items():
+                np.save(
+                    os.path.join(tmp, f"{col}.npy"), cols[col].astype(dtype, copy=False)
+                )
+            meta = {
+                **meta,
+                "name": name,
+                "interval": interval,
+                "hash": digest,
+                "rows": int(len(cols["openTime"])),
+                "start": int(cols["openTime"][0]),
+                "end": int(cols["openTime"][-1]),
+                "createdAt": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+            with open(os.path.join(tmp, "meta.json"), "w") as f:
+                json.dump(meta, f, indent=2)
+            os.rename(tmp, final)
+        else:
+            log.info("%s@%s already ingested", name, digest[:HASH_CHARS])
+        latest = os.path.join(self._name_dir(name), "latest")
+        with open(f"{latest}.tmp", "w") as f:
+            f.write(digest[:HASH_CHARS])
+        os.replace(f"{latest}.tmp", latest)
+        return self.load(f"{name}@{digest[:HASH_CHARS]}")
+
+    def load(self, ref: str, verify: bool = False) -> Dataset:
+        """
+        Dataset by name (its latest version) or name@hash. verify
+        re-hashes the columns, which reads them all
+        """
+        name, _, version = ref.partition("@")
+        if not version:
+            try:
+                with open(os.path.join(self._name_dir(name), "latest")) as f:
+                    version = f.read().strip()
+            except FileNotFoundError:
+                raise DatasetException(f"No dataset named {name} in {self.root}")
+        path = os.path.join(self._name_dir(name), version[:HASH_CHARS])
+        try:
+            with open(os.path.join(path, "meta.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise DatasetException(f"No version {version} of dataset {name}")
+        if not meta["hash"].startswith(version):
+            raise DatasetException(f"{ref} does not match stored hash {meta['hash']}")
+        dataset = Dataset(path, meta)
+        if verify and not dataset.verify():
+            raise DatasetException(f"Columns of {ref} don't match its hash")
+        return dataset
+
+
+def ingest(
+    name: str,
+    paths: Sequence[str],
+    interval: str,
+    fill: str = "ffill",
+    store: Optional[DatasetStore] = None,
+) -> Dataset:
+    """
+    Read every source in paths (later ones win where bars overlap),
+    clean them onto interval's grid and store the result as name
+    """
+    store = store or DatasetStore()
+    frame = pd.concat([read_source(p) for p in paths], ignore_index=True)
+    cols, report = clean(frame, interval, fill)
+    dataset = store.write(
+        name,
+        cols,
+        interval,
+        {
+            "sources": [os.path.basename(p) for p in paths],
+            "fill": fill,
+            "report": report,
+        },
+    )
+    log.info("Ingested %s: %s", dataset.ref, report)
+    return dataset
+
+
+def load_dataset(ref: str, verify: bool = False) -> Dataset:
+    return DatasetStore().load(ref, verify)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest or list training datasets")
+    sub = parser.add_subparsers(dest="command", required=True)
+    add = sub.add_parser("ingest", help="CSV exports or Binance kline archives")
+    add.add_argument("name")
+    add.add_argument("paths", nargs="+")
+    add.add_argument("--interval", default=config["interval"])
+    add.add_argument("--fill", choices=FILL_METHODS, default="ffill")
+    sub.add_parser("list")
+    args = parser.parse_args()
+
+    if args.command == "ingest":
+        dataset = ingest(args.name, args.paths, args.interval, args.fill)
+        print(dataset.ref, json.dumps(dataset.meta["report"]))
+    else:
+        store = DatasetStore()
+        for name in store.names():
+            for meta in store.versions(name):
+                print(
+                    f"{name}@{meta['hash'][:HASH_CHARS]} {meta['interval']}"
+                    f" {meta['rows']} rows {meta['createdAt']}"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -16,12 +16,50 @@ Koutmos 2020:
 }
 
 """
-from typing import Iterable, Tuple, Optional
+from typing import Iterable, NamedTuple, Tuple, Optional, Callable
 import json
 import numpy as np
 import pandas as pd
 import datetime
 
+from . import analytics
+from .datasets import load_dataset
+from .features import feature_cache, FeatureKey
+from .optim import Optimizer, SGD
+
+
+def ipython_progress(epoch: int, epochs: int, sharpe: float) -> None:
+    from IPython.display import clear_output
+
+    clear_output(wait=True)
+    print(f"Training...{epoch} of {epochs} epochs (sharpe {sharpe:.4f})")
+
+
+class SignalThreshold(NamedTuple):
+    """
+    The Ft the still open last candle gives once it closes at price p is
+    tanh(intercept + slope * p), so the signal flips at
+    price = -intercept / slope: BUY at or above it if buyAbove, at or
+    below it otherwise. price is None if the close has no effect
+    (the model's last lag weight is 0)
+    """
+
+    intercept: float
+    slope: float
+    price: Optional[float]
+    buyAbove: Optional[bool]
+    currentFt: float
+
+    def activation(self, close: float) -> float:
+        return self.intercept + self.slope * close
+
+    def signal_at(self, close: float) -> Tuple[str, float]:
+        """
+        (signal, Ft) if the open candle closed at `close`, in O(1)
+        """
+        Ft = float(np.tanh(self.activation(close)))
+        return ("SELL" if Ft < 0 else "BUY"), Ft
+
 
 class DirectReinforcementModel(object):
     def __init__(self, **kwargs):
@@ -48,9 +86,13 @@ class DirectReinforcementModel(object):
         self.X = self.get_x(srs)
         self.Ft = self.calc_Ft(self.X, self.theta)
 
-    def get_signal(self, close_price_series: pd.Series) -> Tuple[str, float]:
+    def get_signal(
+        self, close_price_series: pd.Series, cache_key: Optional[FeatureKey] = None
+    ) -> Tuple[str, float]:
         """
-        main method that will give a long/short signal
+        main method that will give a long/short signal.
+        Pass cache_key (see ml.features.feature_key) to share the
+        inputs with other models run on the same candles
 
         :returns:
         - signal: str: BUY or SELL
@@ -61,7 +103,7 @@ class DirectReinforcementModel(object):
             "before being initialised for making predictions"
         )
 
-        X = self.get_x(close_price_series)
+        X = self.get_x(close_price_series, cache_key=cache_key)
         FtArr = self.calc_Ft(X, self.theta)
         Ft = FtArr[-1]
         if Ft < 0:
@@ -70,6 +112,55 @@ class DirectReinforcementModel(object):
             sig = "BUY"
         return sig, Ft
 
+    def signal_threshold(
+        self, close_price_series: pd.Series, cache_key: Optional[FeatureKey] = None
+    ) -> SignalThreshold:
+        """
+        Where the signal flips for the close of the last (still open)
+        candle of close_price_series.
+        get_signal's Ft for a series doesn't depend on its last close: it
+        only enters through x_t, the return the next Ft is computed
+        from, and linearly. So the signal get_signal will give once this
+        candle has closed and the next has opened is known up to the one
+        price. It's exact for a series starting at the same candle; a
+        rolling window of candles starts one later but the recurrence
+        has long forgotten its start by then
+        """
+        x = self.get_x(close_price_series, cache_key=cache_key)
+        theta = np.asarray(self.theta, dtype=np.float64)
+        M = len(theta) - 2
+        current_ft = float(self.calc_Ft(x, theta)[-1])
+        # x[-1] is the open candle's return, replaced by the one it closes with
+        lags = x[len(x) - M : len(x) - 1]
+        prev_close = float(np.asarray(close_price_series)[-2])
+        w = theta[M]
+        intercept = (
+            theta[0]
+            + np.dot(theta[1:M], lags)
+            + theta[-1] * current_ft
+            - w * (prev_close + self.mean) / self.std
+        )
+        slope = w / self.std
+        if slope == 0:
+            return SignalThreshold(float(intercept), 0.0, None, None, current_ft)
+        return SignalThreshold(
+            float(intercept),
+            float(slope),
+            float(-intercept / slope),
+            bool(slope > 0),
+            current_ft,
+        )
+
+    def intrabar_signal(
+        self, close_price_series: pd.Series, cache_key: Optional[FeatureKey] = None
+    ) -> Tuple[str, float]:
+        """
+        The signal the open candle would give if it closed now, at the
+        last price in close_price_series
+        """
+        threshold = self.signal_threshold(close_price_series, cache_key)
+        return threshold.signal_at(float(np.asarray(close_price_series)[-1]))
+
     def save_model(self, filepath: str):
         model_data = self.__dict__
 
@@ -122,7 +213,14 @@ class DirectReinforcementModel(object):
         train_test_split: bool = False,
         N: int = None,
         P: int = None,
+        cache_key: Optional[FeatureKey] = None,
     ) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if cache_key is not None and not train_test_split:
+            assert not self.mean is None and not self.std is None, (
+                f"Train mean and std values not set"
+                "Model must be trained before making predictions"
+            )
+            return feature_cache.normalized(cache_key, series, self.mean, self.std)
         rets = series.diff()[1:]
         x = np.array(rets)
         if train_test_split:
@@ -172,6 +270,14 @@ class DirectReinforcementModel(object):
 
         return grad, S
 
+    @classmethod
+    def train_sharpe(cls, x, theta, delta) -> float:
+        """
+        Sharpe of the strategy over the whole of x for the given theta,
+        as maximised by `gradient`
+        """
+        return float(analytics.sharpe(cls.returns(cls.calc_Ft(x, theta), x, delta)))
+
     def train(
         self,
         train_series: pd.Series,
@@ -185,40 +291,128 @@ class DirectReinforcementModel(object):
         P=200,
         seed=0,
         usingIpy=True,
+        min_delta: float = 1e-4,
+        patience: Optional[int] = 100,
+        window: Optional[int] = None,
+        eval_every: int = 10,
+        history_every: int = 10,
+        callback: Optional[Callable[[int, int, float], Optional[bool]]] = None,
+        optimizer: Optional[Optimizer] = None,
+        theta: Optional[np.ndarray] = None,
     ):
-        if usingIpy:
-            from IPython.display import clear_output
+        """
+        Gradient ascent on the Sharpe ratio of x_train.
+
+        - epochs: upper bound on the number of epochs run
+        - min_delta / patience: stop once the Sharpe over x_train hasn't
+          improved by at least min_delta for `patience` epochs. The best
+          theta seen is kept. Set patience to None to always run all epochs
+        - window: if set, each epoch backpropagates over a random
+          sub-window of x_train of this length rather than all of it.
+          The full x_train Sharpe is then only evaluated every `eval_every`
+          epochs for the convergence check
+        - history_every: keep one Sharpe in the training history for
+          every this many epochs
+        - callback: called as callback(epoch, epochs, sharpe) after each
+          epoch, returning True stops training. Defaults to printing
+          progress when usingIpy
+        - optimizer: see ml.optim, defaults to SGD(learning_rate), the
+          plain gradient ascent train always did. Its state as of the
+          best theta is saved with the model under "optimizer", so
+          training carries on from the theta that was kept
+        - theta: start from this theta rather than a random one, e.g. with
+          optimizer=optimizer_from_state(mod.optimizer) to carry on training
+        """
+        if callback is None and usingIpy:
+            callback = ipython_progress
         np.random.seed(seed)
+        rng = np.random.RandomState(seed)
         self.train_series = train_series
         self.x_train, self.x_test = self.get_x(
             train_series, train_test_split=True, N=N, P=P
         )
-        theta = np.random.rand(M + 2)
-
-        sharpes = np.zeros(epochs)  # store sharpes over time
-        for it, i in enumerate(range(epochs)):
-            if usingIpy:
-                clear_output(wait=True)
-            grad, sharpe = self.gradient(self.x_train, theta, commission)
-            theta = theta + grad * learning_rate
-
-            sharpes[i] = sharpe
-            print(f"Training...{it+1} of {epochs} epochs")
-
-        print("Finished training")
-        self.theta = theta
-        self.sharpes = sharpes
+        T = len(self.x_train)
+        if window is not None:
+            assert M + 2 < window <= T, (
+                f"Training window must be longer than M+2 and no longer than"
+                f" x_train. Got {window} for M={M} and {T} training points"
+            )
+        if theta is None:
+            theta = np.random.rand(M + 2)
+        else:
+            theta = np.asarray(theta, dtype=np.float64)
+        if optimizer is None:
+            optimizer = SGD(learning_rate)
+
+        best_sharpe, best_theta, best_epoch = -np.inf, theta, 0
+        best_state = optimizer.state_dict()
+        history = []
+        epoch = 0
+        for epoch in range(1, epochs + 1):
+            if window is None:
+                x = self.x_train
+            else:
+                start = rng.randint(0, T - window + 1)
+                x = self.x_train[start : start + window]
+            grad, sharpe = self.gradient(x, theta, commission)
+            full_sharpe, scored_theta, scored_state = None, theta, None
+            if window is None:
+                # the sharpe returned is for theta before this epoch's step
+                full_sharpe = sharpe
+                if full_sharpe > best_sharpe + min_delta:
+                    # so the optimizer is kept as it was at that theta too
+                    scored_state = optimizer.state_dict()
+            theta = optimizer.step(theta, grad)
+            if window is not None and (epoch % eval_every == 0 or epoch == epochs):
+                full_sharpe = self.train_sharpe(self.x_train, theta, commission)
+                scored_theta = theta
+
+            if full_sharpe is not None:
+                if full_sharpe > best_sharpe + min_delta:
+                    best_sharpe, best_theta, best_epoch = (
+                        full_sharpe,
+                        scored_theta,
+                        epoch,
+                    )
+                    best_state = scored_state or optimizer.state_dict()
+                elif patience is not None and epoch - best_epoch >= patience:
+                    break
+            if epoch % history_every == 0:
+                history.append(round(float(sharpe), 6))
+            if callback is not None and callback(epoch, epochs, sharpe):
+                break
+
+        self.theta = best_theta
+        self.train_history = {
+            "epochsRun": epoch,
+            "bestEpoch": best_epoch,
+            "bestSharpe": float(best_sharpe),
+            "every": history_every,
+            "sharpes": history,
+        }
         self.N = N
         self.P = P
         self.epochs = epochs
         self.M = M
         self.commission = commission
         self.learning_rate = learning_rate
+        self.optimizer = best_state
         self.train_date_series = train_date_series
         self.train_dataset_name = train_dataset_name
 
+    def train_dataset(self, name: str, drop_gaps: bool = False, **kwargs):
+        """
+        train on a dataset ingested with ml.datasets, by name (its latest
+        version) or name@hash. train_dataset_name is set to the name@hash
+        of the version used so the model can be retrained on the same
+        bars. kwargs go to train
+        """
+        dataset = load_dataset(name)
+        series, dates = dataset.series(drop_gaps)
+        self.train(series, dates, dataset.ref, **kwargs)
+
     def sharpe_ratio(self, rets):
-        return rets.mean() / rets.std()
+        return float(analytics.sharpe(rets, ddof=1))
 
     def test_set_futures_simulation(
         self, test_data: pd.Series = pd.Series(), save=False
@@ -361,4 +555,13 @@ class DirectReinforcementModel(object):
         buy_and_hold_gains = (final_price * buy_hold_start_btc) * (1 - self.commission)
         print(f"Model total gains: {current_balance}")
         print(f"Buy/Hold total gains: {buy_and_hold_gains}")
+        stats = analytics.returns_metrics(
+            buy_data["portfolio USD value"].pct_change().dropna().to_numpy()
+        )
+        print(
+            "Model sharpe {sharpe:.4f}, sortino {sortino:.4f}, max drawdown "
+            "{maxDrawdown:.2%}, hit rate {hitRate:.2%}".format(**stats)
+        )
+        Ft = buy_data["ft_val"].dropna().to_numpy()
+        print(f"Model turnover: {analytics.turnover(Ft):.4f}")
         return buy_data
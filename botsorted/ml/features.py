@@ -0,0 +1,101 @@
+"""
+Cache of model inputs shared by every model run over the same candles.
+
+Raw returns are stored once per candle series and each model's
+normalised view (which only depends on its train mean and std) is
+derived from them. Entries are evicted least recently used first once
+the cache holds more than featureCacheMaxBytes.
+
+The cache is per process and nothing shares it between processes. It's
+for the in-process batch path (batch_Ft and the engine's own signal on
+the same candles) where several models read one series within a call.
+Chart render workers don't use it, each renders one model per request
+so there'd be nothing to share.
+"""
+from collections import OrderedDict
+from typing import Tuple
+import threading
+
+import numpy as np
+
+from ..config import config
+
+# (symbol, interval, last candle time, number of closes, last close)
+FeatureKey = Tuple[str, str, int, int, float]
+
+
+def feature_key(symbol: str, interval: str, last_time, closes) -> FeatureKey:
+    """
+    Key for a series of closes. The last close is part of it as the last
+    candle may still be open and its close changing between fetches
+    """
+    return (symbol, interval, int(last_time), len(closes), float(closes[-1]))
+
+
+class FeatureCache(object):
+    def __init__(self, max_bytes: int = config["featureCacheMaxBytes"]):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        with self._lock:
+            arr = self._entries.get(key)
+            if arr is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return arr
+
+    def _put(self, key, arr: np.ndarray) -> np.ndarray:
+        # shared between models and threads so nobody gets to modify it
+        arr.setflags(write=False)
+        with self._lock:
+            if key in self._entries:
+                return self._entries[key]
+            self._entries[key] = arr
+            self._bytes += arr.nbytes
+            while self._bytes > self.max_bytes and len(self._entries) > 1:
+                _, old = self._entries.popitem(last=False)
+                self._bytes -= old.nbytes
+        return arr
+
+    def returns(self, key: FeatureKey, closes) -> np.ndarray:
+        """
+        Price differences of closes, as DirectReinforcementModel.get_x uses
+        """
+        rets = self._get(("returns",) + key)
+        if rets is None:
+            rets = self._put(
+                ("returns",) + key, np.diff(np.asarray(closes, dtype=np.float64))
+            )
+        return rets
+
+    def normalized(self, key: FeatureKey, closes, mean: float, std: float) -> np.ndarray:
+        nkey = ("normalized",) + key + (float(mean), float(std))
+        x = self._get(nkey)
+        if x is None:
+            x = self._put(nkey, (self.returns(key, closes) - mean) / std)
+        return x
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+feature_cache = FeatureCache()
@@ -0,0 +1,300 @@
+"""
+Optimizers for DirectReinforcementModel.train.
+
+Every optimizer does gradient *ascent* (the Sharpe ratio is maximised),
+optionally clips the gradient's norm and takes its learning rate from a
+schedule. state_dict() gives the hyperparameters and moment estimates as
+plain lists so train can save them in the model JSON, and
+optimizer_from_state rebuilds the optimizer to carry on training.
+
+    mod.train(..., optimizer=Adam(0.05, schedule=CosineLR(2000)))
+"""
+from typing import Callable, Dict, Optional, Sequence, Union
+import math
+
+import numpy as np
+import pandas as pd
+
+from .datasets import load_dataset
+
+
+class OptimizerException(Exception):
+    pass
+
+
+# schedules ###################################################################
+class ConstantLR(object):
+    def __call__(self, lr: float, epoch: int) -> float:
+        return lr
+
+    def state_dict(self) -> dict:
+        return {"name": "constant"}
+
+
+class StepLR(object):
+    """
+    lr multiplied by gamma every step_size epochs
+    """
+
+    def __init__(self, step_size: int, gamma: float = 0.5):
+        self.step_size = step_size
+        self.gamma = gamma
+
+    def __call__(self, lr: float, epoch: int) -> float:
+        return lr * self.gamma ** ((epoch - 1) // self.step_size)
+
+    def state_dict(self) -> dict:
+        return {"name": "step", "step_size": self.step_size, "gamma": self.gamma}
+
+
+class ExponentialLR(object):
+    def __init__(self, gamma: float = 0.999):
+        self.gamma = gamma
+
+    def __call__(self, lr: float, epoch: int) -> float:
+        return lr * self.gamma ** (epoch - 1)
+
+    def state_dict(self) -> dict:
+        return {"name": "exponential", "gamma": self.gamma}
+
+
+class CosineLR(object):
+    """
+    lr annealed to min_lr over t_max epochs along half a cosine
+    """
+
+    def __init__(self, t_max: int, min_lr: float = 0.0):
+        self.t_max = t_max
+        self.min_lr = min_lr
+
+    def __call__(self, lr: float, epoch: int) -> float:
+        progress = min(epoch - 1, self.t_max) / self.t_max
+        return self.min_lr + (lr - self.min_lr) * (1 + math.cos(math.pi * progress)) / 2
+
+    def state_dict(self) -> dict:
+        return {"name": "cosine", "t_max": self.t_max, "min_lr": self.min_lr}
+
+
+SCHEDULES = {
+    "constant": ConstantLR,
+    "step": StepLR,
+    "exponential": ExponentialLR,
+    "cosine": CosineLR,
+}
+
+
+# optimizers ##################################################################
+class Optimizer(object):
+    name = None
+    # attributes holding per parameter state, saved as lists
+    slots = ()
+
+    def __init__(
+        self,
+        learning_rate: float,
+        schedule=None,
+        clip_norm: Optional[float] = None,
+    ):
+        self.learning_rate = learning_rate
+        self.schedule = schedule or ConstantLR()
+        self.clip_norm = clip_norm
+        self.epoch = 0
+
+    def lr(self) -> float:
+        return self.schedule(self.learning_rate, self.epoch)
+
+    def clip(self, grad: np.ndarray) -> np.ndarray:
+        if self.clip_norm is None:
+            return grad
+        norm = np.linalg.norm(grad)
+        if norm > self.clip_norm:
+            return grad * (self.clip_norm / norm)
+        return grad
+
+    def step(self, theta: np.ndarray, grad: np.ndarray) -> np.ndarray:
+        """
+        theta after one ascent step along grad
+        """
+        self.epoch += 1
+        return theta + self.update(self.clip(grad))
+
+    def update(self, grad: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def hyperparameters(self) -> dict:
+        return {}
+
+    def state_dict(self) -> dict:
+        state = {
+            "name": self.name,
+            "learning_rate": self.learning_rate,
+            "clip_norm": self.clip_norm,
+            "epoch": self.epoch,
+            "schedule": self.schedule.state_dict(),
+            **self.hyperparameters(),
+        }
+        for slot in self.slots:
+            value = getattr(self, slot)
+            state[slot] = None if value is None else value.tolist()
+        return state
+
+
+class SGD(Optimizer):
+    """
+    Plain gradient ascent, what train always used
+    """
+
+    name = "sgd"
+
+    def update(self, grad):
+        return grad * self.lr()
+
+
+class Momentum(Optimizer):
+    name = "momentum"
+    slots = ("velocity",)
+
+    def __init__(
+        self, learning_rate, beta: float = 0.9, nesterov: bool = False, **kwargs
+    ):
+        super().__init__(learning_rate, **kwargs)
+        self.beta = beta
+        self.nesterov = nesterov
+        self.velocity = None
+
+    def update(self, grad):
+        if self.velocity is None:
+            self.velocity = np.zeros_like(grad)
+        self.velocity = self.beta * self.velocity + grad
+        if self.nesterov:
+            return (grad + self.beta * self.velocity) * self.lr()
+        return self.velocity * self.lr()
+
+    def hyperparameters(self):
+        return {"beta": self.beta, "nesterov": self.nesterov}
+
+
+class RMSProp(Optimizer):
+    name = "rmsprop"
+    slots = ("square_avg",)
+
+    def __init__(self, learning_rate, rho: float = 0.9, eps: float = 1e-8, **kwargs):
+        super().__init__(learning_rate, **kwargs)
+        self.rho = rho
+        self.eps = eps
+        self.square_avg = None
+
+    def update(self, grad):
+        if self.square_avg is None:
+            self.square_avg = np.zeros_like(grad)
+        self.square_avg = self.rho * self.square_avg + (1 - self.rho) * grad ** 2
+        return self.lr() * grad / (np.sqrt(self.square_avg) + self.eps)
+
+    def hyperparameters(self):
+        return {"rho": self.rho, "eps": self.eps}
+
+
+class Adam(Optimizer):
+    name = "adam"
+    slots = ("m", "v")
+
+    def __init__(
+        self,
+        learning_rate,
+        beta1: float = 0.9,
+        beta2: float = 0.999,
+        eps: float = 1e-8,
+        **kwargs,
+    ):
+        super().__init__(learning_rate, **kwargs)
+        self.beta1 = beta1
+        self.beta2 = beta2
+        self.eps = eps
+        self.m = None
+        self.v = None
+
+    def update(self, grad):
+        if self.m is None:
+            self.m, self.v = np.zeros_like(grad), np.zeros_like(grad)
+        self.m = self.beta1 * self.m + (1 - self.beta1) * grad
+        self.v = self.beta2 * self.v + (1 - self.beta2) * grad ** 2
+        m_hat = self.m / (1 - self.beta1 ** self.epoch)
+        v_hat = self.v / (1 - self.beta2 ** self.epoch)
+        return self.lr() * m_hat / (np.sqrt(v_hat) + self.eps)
+
+    def hyperparameters(self):
+        return {"beta1": self.beta1, "beta2": self.beta2, "eps": self.eps}
+
+
+OPTIMIZERS = {cls.name: cls for cls in (SGD, Momentum, RMSProp, Adam)}
+
+
+def optimizer_from_state(state: dict) -> Optimizer:
+    """
+    Rebuild an optimizer from its state_dict, e.g. as saved in a model's
+    JSON under "optimizer", to continue training where it left off
+    """
+    state = dict(state)
+    try:
+        cls = OPTIMIZERS[state.pop("name")]
+        schedule = dict(state.pop("schedule"))
+        schedule = SCHEDULES[schedule.pop("name")](**schedule)
+    except KeyError as e:
+        raise OptimizerException(f"Unknown optimizer or schedule {e}")
+    epoch = state.pop("epoch")
+    slots = {slot: state.pop(slot) for slot in cls.slots}
+    opt = cls(schedule=schedule, **state)
+    opt.epoch = epoch
+    for slot, value in slots.items():
+        setattr(opt, slot, None if value is None else np.array(value))
+    return opt
+
+
+def epochs_to_target(
+    model_cls,
+    datasets: Union[Dict[str, pd.Series], Sequence[str]],
+    optimizers: Dict[str, Callable[[], Optimizer]],
+    target_sharpe: float,
+    epochs: int = 2500,
+    **train_kwargs,
+) -> pd.DataFrame:
+    """
+    Benchmark: for each dataset (name -> close series, or names of
+    ingested datasets) and optimizer (name -> factory), the first epoch
+    whose training Sharpe reaches target_sharpe, NaN if it never does
+    within `epochs`. Training stops as soon as the target is reached.
+    train_kwargs go to model_cls().train (e.g. M, N, P, window)
+    """
+    if not isinstance(datasets, dict):
+        datasets = {name: load_dataset(name).series()[0] for name in datasets}
+    rows = []
+    for data_name, series in datasets.items():
+        for opt_name, make in optimizers.items():
+            reached = []
+
+            def stop_at_target(epoch, _epochs, sharpe):
+                if sharpe >= target_sharpe:
+                    reached.append(epoch)
+                    return True
+
+            mod = model_cls()
+            mod.train(
+                series,
+                pd.Series(series.index),
+                data_name,
+                epochs=epochs,
+                optimizer=make(),
+                patience=None,
+                usingIpy=False,
+                callback=stop_at_target,
+                **train_kwargs,
+            )
+            rows.append(
+                {
+                    "dataset": data_name,
+                    "optimizer": opt_name,
+                    "epochsToTarget": reached[0] if reached else np.nan,
+                    "bestSharpe": mod.train_history["bestSharpe"],
+                }
+            )
+    return pd.DataFrame(rows)
@@ -0,0 +1,167 @@
+"""
+Process-wide store of loaded models keyed by (name, version).
+
+Each model JSON is read once and the same instance is shared between the
+trading engine and the web handlers. Files are re-checked at most every
+`modelRegistryPollSeconds` and, if their content changed, the new
+version is loaded in full before being swapped in so readers never see a
+half loaded model.
+"""
+from typing import Dict, List, Optional, Tuple
+import datetime
+import hashlib
+import os
+import threading
+import time
+
+from ..config import config
+from ..logger import get_logger
+from .dr import DirectReinforcementModel
+
+log = get_logger(__name__)
+
+
+class ModelRegistryException(Exception):
+    pass
+
+
+class RegisteredModel(object):
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        path: str,
+        model: DirectReinforcementModel,
+        mtime: int,
+        sha: str,
+        description: Optional[str] = None,
+    ):
+        self.name = name
+        self.version = version
+        self.path = path
+        self.model = model
+        self.mtime = mtime
+        self.sha = sha
+        self.description = description
+        self.loaded_at = datetime.datetime.now()
+        self.checked_at = time.time()
+
+    def info(self) -> dict:
+        return {
+            "modelName": self.name,
+            "modelVersion": self.version,
+            "modelLocation": self.path,
+            "description": self.description,
+            "sha1": self.sha,
+            "loadedAt": self.loaded_at.isoformat(),
+        }
+
+
+class ModelRegistry(object):
+    def __init__(self, poll_seconds: float = config["modelRegistryPollSeconds"]):
+        self.poll_seconds = poll_seconds
+        self._entries: Dict[Tuple[str, str], RegisteredModel] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load(name, version, path, description=None) -> RegisteredModel:
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            with open(path, "rb") as f:
+                sha = hashlib.sha1(f.read()).hexdigest()
+            model = DirectReinforcementModel.from_json(path)
+        except (OSError, ValueError) as e:
+            raise ModelRegistryException(
+                f"Could not load model {name} v{version} from {path}: {e}"
+            )
+        return RegisteredModel(name, version, path, model, mtime, sha, description)
+
+    def register(
+        self, name: str, version: str, path: str, description: Optional[str] = None
+    ) -> DirectReinforcementModel:
+        key = (name, version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.path == path:
+                return entry.model
+            entry = self._load(name, version, path, description)
+            self._entries[key] = entry
+        log.info("Registered model %s v%s from %s", name, version, path)
+        return entry.model
+
+    def get(self, name: str, version: str) -> DirectReinforcementModel:
+        try:
+            entry = self._entries[(name, version)]
+        except KeyError:
+            raise ModelRegistryException(f"Model {name} v{version} not registered")
+        if time.time() - entry.checked_at > self.poll_seconds:
+            entry = self._reload_if_changed(entry)
+        return entry.model
+
+    def _reload_if_changed(self, entry: RegisteredModel) -> RegisteredModel:
+        with self._lock:
+            current = self._entries[(entry.name, entry.version)]
+            if current is not entry:
+                # another thread already swapped it
+                return current
+            entry.checked_at = time.time()
+            try:
+                mtime = os.stat(entry.path).st_mtime_ns
+            except OSError as e:
+                log.error("Could not stat %s, keeping loaded model: %s", entry.path, e)
+                return entry
+            if mtime == entry.mtime:
+                return entry
+            try:
+                new = self._load(entry.name, entry.version, entry.path, entry.description)
+            except ModelRegistryException as e:
+                log.error("%s. Keeping previously loaded model", e)
+                return entry
+            if new.sha == entry.sha:
+                # touched but not changed
+                entry.mtime = mtime
+                return entry
+            self._entries[(entry.name, entry.version)] = new
+        log.info("Reloaded changed model %s v%s", entry.name, entry.version)
+        return new
+
+    def refresh(self) -> None:
+        for entry in list(self._entries.values()):
+            self._reload_if_changed(entry)
+
+    def models(self) -> List[Tuple[str, str, DirectReinforcementModel]]:
+        """
+        (name, version, model) of every registered model, reloading any
+        that changed
+        """
+        return [
+            (name, version, self.get(name, version))
+            for name, version in list(self._entries)
+        ]
+
+    def list(self) -> List[dict]:
+        return [e.info() for e in self._entries.values()]
+
+    def info(self, name: str, version: str) -> dict:
+        self.get(name, version)
+        return self._entries[(name, version)].info()
+
+
+registry = ModelRegistry()
+
+
+def register_configured_models(reg: ModelRegistry = registry) -> ModelRegistry:
+    """
+    Register the live model and every extra chart model from the config
+    """
+    reg.register(
+        config["modelName"], config["modelVersion"], config["modelLocation"]
+    )
+    for ec in config["extraCharts"]:
+        reg.register(
+            ec["modelName"],
+            ec["modelVersion"],
+            ec["modelLocation"],
+            ec.get("description"),
+        )
+    return reg
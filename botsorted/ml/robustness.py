@@ -0,0 +1,231 @@
+"""
+Robustness evaluation of a DirectReinforcementModel on resampled paths.
+
+Rather than one replay of history, thousands of return paths are
+resampled from the training series, either by moving block bootstrap or
+by regime resampling (blocks drawn according to how volatility regimes
+follow each other in the original series). The Ft recurrence and PnL run
+on all paths of a chunk at once as (paths, T) arrays, chunks are spread
+over worker processes and only the per path metrics are sent back, so
+memory stays bounded by the chunk size whatever the number of paths.
+
+    report = evaluate(model, closes, n_paths=5000, method="regime")
+"""
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+import numpy as np
+
+from ..config import config
+from ..logger import get_logger
+from . import analytics
+from .analytics import METRICS
+from .batch import batch_Ft_rows
+from .datasets import load_dataset
+from .dr import DirectReinforcementModel
+
+log = get_logger(__name__)
+
+METHODS = ("block", "regime")
+PERCENTILES = (1, 5, 25, 50, 75, 95, 99)
+
+
+class RobustnessException(Exception):
+    pass
+
+
+def block_bootstrap(
+    rets: np.ndarray, n_paths: int, T: int, block: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    (n_paths, T) paths of consecutive blocks of rets starting at random
+    offsets, keeping the autocorrelation within each block
+    """
+    n_blocks = -(-T // block)
+    starts = rng.integers(0, len(rets) - block + 1, size=(n_paths, n_blocks))
+    idx = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :T]
+    return rets[idx]
+
+
+def volatility_regimes(rets: np.ndarray, block: int, n_regimes: int) -> np.ndarray:
+    """
+    Regime (0 calmest to n_regimes-1) of the block starting at each offset,
+    by quantile of the block's realised volatility
+    """
+    csum = np.r_[0, np.cumsum(rets)]
+    csum2 = np.r_[0, np.cumsum(rets ** 2)]
+    mean = (csum[block:] - csum[:-block]) / block
+    vol = np.sqrt(np.maximum((csum2[block:] - csum2[:-block]) / block - mean ** 2, 0))
+    edges = np.quantile(vol, np.linspace(0, 1, n_regimes + 1)[1:-1])
+    return np.searchsorted(edges, vol)
+
+
+def regime_bootstrap(
+    rets: np.ndarray,
+    n_paths: int,
+    T: int,
+    block: int,
+    rng: np.random.Generator,
+    n_regimes: int = 3,
+) -> np.ndarray:
+    """
+    Like block_bootstrap but each block's regime follows the transition
+    frequencies between consecutive blocks of the original series, so
+    calm and volatile stretches cluster as they did historically
+    """
+    regimes = volatility_regimes(rets, block, n_regimes)
+    n_starts = len(regimes)
+    # transitions between a block and the one following it
+    trans = np.ones((n_regimes, n_regimes))  # +1 so no regime is a dead end
+    np.add.at(trans, (regimes[:-block], regimes[block:]), 1)
+    trans /= trans.sum(axis=1, keepdims=True)
+    cum_trans = trans.cumsum(axis=1)
+
+    by_regime = [np.flatnonzero(regimes == r) for r in range(n_regimes)]
+    counts = np.array([len(s) for s in by_regime])
+    if (counts == 0).any():
+        raise RobustnessException("Series too short to find every volatility regime")
+    # starts grouped by regime so a regime's starts are one contiguous slice
+    order = np.concatenate(by_regime)
+    offsets = np.r_[0, counts.cumsum()[:-1]]
+
+    n_blocks = -(-T // block)
+    starts = np.empty((n_paths, n_blocks), dtype=np.int64)
+    state = regimes[rng.integers(0, n_starts, size=n_paths)]
+    for b in range(n_blocks):
+        if b:
+            u = rng.random(n_paths)[:, None]
+            state = np.minimum((u > cum_trans[state]).sum(axis=1), n_regimes - 1)
+        pick = offsets[state] + (rng.random(n_paths) * counts[state]).astype(np.int64)
+        starts[:, b] = order[pick]
+    idx = (starts[:, :, None] + np.arange(block)).reshape(n_paths, -1)[:, :T]
+    return rets[idx]
+
+
+def path_metrics(
+    Ft: np.ndarray, rets: np.ndarray, commission: float
+) -> Dict[str, np.ndarray]:
+    """
+    Per path metrics of holding Ft_{t-1} over relative returns rets_t,
+    paying commission on every change of position
+    """
+    return analytics.metrics(Ft, rets, commission)
+
+
+def _run_chunk(
+    rets: np.ndarray,
+    start_price: float,
+    theta: np.ndarray,
+    mean: float,
+    std: float,
+    commission: float,
+    n_paths: int,
+    T: int,
+    block: int,
+    method: str,
+    seed: np.random.SeedSequence,
+) -> Dict[str, np.ndarray]:
+    """
+    Generate and evaluate one chunk of paths. Runs in a worker process,
+    only the inputs and the per path metrics cross the process boundary
+    """
+    rng = np.random.default_rng(seed)
+    if method == "block":
+        path_rets = block_bootstrap(rets, n_paths, T, block, rng)
+    else:
+        path_rets = regime_bootstrap(rets, n_paths, T, block, rng)
+    prices = start_price * np.cumprod(1 + path_rets, axis=1)
+    diffs = np.diff(prices, axis=1, prepend=start_price)
+    Ft = batch_Ft_rows(diffs, theta, mean, std)
+    return path_metrics(Ft, path_rets, commission)
+
+
+def summarise(metrics: Dict[str, np.ndarray]) -> Dict[str, dict]:
+    return {
+        name: {
+            "mean": float(values.mean()),
+            "std": float(values.std()),
+            **{
+                f"p{p}": float(v)
+                for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+            },
+        }
+        for name, values in metrics.items()
+    }
+
+
+def evaluate(
+    model: DirectReinforcementModel,
+    closes=None,
+    n_paths: int = 1000,
+    T: Optional[int] = None,
+    block: int = 20,
+    method: str = "block",
+    chunk_paths: int = config["robustnessChunkPaths"],
+    workers: int = config["robustnessWorkers"],
+    seed: Optional[int] = None,
+) -> dict:
+    """
+    Distributions of every analytics.METRICS metric of model over n_paths
+    resampled paths of T bars (default: as long as the source series).
+    closes defaults to the model's train_series and can be the name (or
+    name@hash) of an ingested dataset.
+    Returns the summary percentiles plus the raw per path metrics.
+
+    Ft runs on each path's price differences, as the model was trained,
+    but PnL is taken on relative returns so paths that drift to very
+    different price levels score on the same scale. The Sharpe here is
+    therefore not the train Sharpe DR training maximised, which is over
+    normalised price differences; compare paths with each other rather
+    than with the train Sharpe
+    """
+    if method not in METHODS:
+        raise RobustnessException(f"method must be one of {METHODS}, got {method}")
+    if closes is None:
+        closes = model.train_series
+    elif isinstance(closes, str):
+        closes = load_dataset(closes).series(drop_gaps=True)[0]
+    closes = np.asarray(closes, dtype=np.float64)
+    rets = closes[1:] / closes[:-1] - 1
+    T = T or len(rets)
+    if len(rets) < 2 * block:
+        raise RobustnessException(
+            f"Need at least {2 * block + 1} closes for blocks of {block}"
+        )
+    theta = np.asarray(model.theta, dtype=np.float64)
+    M = len(theta) - 2
+    if T <= M + 1:
+        # Ft is 0 for the first M bars, leaving no position to score
+        raise RobustnessException(
+            f"Paths of {T} bars are too short for a model with M={M}, "
+            f"T must be more than {M + 1}"
+        )
+    commission = getattr(model, "commission", 0.001)
+
+    sizes = [chunk_paths] * (n_paths // chunk_paths)
+    if n_paths % chunk_paths:
+        sizes.append(n_paths % chunk_paths)
+    # independent streams per chunk so results don't depend on scheduling
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    args = [
+        (rets, closes[0], theta, model.mean, model.std, commission)
+        + (size, T, block, method, s)
+        for size, s in zip(sizes, seeds)
+    ]
+    log.info(
+        "Evaluating %d %s paths of %d bars in %d chunks", n_paths, method, T, len(sizes)
+    )
+    if workers > 1 and len(args) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_chunk, *zip(*args)))
+    else:
+        results = [_run_chunk(*a) for a in args]
+
+    metrics = {m: np.concatenate([r[m] for r in results]) for m in METRICS}
+    return {
+        "method": method,
+        "paths": n_paths,
+        "bars": T,
+        "block": block,
+        "summary": summarise(metrics),
+        "metrics": metrics,
+    }
@@ -0,0 +1,97 @@
+"""
+Starts the web tier and the trading engine process side by side on one
+host, as deployed (one heroku web dyno):
+
+    python -m botsorted.serve
+
+The engine (botsorted.trading.run) publishes its state, heartbeat and the
+odds and market scans as files the web workers read, and dynos don't
+share a filesystem, so the two can't run as separate dynos. If either
+process exits the other is stopped and this exits with its code, so the
+host restarts them together rather than serving stale state. Keep the
+web process at one dyno, each one starts its own engine.
+"""
+from typing import List
+import os
+import signal
+import subprocess
+import sys
+import time
+
+from .config import config
+from .logger import get_logger
+
+log = get_logger(__name__)
+
+
+def engine_command() -> List[str]:
+    return [sys.executable, "-m", "botsorted.trading.run"]
+
+
+def web_command() -> List[str]:
+    return [
+        sys.executable,
+        "-m",
+        "uvicorn",
+        "botsorted.app:app",
+        "--host=0.0.0.0",
+        f"--port={os.environ.get('PORT', '5000')}",
+        f"--workers={os.environ.get('WEB_CONCURRENCY', '2')}",
+    ]
+
+
+def engine_needed() -> bool:
+    """
+    Whether botsorted.trading.run has anything to run: the trader, or the
+    scanners when they aren't in the web app
+    """
+    return (config["runTrader"] and not config["runTraderInWeb"]) or not config[
+        "tennisScanInWeb"
+    ]
+
+
+def supervise(commands: List[List[str]], poll: float = 1) -> int:
+    """
+    Run commands until one exits or this is asked to stop, then stop the
+    rest. Returns the exit code of the first to exit
+    """
+    procs = [subprocess.Popen(cmd) for cmd in commands]
+    stopping = []
+
+    def stop(signum, frame):
+        stopping.append(signum)
+
+    previous = {s: signal.signal(s, stop) for s in (signal.SIGTERM, signal.SIGINT)}
+    try:
+        code = 0
+        while not stopping:
+            exited = [p for p in procs if p.poll() is not None]
+            if exited:
+                code = exited[0].returncode
+                log.error("%s exited with %d, stopping the rest", exited[0].args, code)
+                break
+            time.sleep(poll)
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+        for p in procs:
+            try:
+                p.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                p.kill()
+                p.wait()
+        return code
+    finally:
+        for s, handler in previous.items():
+            signal.signal(s, handler)
+
+
+def main():
+    commands = [web_command()]
+    if engine_needed():
+        commands.insert(0, engine_command())
+    sys.exit(supervise(commands))
+
+
+if __name__ == "__main__":
+    main()
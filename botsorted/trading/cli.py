@@ -1,10 +1,12 @@
 import pandas as pd
-from typing import List, Any
+from typing import List, Any, Dict, Optional
 import os, sys
 import datetime
+import time
 
 from ..binance.futures import FuturesClient
 from ..binance.conn import USE_LIVE, make_request
+from ..binance.book import OrderBook
 
 from ..logger import get_logger
 
@@ -18,14 +20,41 @@ class TradingClientException(Exception):
     pass
 
 
+class PartialFillException(TradingClientException):
+    """
+    A split market order failed after some of its child orders filled.
+    Retrying the whole order would add to what already filled, so only
+    `remaining` of it should be
+    """
+
+    def __init__(self, sym: Symbol, side: str, filled: float, remaining: float, resp):
+        super().__init__(
+            f"{side} {sym.conc()} failed with {filled} filled and {remaining} "
+            f"remaining - api return: {resp.text}"
+        )
+        self.sym = sym
+        self.side = side
+        self.filled = filled
+        self.remaining = remaining
+        self.resp = resp
+
+
 # #temp: throw error if not using test version
 # if USE_LIVE:
 #     raise TradingClientException('Not ready to run for real. Stay in test mode')
 
 
 class TradingClient(FuturesClient):
-    def __init__(self):
+    def __init__(self, books: Optional[Dict[str, OrderBook]] = None):
         super().__init__()
+        # symbol -> locally maintained order book, used for sizing if live
+        self.books = books if books is not None else {}
+
+    def get_book(self, sym: Symbol) -> Optional[OrderBook]:
+        book = self.books.get(sym.conc())
+        if book is not None and book.is_live:
+            return book
+        return None
 
     def get_non_margin_cash_balance(self) -> float:
         ac = self.account().json()
@@ -56,10 +85,9 @@ class TradingClient(FuturesClient):
         # make sure to only take up to the maxmium allowed for trading
         tradable_usdt = min([config["maxTradeSizeUSDT"], total_quote])
 
-        px = self.get_price(sym)
-        base_qty = self.get_base_qty(tradable_usdt, px)
-        base_qty = round(base_qty, config["quantityPrecision"])
-        return self.new_order(sym.conc(), "BUY", base_qty)
+        base_qty = self.get_base_qty(tradable_usdt, self.get_order_price(sym, "BUY"))
+        base_qty = round(base_qty, self.quantity_precision(sym.conc()))
+        return self.market_order(sym, "BUY", base_qty)
 
     def open_short(self, sym: Symbol):
         """
@@ -76,10 +104,75 @@ class TradingClient(FuturesClient):
         # make sure to only take up to the maxmium allowed for trading
         tradable_usdt = min([config["maxTradeSizeUSDT"], total_quote])
 
-        px = self.get_price(sym)
-        base_qty = self.get_base_qty(tradable_usdt, px)
-        base_qty = round(base_qty, config["quantityPrecision"])
-        return self.new_order(sym.conc(), "SELL", base_qty)
+        base_qty = self.get_base_qty(tradable_usdt, self.get_order_price(sym, "SELL"))
+        base_qty = round(base_qty, self.quantity_precision(sym.conc()))
+        return self.market_order(sym, "SELL", base_qty)
+
+    def get_order_price(self, sym: Symbol, side: str) -> float:
+        """
+        Best price on the side we'd be taking from the local book if
+        there's a live one, otherwise the mark price from the API
+        """
+        book = self.get_book(sym)
+        if book is not None:
+            return (book.asks if side == "BUY" else book.bids).best()
+        return self.get_price(sym)
+
+    def market_order(self, sym: Symbol, side: str, base_qty: float):
+        """
+        Market order for base_qty. If there's a live book and filling it
+        in one go would slip more than maxSlippageBps from the touch, it's
+        split into up to orderSplitMaxChunks child orders, each sized to
+        what the book can take within that slippage at the time. A child
+        failing after others filled raises PartialFillException
+        """
+        book = self.get_book(sym)
+        if book is None:
+            return self.new_order(sym.conc(), side, base_qty)
+
+        est = book.expected_fill(side, base_qty)
+        log.info(
+            "Expected %s fill for %s %s: %.2f (%.1f bps slippage)",
+            side,
+            base_qty,
+            sym.conc(),
+            est["price"],
+            est["slippageBps"],
+        )
+        if (
+            est["slippageBps"] <= config["maxSlippageBps"]
+            or config["orderSplitMaxChunks"] < 2
+        ):
+            return self.new_order(sym.conc(), side, base_qty)
+
+        precision = self.quantity_precision(sym.conc())
+        min_child = base_qty / config["orderSplitMaxChunks"]
+        remaining = base_qty
+        resp = None
+        for n in range(config["orderSplitMaxChunks"]):
+            if n:
+                time.sleep(config["orderSplitWaitSeconds"])
+            within = book.max_qty_for_slippage(side, config["maxSlippageBps"])
+            child = min(remaining, max(within, min_child))
+            if n == config["orderSplitMaxChunks"] - 1:
+                child = remaining
+            child = round(child, precision)
+            if child <= 0:
+                break
+            log.info("Child order %d: %s %s %s", n + 1, side, child, sym.conc())
+            resp = self.new_order(sym.conc(), side, child)
+            if not (resp.status_code > 199 and resp.status_code < 300):
+                if n:
+                    filled = round(base_qty - remaining, precision)
+                    raise PartialFillException(sym, side, filled, remaining, resp)
+                return resp
+            remaining = round(remaining - child, precision)
+            if remaining <= 0:
+                break
+        if resp is None:
+            # too small to split at the exchange's precision
+            return self.new_order(sym.conc(), side, base_qty)
+        return resp
 
     def df_candles(
         self,
@@ -130,7 +223,7 @@ class TradingClient(FuturesClient):
         return base_qty * px
 
     def get_base_qty(self, quote_qty: float, px: float) -> dict:
-        log.debug(f"Raw base qty: {(quote_qty/px)}")
+        log.debug("Raw base qty: %s", quote_qty / px)
         baseQty = (quote_qty / px) * config["tradeMarginRatio"]
-        log.debug(f"{baseQty=}")
+        log.debug("baseQty=%s", baseQty)
         return baseQty
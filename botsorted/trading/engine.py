@@ -3,6 +3,9 @@ The main loop that consumes signals from a model
 and supplies the model with data via a callback
 """
 import os, sys
+import logging
+from typing import Callable, List, Optional, Tuple
+import numpy as np
 import pandas as pd
 import datetime
 import time
@@ -10,7 +13,14 @@ import time
 
 from ..logger import get_logger
 from ..ml.dr import DirectReinforcementModel
-from .cli import TradingClient
+from ..ml.registry import registry
+from ..ml.features import feature_key
+from ..ml.batch import batch_Ft
+from .cli import TradingClient, PartialFillException
+from ..binance.book import OrderBookStream
+from .state import EngineStateWriter
+from .snapshot import SnapshotStore, snapshot_key, validate_snapshot
+from .snapshot import next_poll_time as snapshot_poll_time
 from ..config import config
 from ..models import Symbol
 from ..db import Session, FtScores
@@ -37,51 +47,66 @@ class TradingEngine(object):
         self,
         model_path: str = config["modelLocation"],
         sym: Symbol = Symbol(base="BTC", quote="USDT"),
+        model_name: str = config["modelName"],
+        model_version: str = config["modelVersion"],
     ):
-        self.model = DirectReinforcementModel.from_json(model_path)
+        registry.register(model_name, model_version, model_path)
+        self.model_name = model_name
+        self.model_version = model_version
         self.model_path = model_path
-        log.info(f"Loaded model: {self.model_path}")
+        log.info("Loaded model: %s", self.model_path)
         self.client = TradingClient()
         self.sym = sym
+        self.state = EngineStateWriter()
+        self.last_signal = None
+        self.last_ft = None
+        self.position = None
+        self.prepared = None
+        self.book_stream = None
+        self.snapshots = SnapshotStore()
+        self.snapshot_key = snapshot_key(
+            sym.conc(), config["interval"], model_name, model_version
+        )
+        # the book is only used to size orders, so only kept if we place them
+        if config["useOrderBook"] and config["execute_strat"]:
+            self.book_stream = OrderBookStream(self.client, sym.conc())
+            self.client.books[sym.conc()] = self.book_stream.book
+
+    @property
+    def model(self) -> DirectReinforcementModel:
+        # always go through the registry so a changed model file is picked up
+        return registry.get(self.model_name, self.model_version)
 
     def run_trading_loop(self):
 
-        next_poll_time = None
-        log.info(f"Entering trading loop")
+        # a valid snapshot means nothing changed since the last iteration
+        # so the first one can wait for the next candle like any other
+        next_poll_time = self.warm_start()
+        if self.book_stream is not None:
+            self.book_stream.start()
+        log.info("Entering trading loop")
         while True:
-            log.debug("Fetching candles")
-            df = self.client.df_candles(self.sym, interval=config["interval"])
-            log.debug(f"got {len(df)} candles")
-            close_price_series = df["close"].astype(float)
-            # log.info(close_price_series)
-            last_index = df.index[
-                -2
-            ]  # it's two because the current one is an open window
-            last_close = (
-                df["closeTime"][last_index] / 1000
-            )  # accoutn for multiplied timestamps
-
-            log.debug(f"{last_close=}")
-            log.info(
-                f"last_close in iso: {datetime.datetime.fromtimestamp(last_close).isoformat()}"
-            )
-            next_poll_time = last_close + config["validIntervals"][config["interval"]]
-            log.debug(f"{next_poll_time=}")
-            log.info(
-                f"next_poll_time in iso: {datetime.datetime.fromtimestamp(next_poll_time).isoformat()}"
-            )
-
-            # exe strat
-            if config['execute_strat']:
-                self.futures_strategy(close_price_series)
+            if next_poll_time is None:
+                try:
+                    next_poll_time = self.run_iteration()
+                except Exception as e:
+                    # keep the engine up, the next iteration may well succeed
+                    log.exception("Trading loop iteration failed")
+                    self.state.update(
+                        lastError=f"{datetime.datetime.now().isoformat()}: {e}"
+                    )
+                    time.sleep(config["sleepInterval"])
+                    continue
             last_ping = time.time()
             while (
                 time.time() < next_poll_time + 10
             ):  # plus 10 to allow for candle update on Binance
-                log.debug(
-                    f"Waiting next poll time at {datetime.datetime.fromtimestamp(next_poll_time+10)}"
-                )
-                log.debug(f"Last checked: {datetime.datetime.now().isoformat()}")
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug(
+                        "Waiting next poll time at %s",
+                        datetime.datetime.fromtimestamp(next_poll_time + 10),
+                    )
+                    log.debug("Last checked: %s", datetime.datetime.now().isoformat())
 
                 # say hello to stay alive
                 if time.time() - last_ping > 300:
@@ -90,49 +115,286 @@ class TradingEngine(object):
                         last_ping = time.time()
                         requests.get("https://botsorted.herokuapp.com/ping")
 
+                self.state.heartbeat()
                 time.sleep(config["sleepInterval"])
+            next_poll_time = None
 
-    def futures_strategy(self, close_price_series: pd.Series):
-        log.info("Checking for signal")
-        signal, Ft = self.model.get_signal(close_price_series)
-        log.info(f"{Ft=}")
-        log.info(f"{signal=}")
-        last_index = close_price_series.index[-1]
-        current_price = close_price_series[last_index]
+    def run_iteration(self) -> float:
+        """
+        Fetch candles, run the strategy and publish state.
+        Returns the next poll time
+        """
+        log.debug("Fetching candles")
+        df = self.client.df_candles(self.sym, interval=config["interval"])
+        log.debug("got %d candles", len(df))
+        close_price_series = df["close"].astype(float)
+        # log.info(close_price_series)
+        last_index = df.index[-2]  # it's two because the current one is an open window
+        last_close = (
+            df["closeTime"][last_index] / 1000
+        )  # accoutn for multiplied timestamps
 
-        # work out what position we already have
-        current_position = self.client.get_current_position(self.sym.conc())
+        log.debug("last_close=%s", last_close)
+        log.info(
+            "last_close in iso: %s",
+            datetime.datetime.fromtimestamp(last_close).isoformat(),
+        )
+        next_poll_time = last_close + config["validIntervals"][config["interval"]]
+        log.debug("next_poll_time=%s", next_poll_time)
+        log.info(
+            "next_poll_time in iso: %s",
+            datetime.datetime.fromtimestamp(next_poll_time).isoformat(),
+        )
 
-        if signal == "BUY" and current_position != "long":
-            log.info(f"OPENING POSITION: long from {current_position}")
+        key = feature_key(
+            self.sym.conc(),
+            config["interval"],
+            df["closeTime"].iloc[-1],
+            close_price_series.values,
+        )
+        # exe strat
+        if config['execute_strat']:
+            self.futures_strategy(close_price_series, key, df)
+        else:
+            # still published and snapshotted, just not traded on
+            signal, Ft, _ = self.decide(df, close_price_series, key)
+            self.last_signal, self.last_ft = signal, float(Ft)
+        self.prepare_next(df, close_price_series, key)
+        self.publish_state(df, close_price_series, next_poll_time, key)
+        self.save_snapshot(int(df["closeTime"][last_index]))
+        return next_poll_time
 
-            if current_position:
-                # close existing short
-                log.info("Closing short position")
-                self.try_call(
-                    0, "CLOSE POSITION", self.client.close_position, self.sym.conc()
-                )
+    def save_snapshot(self, last_candle_time: int) -> None:
+        state = self.state.state
+        try:
+            self.snapshots.save(
+                self.snapshot_key,
+                {
+                    "modelSha1": registry.info(self.model_name, self.model_version)[
+                        "sha1"
+                    ],
+                    "lastCandleTime": last_candle_time,
+                    "lastSignal": self.last_signal,
+                    "lastFt": self.last_ft,
+                    "position": self.position,
+                    "closeTime": state["closeTime"],
+                    "close": state["close"],
+                    "ft": state["ft"],
+                    "shadowSignals": state["shadowSignals"],
+                },
+            )
+        except Exception:
+            # only costs a cold start next time
+            log.exception("Failed to save engine snapshot")
 
-            log.info("Opening long position")
-            self.try_call(0, "OPEN LONG", self.client.open_long, self.sym)
-            log.info("TRADE COMPLETED SUCCESSFULLY")
+    def warm_start(self) -> Optional[float]:
+        """
+        Restore from the last snapshot if it's still valid.
+        Returns the next poll time if restored, None to start cold
+        """
+        if not config["warmRestart"]:
+            return None
+        try:
+            snapshot = self.snapshots.load(self.snapshot_key)
+            if snapshot is None:
+                log.info("No engine snapshot for %s, starting cold", self.snapshot_key)
+                return None
+            candles = self.client.df_candles(
+                self.sym, interval=config["interval"], limit=2
+            )
+            # the last candle is still open
+            last_candle_time = int(candles["closeTime"].iloc[-2])
+            position = snapshot["position"]
+            if config["execute_strat"]:
+                position = self.client.get_current_position(self.sym.conc())
+            ok, reason = validate_snapshot(
+                snapshot,
+                registry.info(self.model_name, self.model_version)["sha1"],
+                last_candle_time,
+                position,
+            )
+        except Exception:
+            log.exception("Could not check engine snapshot, starting cold")
+            return None
+        if not ok:
+            log.info("Engine snapshot not used, starting cold: %s", reason)
+            return None
 
-        elif signal == "SELL" and current_position != "short":
-            log.info(f"OPENING POSITION: short from {current_position}")
+        self.last_signal = snapshot["lastSignal"]
+        self.last_ft = snapshot["lastFt"]
+        self.position = snapshot["position"]
+        next_poll_time = snapshot_poll_time(last_candle_time)
+        now = time.time()
+        self.state.update(
+            symbol=self.sym.conc(),
+            interval=config["interval"],
+            modelName=self.model_name,
+            modelVersion=self.model_version,
+            closeTime=snapshot["closeTime"],
+            close=snapshot["close"],
+            ft=snapshot["ft"],
+            signal=self.last_signal,
+            lastFt=self.last_ft,
+            position=self.position,
+            shadowSignals=snapshot["shadowSignals"],
+            nextPollTime=next_poll_time,
+            lastLoopAt=now,
+        )
+        self.state.heartbeat()
+        log.info(
+            "Restored engine from snapshot, next poll at %s",
+            datetime.datetime.fromtimestamp(next_poll_time).isoformat(),
+        )
+        return next_poll_time
 
-            if current_position:
-                # close existing long
-                log.info("Closing long position")
-                self.try_call(
-                    0, "CLOSE POSITION", self.client.close_position, self.sym.conc()
+    def publish_state(
+        self,
+        df: pd.DataFrame,
+        close_price_series: pd.Series,
+        next_poll_time: float,
+        key=None,
+    ):
+        tail = config["chartTail"]
+        # the live model and every other registered model are evaluated
+        # in one batched pass, the others as shadows that never trade
+        entries = registry.models()
+        all_fts = batch_Ft([m for _, _, m in entries], close_price_series.values, key)
+        fts, shadows = None, []
+        for (name, version, _), Ft in zip(entries, all_fts):
+            if (name, version) == (self.model_name, self.model_version):
+                fts = Ft
+            else:
+                shadows.append(
+                    {
+                        "modelName": name,
+                        "modelVersion": version,
+                        "signal": "SELL" if Ft[-1] < 0 else "BUY",
+                        "lastFt": float(Ft[-1]),
+                    }
                 )
+        flip = {}
+        if self.prepared is not None:
+            threshold = self.prepared["threshold"]
+            flip = {
+                "flipPrice": threshold.price,
+                "buyAbove": threshold.buyAbove,
+                # what the open candle would give if it closed at its last price
+                "intrabarSignal": threshold.signal_at(
+                    float(close_price_series.iloc[-1])
+                )[0],
+            }
+        now = time.time()
+        self.state.update(
+            symbol=self.sym.conc(),
+            interval=config["interval"],
+            modelName=self.model_name,
+            modelVersion=self.model_version,
+            closeTime=df["closeTime"].tail(tail).astype(int).tolist(),
+            close=close_price_series.tail(tail).tolist(),
+            # aligned with close, the first close has no return so no Ft
+            ft=np.r_[0.0, fts][-tail:].tolist(),
+            signal=self.last_signal,
+            lastFt=self.last_ft,
+            position=self.position,
+            shadowSignals=shadows,
+            **flip,
+            nextPollTime=next_poll_time,
+            lastLoopAt=now,
+        )
+        self.state.heartbeat()
+
+    def order_path(
+        self, signal: str, current_position: Optional[str]
+    ) -> List[Tuple[str, Callable, tuple]]:
+        """
+        (action, method, args) calls taking current_position to the one
+        signal asks for, empty if it's already held
+        """
+        target = "long" if signal == "BUY" else "short"
+        if current_position == target:
+            return []
+        path = []
+        if current_position:
+            path.append(
+                ("CLOSE POSITION", self.client.close_position, (self.sym.conc(),))
+            )
+        if target == "long":
+            path.append(("OPEN LONG", self.client.open_long, (self.sym,)))
+        else:
+            path.append(("OPEN SHORT", self.client.open_short, (self.sym,)))
+        return path
+
+    def prepare_next(self, df: pd.DataFrame, close_price_series: pd.Series, key=None):
+        """
+        While the last candle is still open, work out the close it flips
+        the signal at and the orders for either side of it, so at the
+        close the decision is one comparison and the orders are ready
+        """
+        threshold = self.model.signal_threshold(close_price_series, cache_key=key)
+        self.prepared = {
+            "openTime": int(df["openTime"].iloc[-1]),
+            "model": self.model,
+            "threshold": threshold,
+            "position": self.position,
+            "paths": {s: self.order_path(s, self.position) for s in ("BUY", "SELL")},
+        }
+        log.info(
+            "Signal flips at a close of %s (BUY %s)",
+            threshold.price,
+            "above" if threshold.buyAbove else "below",
+        )
+
+    def decide(self, df: pd.DataFrame, close_price_series: pd.Series, key=None):
+        """
+        (signal, Ft, prepared) for the candle that just closed, from the
+        threshold prepared while it was open if there is one for it
+        """
+        prepared = self.prepared
+        closed = df.iloc[-2]
+        if (
+            prepared is not None
+            and prepared["openTime"] == int(closed["openTime"])
+            and prepared["model"] is self.model
+        ):
+            signal, Ft = prepared["threshold"].signal_at(float(closed["close"]))
+            return signal, Ft, prepared
+        signal, Ft = self.model.get_signal(close_price_series, cache_key=key)
+        return signal, Ft, None
+
+    def futures_strategy(
+        self, close_price_series: pd.Series, key=None, df: pd.DataFrame = None
+    ):
+        log.info("Checking for signal")
+        if df is not None:
+            signal, Ft, prepared = self.decide(df, close_price_series, key)
+        else:
+            signal, Ft = self.model.get_signal(close_price_series, cache_key=key)
+            prepared = None
+        log.info("Ft=%s", Ft)
+        log.info("signal=%s", signal)
+        self.last_signal, self.last_ft = signal, float(Ft)
+        last_index = close_price_series.index[-1]
+        current_price = close_price_series[last_index]
+
+        # work out what position we already have
+        current_position = self.client.get_current_position(self.sym.conc())
+        self.position = current_position
 
-            log.info("Opening short position")
-            self.try_call(0, "OPEN SHORT", self.client.open_short, self.sym)
+        if prepared is not None and prepared["position"] == current_position:
+            path = prepared["paths"][signal]
+        else:
+            path = self.order_path(signal, current_position)
 
+        if path:
+            target = "long" if signal == "BUY" else "short"
+            log.info("OPENING POSITION: %s from %s", target, current_position)
+            for action, method, args in path:
+                log.info(action)
+                self.try_call(0, action, method, *args)
+            self.position = target
             log.info("TRADE COMPLETED SUCCESSFULLY")
         else:
-            log.info(f"Holding current {current_position} position")
+            log.info("Holding current %s position", current_position)
 
         # log values to db
         try:
@@ -148,22 +410,36 @@ class TradingEngine(object):
             sess.commit()
             sess.close()
         except Exception:
-            log.error(f"Failed to save {signal=} with Ft={round(Ft,15)} to db.")
+            log.exception("Failed to save signal=%s with Ft=%.15f to db.", signal, Ft)
 
     def try_call(self, try_no, action_msg: str, method, *args, **kwargs):
         if try_no > config["tradeCallMaxRetries"]:
             log.error("TOTAL FAIL - abandoning")
             raise TradingEngineException(f"Could not execute {action_msg}")
-        resp = method(*args, **kwargs)
+        try:
+            resp = method(*args, **kwargs)
+        except PartialFillException as e:
+            log.error("%s PARTIALLY FILLED - %s", action_msg, e)
+            log.error("Trying again with the remaining %s", e.remaining)
+            time.sleep(config["tradeCallWaitTimeSeconds"])
+            # what filled stays filled, only the rest of the order is retried
+            return self.try_call(
+                try_no + 1,
+                action_msg,
+                self.client.market_order,
+                e.sym,
+                e.side,
+                e.remaining,
+            )
         if not (resp.status_code > 199 and resp.status_code < 300):
-            log.error(f"{action_msg} FAILED - api return: {resp.json()}")
+            log.error("%s FAILED - api return: %s", action_msg, resp.text)
             log.error("Trying again")
 
             try_no += 1
             time.sleep(config["tradeCallWaitTimeSeconds"])
             return self.try_call(try_no, action_msg, method, *args, **kwargs)
         else:
-            log.info(f"{action_msg} SUCCESS - api returned: {resp.json()}")
+            log.info("%s SUCCESS - api returned: %s", action_msg, resp.text)
             return True
 
     def buy_spot_strategy(self, close_price_series: pd.Series):
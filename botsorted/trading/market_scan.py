@@ -0,0 +1,185 @@
+"""
+Scans every USDT margined perpetual with the registered models on each
+candle close.
+
+Candles for the whole universe are fetched concurrently under the shared
+API weight budget. Symbols with the same number of candles are stacked
+into one (symbols, T) array so each model's Ft runs over all of them at
+once. The result is a table of the latest Ft of every symbol and model,
+ranked by Ft and flagging where the signal changed on this candle,
+written atomically to marketScanFile for the web tier to serve.
+"""
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Thread
+from typing import Dict, List, Optional, Tuple
+import json
+import os
+import time
+
+import numpy as np
+
+from ..binance.conn import weight_budget
+from ..binance.futures import FuturesClient
+from ..config import config
+from ..logger import get_logger
+from ..ml.batch import batch_Ft_rows
+from ..ml.registry import registry
+from .resample import WEEK_OFFSET_MS
+
+log = get_logger(__name__)
+
+# how long after the close to scan, so the exchange has rolled the candle
+CLOSE_DELAY_SECONDS = 2
+
+
+def klines_weight(limit: int) -> int:
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit <= 1000:
+        return 5
+    return 10
+
+
+class MarketScanner(object):
+    def __init__(
+        self,
+        client: FuturesClient = None,
+        interval: str = config["interval"],
+        candles: int = config["marketScanCandles"],
+        workers: int = config["marketScanWorkers"],
+        path: str = config["marketScanFile"],
+    ):
+        self.client = client or FuturesClient()
+        self.interval = interval
+        self.candles = candles
+        self.workers = workers
+        self.path = path
+        self._stop = Event()
+        self._thread: Optional[Thread] = None
+
+    def _fetch(self, symbol: str) -> Optional[Tuple[np.ndarray, int]]:
+        """
+        (closes, close time of the last closed candle) of symbol, None if
+        the call failed so one bad symbol doesn't sink the scan
+        """
+        weight_budget.acquire(klines_weight(self.candles))
+        try:
+            resp = self.client.get_candles(
+                symbol=symbol, interval=self.interval, limit=self.candles
+            )
+        except Exception as e:
+            log.error("candles for %s failed: %s", symbol, e)
+            return None
+        if not (resp.status_code > 199 and resp.status_code < 300):
+            log.error("candles for %s failed: %s", symbol, resp.text)
+            return None
+        klines = resp.json()
+        if len(klines) < 2:
+            return None
+        # kline rows are [openTime, open, high, low, close, volume, closeTime, ...]
+        closes = np.fromiter((float(k[4]) for k in klines), np.float64, len(klines))
+        return closes, int(klines[-2][6])
+
+    def fetch_all(self, symbols: List[str]) -> Dict[str, Tuple[np.ndarray, int]]:
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            results = pool.map(self._fetch, symbols)
+            return {s: r for s, r in zip(symbols, results) if r is not None}
+
+    @staticmethod
+    def evaluate(
+        candles: Dict[str, Tuple[np.ndarray, int]], models: List[tuple]
+    ) -> List[dict]:
+        """
+        Latest Ft of every (name, version, model) in models for every
+        symbol, ranked by Ft, longs first
+        """
+        by_length = defaultdict(list)
+        for symbol, (closes, _) in candles.items():
+            by_length[len(closes)].append(symbol)
+
+        rows = []
+        for symbols in by_length.values():
+            closes = np.stack([candles[s][0] for s in symbols])
+            diffs = np.diff(closes, axis=1)
+            for name, version, mod in models:
+                theta = np.asarray(mod.theta, dtype=np.float64)
+                if diffs.shape[1] <= len(theta) - 2:
+                    continue  # not enough history for this model
+                Ft = batch_Ft_rows(diffs, theta, mod.mean, mod.std)
+                for i, symbol in enumerate(symbols):
+                    ft, prev = Ft[i, -1], Ft[i, -2]
+                    rows.append(
+                        {
+                            "symbol": symbol,
+                            "modelName": name,
+                            "modelVersion": version,
+                            "ft": round(float(ft), 6),
+                            "signal": "SELL" if ft < 0 else "BUY",
+                            "signalChanged": bool((ft < 0) != (prev < 0)),
+                            "close": float(closes[i, -1]),
+                            "lastCandleTime": candles[symbol][1],
+                        }
+                    )
+        rows.sort(key=lambda r: r["ft"], reverse=True)
+        return rows
+
+    def scan(self, models: List[tuple] = None) -> dict:
+        start = time.time()
+        models = models if models is not None else registry.models()
+        symbols = self.client.usdt_perpetuals()
+        candles = self.fetch_all(symbols)
+        fetched = time.time()
+        rows = self.evaluate(candles, models)
+        result = {
+            "interval": self.interval,
+            "scannedAt": start,
+            "symbols": len(candles),
+            "failed": len(symbols) - len(candles),
+            "fetchSeconds": round(fetched - start, 3),
+            "totalSeconds": round(time.time() - start, 3),
+            "rows": rows,
+        }
+        self.write(result)
+        log.info(
+            "Market scan of %d symbols done in %.2fs (%.2fs fetching)",
+            len(candles),
+            result["totalSeconds"],
+            result["fetchSeconds"],
+        )
+        return result
+
+    def write(self, result: dict) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(result, f)
+        os.replace(tmp, self.path)
+
+    def _seconds_to_next_close(self) -> float:
+        period = config["validIntervals"][self.interval]
+        offset = WEEK_OFFSET_MS / 1000 if self.interval == "1w" else 0
+        now = time.time()
+        next_close = ((now - offset) // period + 1) * period + offset
+        return next_close - now + CLOSE_DELAY_SECONDS
+
+    def _run(self):
+        while not self._stop.wait(self._seconds_to_next_close()):
+            try:
+                self.scan()
+            except Exception:
+                log.exception("Market scan failed")
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = Thread(target=self._run, name="market-scanner", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
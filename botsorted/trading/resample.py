@@ -0,0 +1,200 @@
+"""
+Derives candles for any higher interval from one base interval series
+per symbol, so a single feed of (e.g.) 1m candles serves every timeframe.
+
+Buckets are aligned the way Binance aligns its klines: to multiples of
+the interval since the unix epoch in UTC, except weeks which start on
+Monday 00:00 UTC. New base bars are aggregated in one vectorized pass per
+interval and a "bar closed" callback is fired for each derived bar that
+completes.
+"""
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+import pandas as pd
+
+from ..config import config
+from ..logger import get_logger
+
+log = get_logger(__name__)
+
+FIELDS = ["openTime", "open", "high", "low", "close", "volume"]
+
+# 1970-01-01 was a Thursday, binance weeks start on the Monday after
+WEEK_OFFSET_MS = 4 * 86400000
+
+BarClosedCallback = Callable[[str, str, dict], None]
+
+
+class ResampleException(Exception):
+    pass
+
+
+def interval_ms(interval: str) -> int:
+    return config["validIntervals"][interval] * 1000
+
+
+def bucket_starts(open_times: np.ndarray, interval: str) -> np.ndarray:
+    ms = interval_ms(interval)
+    offset = WEEK_OFFSET_MS if interval == "1w" else 0
+    return (open_times - offset) // ms * ms + offset
+
+
+def aggregate(bars: Dict[str, np.ndarray], interval: str) -> Dict[str, np.ndarray]:
+    """
+    OHLCV of bars (time ordered base bars) grouped into interval buckets.
+    Also returns lastOpenTime, the open time of the last base bar in each
+    bucket, to tell whether a bucket is complete
+    """
+    buckets = bucket_starts(bars["openTime"], interval)
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)] - 1
+    return {
+        "openTime": buckets[starts],
+        "open": bars["open"][starts],
+        "high": np.maximum.reduceat(bars["high"], starts),
+        "low": np.minimum.reduceat(bars["low"], starts),
+        "close": bars["close"][ends],
+        "volume": np.add.reduceat(bars["volume"], starts),
+        "lastOpenTime": bars["openTime"][ends],
+    }
+
+
+class CandleResampler(object):
+    def __init__(
+        self,
+        base_interval: str = "1m",
+        intervals: List[str] = None,
+        max_bars: int = 5000,
+    ):
+        """
+        max_bars bounds how many base and derived bars are kept per series
+        """
+        self.base_interval = base_interval
+        self.base_ms = interval_ms(base_interval)
+        self.intervals = intervals or []
+        for iv in self.intervals:
+            ms = interval_ms(iv)
+            if ms <= self.base_ms or ms % self.base_ms:
+                raise ResampleException(
+                    f"{iv} is not a multiple of the base interval {base_interval}"
+                )
+        self.max_bars = max_bars
+        # symbol -> columns of closed base bars
+        self.base: Dict[str, Dict[str, np.ndarray]] = {}
+        # (symbol, interval) -> columns of closed derived bars
+        self.derived: Dict[Tuple[str, str], Dict[str, np.ndarray]] = {}
+        # (symbol, interval) -> the derived bar still being built
+        self.partial: Dict[Tuple[str, str], dict] = {}
+        self._callbacks: List[BarClosedCallback] = []
+
+    def on_bar_closed(self, callback: BarClosedCallback) -> None:
+        self._callbacks.append(callback)
+
+    def _emit(self, symbol: str, interval: str, bar: dict) -> None:
+        for cb in self._callbacks:
+            try:
+                cb(symbol, interval, bar)
+            except Exception:
+                log.exception("bar closed callback failed for %s %s", symbol, interval)
+
+    @staticmethod
+    def _append(store: dict, key, cols: Dict[str, np.ndarray], max_bars: int):
+        if key in store:
+            cols = {k: np.concatenate([store[key][k], v]) for k, v in cols.items()}
+        store[key] = {k: v[-max_bars:] for k, v in cols.items()}
+
+    def add_bars(self, symbol: str, bars: Dict[str, np.ndarray]) -> None:
+        """
+        Add closed base bars (columns as in FIELDS, ordered by openTime).
+        Bars at or before the last one already held are ignored
+        """
+        bars = {
+            k: np.asarray(bars[k], dtype=np.int64 if k == "openTime" else np.float64)
+            for k in FIELDS
+        }
+        if symbol in self.base and len(bars["openTime"]):
+            new = bars["openTime"] > self.base[symbol]["openTime"][-1]
+            bars = {k: v[new] for k, v in bars.items()}
+        if not len(bars["openTime"]):
+            return
+        self._append(self.base, symbol, bars, self.max_bars)
+        for iv in self.intervals:
+            self._resample(symbol, iv, bars)
+
+    def _resample(self, symbol: str, interval: str, bars: Dict[str, np.ndarray]):
+        key = (symbol, interval)
+        agg = aggregate(bars, interval)
+        partial = self.partial.pop(key, None)
+        if partial is not None:
+            if agg["openTime"][0] == partial["openTime"]:
+                agg["open"][0] = partial["open"]
+                agg["high"][0] = max(agg["high"][0], partial["high"])
+                agg["low"][0] = min(agg["low"][0], partial["low"])
+                agg["volume"][0] += partial["volume"]
+            else:
+                # a gap in the base bars, the partial bar can't get any more
+                self._close(key, {k: np.array([v]) for k, v in partial.items()})
+
+        # only the last bucket can still be open: it's closed once it
+        # holds the base bar that ends exactly on the bucket's end
+        last = len(agg["openTime"]) - 1
+        complete = (
+            agg["lastOpenTime"][last] + self.base_ms
+            >= agg["openTime"][last] + interval_ms(interval)
+        )
+        n_closed = last + 1 if complete else last
+        if n_closed:
+            self._close(key, {k: v[:n_closed] for k, v in agg.items()})
+        if not complete:
+            self.partial[key] = {k: v[last].item() for k, v in agg.items()}
+
+    def _close(self, key: Tuple[str, str], cols: Dict[str, np.ndarray]) -> None:
+        cols = {k: cols[k] for k in FIELDS}
+        self._append(self.derived, key, cols, self.max_bars)
+        for i in range(len(cols["openTime"])):
+            self._emit(key[0], key[1], {k: v[i].item() for k, v in cols.items()})
+
+    def add_candles_df(self, symbol: str, df: pd.DataFrame) -> None:
+        """
+        Add the closed bars of a frame from TradingClient.df_candles,
+        the last row being the still open candle
+        """
+        df = df.iloc[:-1]
+        self.add_bars(
+            symbol,
+            {
+                k: df[k].to_numpy(dtype=np.int64 if k == "openTime" else np.float64)
+                for k in FIELDS
+            },
+        )
+
+    def feed_from_client(self, client, sym, limit: int = 1500) -> None:
+        """
+        Pull any new base candles for sym through a TradingClient, the
+        one fetch path every derived interval is then built from
+        """
+        startTime = None
+        if sym.conc() in self.base:
+            startTime = int(self.base[sym.conc()]["openTime"][-1]) + self.base_ms
+        df = client.df_candles(
+            sym, interval=self.base_interval, limit=limit, startTime=startTime
+        )
+        self.add_candles_df(sym.conc(), df)
+
+    def candles(
+        self, symbol: str, interval: str, include_partial: bool = False
+    ) -> pd.DataFrame:
+        if interval == self.base_interval:
+            cols = self.base.get(symbol)
+        else:
+            cols = self.derived.get((symbol, interval))
+        df = pd.DataFrame(cols if cols else {k: [] for k in FIELDS})
+        partial = self.partial.get((symbol, interval))
+        if include_partial and partial is not None:
+            df = pd.concat(
+                [df, pd.DataFrame([{k: partial[k] for k in FIELDS}])],
+                ignore_index=True,
+            )
+        ms = interval_ms(interval)
+        df["closeTime"] = df.openTime + ms - 1
+        return df
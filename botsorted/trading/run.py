@@ -0,0 +1,50 @@
+"""
+Runs the trading engine and the odds scanners as their own process,
+separate from the web workers which only read the state they publish:
+
+    python -m botsorted.trading.run
+
+The files they publish are read by the web tier, so it runs on the same
+host: botsorted.serve starts both.
+"""
+import os
+
+from ..config import config
+from ..fred.arb import arb_engine
+from ..fred.scanner import tennis_scanner
+from ..logger import get_logger
+from ..ml.registry import register_configured_models
+from .engine import TradingEngine
+from .market_scan import MarketScanner
+
+log = get_logger(__name__)
+
+
+def main():
+    if config["profilingEnabled"]:
+        from ..bsutils.profiling import install_dump_signal
+
+        if install_dump_signal(config["profilingDumpFile"], config["profilingDumpSeconds"]):
+            log.info(
+                "kill -USR1 %d to write a profile to %s",
+                os.getpid(),
+                config["profilingDumpFile"],
+            )
+    if not config["tennisScanInWeb"]:
+        tennis_scanner.start()
+        if config["arbScanEnabled"]:
+            arb_engine.start()
+    if not config["runTrader"]:
+        log.info("runTrader is off, not starting the trading engine")
+        # keep the scanner going if it's the only thing this process runs
+        tennis_scanner.join()
+        return
+    register_configured_models()
+    if config["marketScanEnabled"]:
+        MarketScanner().start()
+    trader = TradingEngine(model_path=config["modelLocation"])
+    trader.run_trading_loop()
+
+
+if __name__ == "__main__":
+    main()
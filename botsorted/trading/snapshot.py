@@ -0,0 +1,74 @@
+"""
+Warm restart snapshots of the trading engine.
+
+After each iteration the engine saves a compact snapshot: the tail of
+closes and Ft values it publishes, the last Ft and signal, the position
+it holds, the close time of the last candle it processed and the sha1 of
+the model file. Snapshots live in the database rather than on disk as
+dyno filesystems don't survive a restart.
+
+On boot the snapshot is only trusted if the model is unchanged and two
+cheap exchange calls agree with it: no candle has closed since, and the
+account holds the position the snapshot says it does. Otherwise the
+engine starts cold as before.
+"""
+from typing import Optional, Tuple
+import datetime
+import json
+
+from ..config import config
+from ..db import Session, EngineSnapshots
+from ..logger import get_logger
+
+log = get_logger(__name__)
+
+
+def snapshot_key(symbol: str, interval: str, model_name: str, model_version: str) -> str:
+    return f"{symbol}:{interval}:{model_name}:{model_version}"
+
+
+class SnapshotStore(object):
+    def save(self, key: str, snapshot: dict) -> None:
+        sess = Session()
+        try:
+            sess.merge(
+                EngineSnapshots(
+                    snapshotKey=key,
+                    savedAt=datetime.datetime.now(),
+                    payload=json.dumps(snapshot, default=float),
+                )
+            )
+            sess.commit()
+        finally:
+            sess.close()
+
+    def load(self, key: str) -> Optional[dict]:
+        sess = Session()
+        try:
+            row = sess.query(EngineSnapshots).get(key)
+            return json.loads(row.payload) if row is not None else None
+        finally:
+            sess.close()
+
+
+def validate_snapshot(
+    snapshot: dict, model_sha: str, last_candle_time: int, position: Optional[str]
+) -> Tuple[bool, str]:
+    """
+    Whether snapshot can be resumed from, given the model file's sha1, the
+    close time of the exchange's latest closed candle and the position
+    currently held. The reason is returned for the log
+    """
+    if snapshot.get("modelSha1") != model_sha:
+        return False, "model file changed since the snapshot"
+    if snapshot.get("lastCandleTime") != last_candle_time:
+        return False, "a candle closed since the snapshot"
+    if snapshot.get("position") != position:
+        return False, (
+            f"snapshot position {snapshot.get('position')} but exchange has {position}"
+        )
+    return True, "ok"
+
+
+def next_poll_time(last_candle_time: int, interval: str = config["interval"]) -> float:
+    return last_candle_time / 1000 + config["validIntervals"][interval]
@@ -0,0 +1,111 @@
+"""
+State the trading engine publishes for the web tier.
+
+The engine runs in its own process and writes its latest candles, Ft
+values, position and health to a JSON file, replaced atomically on each
+write. Web workers only ever read it, so any number of them can run
+without starting another trader.
+
+The heartbeat the engine writes every sleepInterval goes to its own small
+file, so the state file (and everyone reading it) only changes when the
+state does.
+"""
+from typing import Optional
+import json
+import os
+import time
+
+from ..config import config
+from ..logger import get_logger
+
+log = get_logger(__name__)
+
+
+class EngineStateException(Exception):
+    pass
+
+
+def _write_json(path: str, data: dict) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f, default=float)
+    # readers see either the old or the new file, never half of one
+    os.replace(tmp, path)
+
+
+class EngineStateWriter(object):
+    def __init__(
+        self,
+        path: str = config["engineStateFile"],
+        heartbeat_path: str = config["engineHeartbeatFile"],
+    ):
+        self.path = path
+        self.heartbeat_path = heartbeat_path
+        self.state = {
+            "pid": os.getpid(),
+            "startedAt": time.time(),
+            "lastLoopAt": None,
+            "lastError": None,
+        }
+
+    def update(self, **kwargs) -> None:
+        self.state.update(kwargs)
+        self.write()
+
+    def heartbeat(self) -> None:
+        _write_json(self.heartbeat_path, {"pid": os.getpid(), "heartbeatAt": time.time()})
+
+    def write(self) -> None:
+        _write_json(self.path, self.state)
+
+
+class EngineStateReader(object):
+    """
+    Cached view of the engine's state file, only re-read when it changes
+    """
+
+    def __init__(
+        self,
+        path: str = config["engineStateFile"],
+        heartbeat_path: str = config["engineHeartbeatFile"],
+    ):
+        self.path = path
+        self.heartbeat_path = heartbeat_path
+        self._mtime = None
+        self._state: Optional[dict] = None
+
+    def read(self) -> dict:
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            raise EngineStateException("Trading engine has not published any state")
+        if mtime != self._mtime:
+            with open(self.path, "r") as f:
+                self._state = json.load(f)
+            self._mtime = mtime
+        return self._state
+
+    def heartbeat(self) -> dict:
+        try:
+            with open(self.heartbeat_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def health(self) -> dict:
+        try:
+            state = self.read()
+        except EngineStateException as e:
+            return {"healthy": False, "reason": str(e)}
+        age = time.time() - (self.heartbeat().get("heartbeatAt") or 0)
+        healthy = age < config["engineHeartbeatTimeoutSeconds"]
+        return {
+            "healthy": healthy,
+            "heartbeatAgeSeconds": round(age, 1),
+            "pid": state.get("pid"),
+            "lastLoopAt": state.get("lastLoopAt"),
+            "lastError": state.get("lastError"),
+        }
@@ -0,0 +1,256 @@
+"""
+Server sent events of the trading engine's state for the web tier.
+
+One poller per web process watches the engine's state file while anyone
+is connected. When an iteration changes what a viewer would see, it folds
+the latest bar into running totals and encodes a single small update:
+the latest candle, Ft, position and cumulative returns. The same bytes
+are queued for every connected client, so the work per candle doesn't
+grow with the number of viewers.
+
+Clients get a `snapshot` of the whole chart tail when they connect, then
+`update` events to patch the chart in place. An update with newCandle
+set also carries the final values of the bar that just closed. A fresh
+snapshot is broadcast instead when the updates can't be applied in
+place, e.g. the poller missed more than one candle.
+
+Cumulative returns are the chart's: relative close to close returns
+times the sign of Ft on the same bar, summed (see ml.analytics).
+"""
+from typing import AsyncIterator, Awaitable, Callable, Optional, Set, Tuple
+import asyncio
+import json
+
+import numpy as np
+
+from ..config import config
+from ..logger import get_logger
+from .state import EngineStateException, EngineStateReader
+
+log = get_logger(__name__)
+
+KEEPALIVE = b": keepalive\n\n"
+
+# state fields passed through to clients as they are
+PASSTHROUGH = (
+    "symbol",
+    "interval",
+    "modelName",
+    "modelVersion",
+    "signal",
+    "lastFt",
+    "position",
+    "flipPrice",
+    "buyAbove",
+    "intrabarSignal",
+    "nextPollTime",
+    "lastLoopAt",
+)
+
+
+def sse_message(event: str, data: dict, event_id=None) -> bytes:
+    lines = [f"event: {event}"]
+    if event_id is not None:
+        lines.append(f"id: {event_id}")
+    lines.append(f"data: {json.dumps(data, default=float)}")
+    return ("\n".join(lines) + "\n\n").encode()
+
+
+def bar_returns(close: np.ndarray, ft: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    (model, buy/hold) relative return of every bar but the first
+    """
+    hold = close[1:] / close[:-1] - 1
+    return hold * np.sign(ft[1:]), hold
+
+
+class EngineStateStream(object):
+    def __init__(
+        self,
+        reader: EngineStateReader = None,
+        poll_seconds: float = config["engineStreamPollSeconds"],
+        keepalive_seconds: float = config["engineStreamKeepaliveSeconds"],
+        queue_size: int = config["engineStreamQueueSize"],
+    ):
+        self.reader = reader or EngineStateReader()
+        self.poll_seconds = poll_seconds
+        self.keepalive_seconds = keepalive_seconds
+        self.queue_size = queue_size
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._task: Optional[asyncio.Future] = None
+        self._state: Optional[dict] = None
+        # what the last update showed, to skip writes that only heartbeat
+        self._shown = None
+        # cumulative (model, buy/hold) returns up to the last closed bar
+        self._closed = (0.0, 0.0)
+        self._snapshot: Optional[bytes] = None
+
+    def _current(self, close, ft) -> Tuple[float, float]:
+        """
+        cumulative returns including the open bar
+        """
+        hold = close[-1] / close[-2] - 1
+        return (
+            self._closed[0] + hold * float(np.sign(ft[-1])),
+            self._closed[1] + hold,
+        )
+
+    def _common(self, state: dict) -> dict:
+        return {k: state[k] for k in PASSTHROUGH if k in state}
+
+    def ingest(self, state: dict) -> Optional[bytes]:
+        """
+        Fold state, as read from the file, into the running totals.
+        Returns the message to broadcast, None if nothing a viewer would
+        see has changed
+        """
+        times, close, ft = state.get("closeTime"), state.get("close"), state.get("ft")
+        if not times or len(times) < 2:
+            return None
+        shown = (
+            times[-1],
+            close[-1],
+            ft[-1],
+            state.get("position"),
+            state.get("signal"),
+        )
+        if shown == self._shown:
+            return None
+        prev, self._state, self._shown = self._state, state, shown
+        self._snapshot = None
+
+        in_place = prev is not None
+        new_candle = in_place and prev["closeTime"][-1] != times[-1]
+        if prev is None or new_candle:
+            # bars closed since the last state, from where its open bar is now
+            start = None
+            if prev is not None and prev["closeTime"][-1] in times:
+                start = times.index(prev["closeTime"][-1])
+            if not start:
+                start, self._closed, in_place = 1, (0.0, 0.0), False
+            model, hold = bar_returns(
+                np.asarray(close[start - 1 : -1], dtype=np.float64),
+                np.asarray(ft[start - 1 : -1], dtype=np.float64),
+            )
+            self._closed = (
+                self._closed[0] + float(model.sum()),
+                self._closed[1] + float(hold.sum()),
+            )
+            in_place = in_place and start == len(times) - 2
+        if not in_place:
+            return self.snapshot()
+
+        modelReturns, buyHoldReturns = self._current(close, ft)
+        update = {
+            **self._common(state),
+            "closeTime": times[-1],
+            "close": close[-1],
+            "ft": ft[-1],
+            "pos": int(np.sign(ft[-1])),
+            "modelReturns": modelReturns,
+            "buyHoldReturns": buyHoldReturns,
+            "newCandle": new_candle,
+        }
+        if new_candle:
+            update["closed"] = {
+                "closeTime": times[-2],
+                "close": close[-2],
+                "ft": ft[-2],
+                "pos": int(np.sign(ft[-2])),
+                "modelReturns": self._closed[0],
+                "buyHoldReturns": self._closed[1],
+            }
+        return sse_message("update", update, times[-1])
+
+    def snapshot(self) -> Optional[bytes]:
+        """
+        The whole tail of the latest state, with cumulative returns that
+        end where the updates carry on from. Encoded once per state
+        """
+        if self._state is None:
+            return None
+        if self._snapshot is None:
+            state = self._state
+            close = np.asarray(state["close"], dtype=np.float64)
+            ft = np.asarray(state["ft"], dtype=np.float64)
+            model, hold = bar_returns(close, ft)
+            current = self._current(close, ft)
+            modelReturns = np.r_[0.0, np.cumsum(model)]
+            buyHoldReturns = np.r_[0.0, np.cumsum(hold)]
+            self._snapshot = sse_message(
+                "snapshot",
+                {
+                    **self._common(state),
+                    "closeTime": state["closeTime"],
+                    "close": state["close"],
+                    "ft": state["ft"],
+                    "pos": np.sign(ft).astype(np.int8).tolist(),
+                    "modelReturns": (
+                        modelReturns - modelReturns[-1] + current[0]
+                    ).tolist(),
+                    "buyHoldReturns": (
+                        buyHoldReturns - buyHoldReturns[-1] + current[1]
+                    ).tolist(),
+                },
+                state["closeTime"][-1],
+            )
+        return self._snapshot
+
+    def broadcast(self, message: bytes) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # too slow to keep up, it ends at its next keepalive and
+                # gets a fresh snapshot if it reconnects
+                log.warning("Dropping a stream client that fell behind")
+                self._subscribers.discard(queue)
+
+    async def _poll(self) -> None:
+        loop = asyncio.get_event_loop()
+        try:
+            while self._subscribers:
+                try:
+                    state = await loop.run_in_executor(None, self.reader.read)
+                    message = self.ingest(state)
+                    if message is not None:
+                        self.broadcast(message)
+                except EngineStateException:
+                    pass  # nothing published yet
+                except Exception:
+                    log.exception("Engine state stream poll failed")
+                await asyncio.sleep(self.poll_seconds)
+        finally:
+            self._task = None
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(self.queue_size)
+        self._subscribers.add(queue)
+        snapshot = self.snapshot()
+        if snapshot is not None:
+            queue.put_nowait(snapshot)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._poll())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    async def events(
+        self, is_disconnected: Callable[[], Awaitable[bool]]
+    ) -> AsyncIterator[bytes]:
+        """
+        Messages for one client until it disconnects or is dropped,
+        with a keepalive comment whenever it's been quiet for a while
+        """
+        queue = self.subscribe()
+        try:
+            while not await is_disconnected():
+                try:
+                    yield await asyncio.wait_for(queue.get(), self.keepalive_seconds)
+                except asyncio.TimeoutError:
+                    if queue not in self._subscribers:
+                        break
+                    yield KEEPALIVE
+        finally:
+            self.unsubscribe(queue)
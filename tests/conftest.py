@@ -0,0 +1,21 @@
+import os
+import sys
+
+# botsorted.config needs a deploy environment and tests run from a checkout
+os.environ.setdefault("DEPLOY_ENV", "LOCAL")
+# the clients and the db are created on import, never used for real here
+for var in (
+    "BINANCE_API_KEY",
+    "BINANCE_API_SECRET",
+    "BINANCE_TESTNET_API_KEY",
+    "BINANCE_TESTNET_API_SECRET",
+):
+    os.environ.setdefault(var, "test")
+os.environ.setdefault("HEROKU_POSTGRESQL_COBALT_URL", "sqlite://")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def fixture_path(name: str) -> str:
+    return os.path.join(FIXTURES, name)
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from botsorted.bsutils.viz import DataVisualiser
+from botsorted.ml import analytics
+from botsorted.ml.batch import batch_Ft
+from botsorted.ml.dr import DirectReinforcementModel
+
+
+def model(M=8, seed=0):
+    rng = np.random.RandomState(seed)
+    return DirectReinforcementModel(
+        theta=rng.randn(M + 2) * 0.5, mean=0.0, std=50.0, M=M, commission=0.001
+    )
+
+
+def candles(T=400, seed=1):
+    rng = np.random.RandomState(seed)
+    close = 30000 * np.exp(np.cumsum(rng.randn(T) * 0.01))
+    return pd.DataFrame(
+        {"close": close, "closeTime": np.arange(T, dtype=np.int64) * 86400000}
+    )
+
+
+def test_strategy_returns_holds_the_previous_position():
+    Ft = np.array([0.0, 1.0, 1.0, -1.0])
+    rets = np.array([0.0, 0.1, 0.2, -0.1])
+    R = analytics.strategy_returns(Ft, rets, commission=0.01)
+    np.testing.assert_allclose(R, [0.0 - 0.01, 0.2, -0.1 - 0.02])
+
+
+def test_metrics_scores_every_strategy_at_once():
+    rng = np.random.RandomState(2)
+    Ft = np.tanh(rng.randn(3, 100))
+    rets = rng.randn(100) * 0.01
+    stats = analytics.metrics(Ft, rets, np.array([0.0, 0.001, 0.002]))
+    for i in range(3):
+        one = analytics.metrics(Ft[i], rets, [0.0, 0.001, 0.002][i])
+        for name in analytics.METRICS:
+            assert stats[name][i] == pytest.approx(one[name])
+
+
+def test_perf_stats_total_return_is_the_charts_last_value():
+    data = candles()
+    mods = [model(8, seed=0), model(5, seed=3)]
+    close = data.close.to_numpy()
+    fts = batch_Ft(mods, close)
+    stats = DataVisualiser.perf_stats(
+        close, fts, [0.0, 0.0], start=min(mod.M for mod in mods) - 1
+    )
+    for mod, Ft, s in zip(mods, fts, stats):
+        series = DataVisualiser.perf_series(data, mod, tail=len(data), Ft=Ft)
+        assert s["totalReturn"] == pytest.approx(series["modelReturns"][-1], abs=1e-4)
+        assert s["commissionDrag"] == 0
+
+
+def test_perf_stats_matches_the_stream():
+    from botsorted.trading.stream import bar_returns
+
+    data = candles()
+    mod = model()
+    close = data.close.to_numpy()
+    (Ft,) = batch_Ft([mod], close)
+    (s,) = DataVisualiser.perf_stats(close, [Ft], [0.0], decimals=10)
+    model_rets, _ = bar_returns(close, np.r_[0.0, Ft])
+    assert s["totalReturn"] == pytest.approx(model_rets.sum())
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from botsorted.ml.batch import batch_Ft, batch_Ft_rows, batch_signals
+from botsorted.ml.dr import DirectReinforcementModel
+from botsorted.ml.features import feature_key
+
+
+def models():
+    rng = np.random.RandomState(0)
+    # two share M=5, one has its own M
+    return [
+        DirectReinforcementModel(
+            theta=rng.randn(M + 2), mean=rng.randn(), std=50 + 50 * i, M=M
+        )
+        for i, M in enumerate((5, 8, 5))
+    ]
+
+
+def closes(T=300, seed=1):
+    rng = np.random.RandomState(seed)
+    return 30000 * np.exp(np.cumsum(rng.randn(T) * 0.01))
+
+
+def one_at_a_time(mod, close):
+    return DirectReinforcementModel.calc_Ft(mod.get_x(pd.Series(close)), mod.theta)
+
+
+def test_batch_matches_each_model_alone():
+    close = closes()
+    for mod, Ft in zip(models(), batch_Ft(models(), close)):
+        np.testing.assert_allclose(Ft, one_at_a_time(mod, close), atol=1e-12)
+
+
+def test_batch_through_the_feature_cache():
+    close = closes()
+    key = feature_key("BTCUSDT", "1d", 123, close)
+    cached = batch_Ft(models(), close, key)
+    for mod, Ft in zip(models(), cached):
+        np.testing.assert_allclose(Ft, one_at_a_time(mod, close), atol=1e-12)
+
+
+def test_batch_signals_match_get_signal():
+    close = closes()
+    for mod, (signal, Ft) in zip(models(), batch_signals(models(), close)):
+        expected = mod.get_signal(pd.Series(close))
+        assert signal == expected[0]
+        assert Ft == pytest.approx(expected[1])
+
+
+def test_rows_match_each_series_alone():
+    mod = models()[1]
+    series = np.stack([closes(seed=s) for s in range(3)])
+    Fts = batch_Ft_rows(np.diff(series, axis=1), mod.theta, mod.mean, mod.std)
+    for close, Ft in zip(series, Fts):
+        np.testing.assert_allclose(Ft, one_at_a_time(mod, close), atol=1e-12)
+
+
+def test_series_shorter_than_the_lags():
+    mod = models()[1]
+    (Ft,) = batch_Ft([mod], closes(T=6))
+    np.testing.assert_array_equal(Ft, np.zeros(5))
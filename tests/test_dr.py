@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from botsorted.ml.dr import DirectReinforcementModel
+from botsorted.ml.optim import Adam, optimizer_from_state
+
+
+def series(T=420, phi=0.15, seed=0):
+    rng = np.random.RandomState(seed)
+    r = np.zeros(T)
+    e = rng.randn(T) * 0.02
+    for t in range(1, T):
+        r[t] = phi * r[t - 1] + e[t]
+    return pd.Series(10000 * np.exp(np.cumsum(r)))
+
+
+def train(mod=None, **kwargs):
+    mod = mod or DirectReinforcementModel()
+    close = series()
+    args = {"epochs": 300, "M": 5, "N": 300, "P": 100, "usingIpy": False}
+    args.update(kwargs)
+    mod.train(close, pd.Series(close.index), "test", **args)
+    return mod
+
+
+def test_early_stopping_after_patience():
+    mod = train(epochs=5000, patience=20, min_delta=1e-3)
+    hist = mod.train_history
+    assert hist["epochsRun"] < 5000
+    assert hist["epochsRun"] - hist["bestEpoch"] == 20
+
+
+def test_keeps_the_best_theta():
+    mod = train(epochs=200, patience=None, learning_rate=3.0)
+    sharpe = DirectReinforcementModel.train_sharpe(
+        mod.x_train, np.asarray(mod.theta), mod.commission
+    )
+    assert sharpe == pytest.approx(mod.train_history["bestSharpe"])
+    assert mod.train_history["epochsRun"] == 200
+
+
+def test_window_training_evaluates_the_full_set():
+    mod = train(epochs=100, window=60, eval_every=10, patience=None)
+    sharpe = DirectReinforcementModel.train_sharpe(
+        mod.x_train, np.asarray(mod.theta), mod.commission
+    )
+    assert sharpe == pytest.approx(mod.train_history["bestSharpe"])
+    assert mod.train_history["bestEpoch"] % 10 == 0
+
+
+def test_callback_stops_training():
+    seen = []
+
+    def stop_at_five(epoch, epochs, sharpe):
+        seen.append(epoch)
+        return epoch == 5
+
+    mod = train(callback=stop_at_five)
+    assert seen == [1, 2, 3, 4, 5]
+    assert mod.train_history["epochsRun"] == 5
+    assert len(mod.train_history["sharpes"]) == 0
+
+
+class RecordingAdam(Adam):
+    """
+    Adam keeping (theta, state_dict) before and after every step
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.before, self.after = [], []
+
+    def step(self, theta, grad):
+        self.before.append((np.array(theta), self.state_dict()))
+        theta = super().step(theta, grad)
+        self.after.append((np.array(theta), self.state_dict()))
+        return theta
+
+
+def test_saves_the_optimizer_state_of_the_best_theta():
+    opt = RecordingAdam(0.2)
+    mod = train(epochs=600, patience=30, optimizer=opt)
+    best = mod.train_history["bestEpoch"]
+    assert best < mod.train_history["epochsRun"]
+    # without a window the sharpe of epoch e scores theta before its step
+    theta, state = opt.before[best - 1]
+    np.testing.assert_array_equal(mod.theta, theta)
+    assert mod.optimizer == state
+    assert mod.optimizer != opt.state_dict()
+
+
+def test_saves_the_optimizer_state_of_the_best_theta_with_a_window():
+    opt = RecordingAdam(0.05)
+    mod = train(epochs=300, window=60, patience=None, optimizer=opt)
+    best = mod.train_history["bestEpoch"]
+    # with one the full sharpe is evaluated after the step
+    theta, state = opt.after[best - 1]
+    np.testing.assert_array_equal(mod.theta, theta)
+    assert mod.optimizer == state
+
+
+def test_resumes_from_the_saved_optimizer():
+    mod = train(epochs=100, optimizer=Adam(0.05), patience=None)
+    opt = optimizer_from_state(mod.optimizer)
+    assert opt.state_dict() == mod.optimizer
+    resumed = train(epochs=50, optimizer=opt, theta=mod.theta, patience=None)
+    assert resumed.train_history["bestSharpe"] >= mod.train_history["bestSharpe"] - 1e-4
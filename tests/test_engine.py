@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+
+from botsorted.config import config
+from botsorted.ml.dr import DirectReinforcementModel
+from botsorted.trading.engine import TradingEngine
+from botsorted.trading.state import EngineStateReader, EngineStateWriter
+
+DAY_MS = 86400000
+
+
+def candles(T=120, seed=0):
+    rng = np.random.RandomState(seed)
+    close = 30000 * np.exp(np.cumsum(rng.randn(T) * 0.01))
+    open_time = np.arange(T, dtype=np.int64) * DAY_MS
+    return pd.DataFrame(
+        {
+            "openTime": open_time,
+            "close": [f"{c:.2f}" for c in close],
+            "closeTime": open_time + DAY_MS - 1,
+        }
+    )
+
+
+def engine(tmp_path, monkeypatch) -> TradingEngine:
+    monkeypatch.setitem(config, "execute_strat", False)
+    path = str(tmp_path / "model.json")
+    rng = np.random.RandomState(1)
+    DirectReinforcementModel(
+        theta=rng.randn(10) * 0.5, mean=0.0, std=300.0, M=8, commission=0.001
+    ).save_model(path)
+    eng = TradingEngine(model_path=path, model_name="EngineTest", model_version="1.0")
+    eng.state = EngineStateWriter(
+        str(tmp_path / "state.json"), str(tmp_path / "heartbeat.json")
+    )
+    df = candles()
+    eng.client.df_candles = lambda sym, interval="1d", limit=500: df
+    return eng
+
+
+def test_iteration_publishes_the_signal_without_trading(tmp_path, monkeypatch):
+    eng = engine(tmp_path, monkeypatch)
+    eng.run_iteration()
+    close = candles().close.astype(float)
+    signal, Ft = eng.model.get_signal(close)
+    state = EngineStateReader(str(tmp_path / "state.json")).read()
+    assert state["signal"] == signal
+    assert state["lastFt"] == float(Ft)
+    assert state["position"] is None
+
+
+def test_snapshot_carries_the_signal_without_trading(tmp_path, monkeypatch):
+    eng = engine(tmp_path, monkeypatch)
+    saved = {}
+    eng.snapshots.save = lambda key, snapshot: saved.update(snapshot)
+    eng.run_iteration()
+    assert saved["lastSignal"] in ("BUY", "SELL")
+    assert eng.last_ft is not None
+    assert saved["lastFt"] == eng.last_ft
+
+
+def test_warm_start_resumes_from_the_last_iteration(tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "warmRestart", True)
+    first = engine(tmp_path, monkeypatch)
+    first.run_iteration()
+    published = EngineStateReader(str(tmp_path / "state.json")).read()
+
+    second = engine(tmp_path, monkeypatch)
+    second.state = EngineStateWriter(
+        str(tmp_path / "resumed.json"), str(tmp_path / "heartbeat.json")
+    )
+    last_candle_time = int(candles().closeTime.iloc[-2])
+    assert second.warm_start() == last_candle_time / 1000 + 86400
+    resumed = EngineStateReader(str(tmp_path / "resumed.json")).read()
+    for k in ("closeTime", "close", "ft", "signal", "lastFt"):
+        assert resumed[k] == published[k]
+
+
+def test_warm_start_goes_cold_after_a_new_candle(tmp_path, monkeypatch):
+    monkeypatch.setitem(config, "warmRestart", True)
+    engine(tmp_path, monkeypatch).run_iteration()
+    second = engine(tmp_path, monkeypatch)
+    df = candles(T=121)
+    second.client.df_candles = lambda sym, interval="1d", limit=500: df
+    assert second.warm_start() is None
+    assert second.last_signal is None
@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+
+from botsorted.fred.arb import evaluate, odds_matrix, parse_markets
+from conftest import fixture_path
+
+ROW = """
+<tr class="match-on" data-day="Monday">
+<td class="time">20:00</td>
+<td>{names}</td>
+{odds}
+</tr>
+"""
+
+
+def page(names, odds):
+    return "<table>{}</table>".format(
+        ROW.format(
+            names="".join(f'<p class="fixtures-bet-name">{n}</p>' for n in names),
+            odds="".join(f'<td class="basket-add">{o}</td>' for o in odds),
+        )
+    )
+
+
+def test_parse_markets_two_way():
+    with open(fixture_path("oddschecker_tennis.html"), "r") as f:
+        rows = parse_markets(f.read(), "tennis", "match-winner")
+    assert len(rows) == 5
+    assert rows[0]["outcomes"] == ["Daniil Medvedev", "Stefanos Tsitsipas"]
+    assert rows[0]["odds"] == ("6/4", "6/5")
+
+
+def test_parse_markets_names_every_outcome():
+    rows = parse_markets(page(["A", "B", "C"], ["2/1", "3/1", "4/1"]), "f", "m")
+    assert rows[0]["outcomes"] == ["A", "B", "C"]
+
+
+def test_parse_markets_1x2_draw():
+    rows = parse_markets(page(["Home", "Away"], ["6/4", "5/2", "6/5"]), "f", "m")
+    assert rows[0]["outcomes"] == ["Home", "Draw", "Away"]
+
+
+def test_parse_markets_skips_unmatched_names():
+    assert parse_markets(page(["A", "B"], ["2/1", "3/1", "4/1", "5/1"]), "f", "m") == []
+
+
+def test_evaluate_stakes_equalise_payout():
+    mat = odds_matrix([("6/4", "6/5"), ("1/4", "11/4", "")])
+    book, margin, stakes = evaluate(mat)
+    assert book[0] < 1
+    assert margin[0] == pytest.approx(1 / book[0] - 1)
+    payout = stakes[0, :2] * mat[0, :2]
+    assert payout == pytest.approx([payout[0]] * 2)
+    # a market with an unreadable price is never flagged
+    assert np.isnan(book[1])
@@ -0,0 +1,59 @@
+import pytest
+
+from botsorted.fred.scripts import parse_odds, parse_tennis_opportunities
+from conftest import fixture_path
+
+
+@pytest.fixture(scope="module")
+def tennis_html():
+    with open(fixture_path("oddschecker_tennis.html"), "r") as f:
+        return f.read()
+
+
+@pytest.mark.parametrize(
+    "odds,expected",
+    [("6/4", 1.5), ("11/10", 1.1), ("1/4", 0.25), ("100/30", 100 / 30), (" 2/1 ", 2.0), ("3", 3.0)],
+)
+def test_parse_odds_fractions(odds, expected):
+    assert parse_odds(odds) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("odds", ["EVS", "evs", "Evens", " evens "])
+def test_parse_odds_evens(odds):
+    assert parse_odds(odds) == 1.0
+
+
+@pytest.mark.parametrize("odds", ["", "SUSP", "N/A", "5/0", "-1/2", "2/-1", "1/2/3"])
+def test_parse_odds_bad_input(odds):
+    assert parse_odds(odds) is None
+
+
+def test_parse_tennis_opportunities_rows(tennis_html):
+    opps = parse_tennis_opportunities(tennis_html)
+    # in play, no arb, suspended odds and non match rows are all left out
+    assert len(opps) == 2
+    assert [o["Day"] for o in opps] == ["Monday", "Tuesday"]
+    assert [o["Kick-off"] for o in opps] == ["13:00", "10:00"]
+
+
+def test_parse_tennis_opportunities_names(tennis_html):
+    opps = parse_tennis_opportunities(tennis_html)
+    assert [(o["Player 1"], o["Player 2"]) for o in opps] == [
+        ("Daniil Medvedev", "Stefanos Tsitsipas"),
+        ("Iga Swiatek", "Simona Halep"),
+    ]
+    # odds are passed through as listed
+    assert [(o["Player 1 Odds"], o["Player 2 Odds"]) for o in opps] == [
+        ("6/4", "6/5"),
+        ("EVS", "11/10"),
+    ]
+
+
+def test_parse_tennis_opportunities_arb_flag(tennis_html):
+    opps = parse_tennis_opportunities(tennis_html)
+    assert [o["Arb Indicator"] for o in opps] == [1.8, 1.1]
+    assert all(o["Arb Indicator"] > 1 for o in opps)
+
+
+def test_parse_tennis_opportunities_empty_page():
+    assert parse_tennis_opportunities("<html><body></body></html>") == []
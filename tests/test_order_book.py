@@ -0,0 +1,40 @@
+from botsorted.binance import book
+from botsorted.binance.book import OrderBookStream, depth_weight, stream_url
+from botsorted.binance.conn import BASE_URL_FUTURES
+from botsorted.trading.cli import TradingClient
+
+
+class FakeDepth(object):
+    def json(self):
+        return {"lastUpdateId": 7, "bids": [["99.0", "1.0"]], "asks": [["101.0", "2.0"]]}
+
+
+class FakeClient(object):
+    url = "https://testnet.example"
+
+    def __init__(self):
+        self.limits = []
+
+    def depth(self, symbol, limit=500):
+        self.limits.append(limit)
+        return FakeDepth()
+
+
+def test_stream_follows_the_clients_exchange():
+    # tests never run live, so the client is on the testnet
+    assert stream_url(TradingClient()) == book.STREAM_URL_FUTURES_TEST
+    live = FakeClient()
+    live.url = BASE_URL_FUTURES
+    assert stream_url(live) == book.STREAM_URL_FUTURES
+
+
+def test_resync_is_charged_to_the_weight_budget(monkeypatch):
+    acquired = []
+    monkeypatch.setattr(book.weight_budget, "acquire", acquired.append)
+    cli = FakeClient()
+    stream = OrderBookStream(cli, "BTCUSDT", depth_limit=1000)
+    stream._resync()
+    assert cli.limits == [1000]
+    assert acquired == [depth_weight(1000)] == [20]
+    assert stream.book.last_update_id == 7
+    assert stream.book.mid() == 100.0
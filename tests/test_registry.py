@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+from botsorted.ml.dr import DirectReinforcementModel
+from botsorted.ml.registry import ModelRegistry, ModelRegistryException
+
+
+def save(path, seed=0, M=5):
+    rng = np.random.RandomState(seed)
+    DirectReinforcementModel(
+        theta=rng.randn(M + 2), mean=0.0, std=100.0, M=M, commission=0.001
+    ).save_model(str(path))
+
+
+def bump_mtime(path):
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+
+
+def test_one_instance_is_shared(tmp_path):
+    save(tmp_path / "m.json")
+    reg = ModelRegistry(poll_seconds=60)
+    mod = reg.register("M", "1.0", str(tmp_path / "m.json"))
+    assert reg.get("M", "1.0") is mod
+    # registering the same file again doesn't reload it
+    assert reg.register("M", "1.0", str(tmp_path / "m.json")) is mod
+
+
+def test_unknown_and_unloadable_models(tmp_path):
+    reg = ModelRegistry()
+    with pytest.raises(ModelRegistryException):
+        reg.get("M", "1.0")
+    with pytest.raises(ModelRegistryException):
+        reg.register("M", "1.0", str(tmp_path / "missing.json"))
+
+
+def test_changed_file_is_reloaded(tmp_path):
+    path = tmp_path / "m.json"
+    save(path, seed=0)
+    reg = ModelRegistry(poll_seconds=0)
+    old = reg.register("M", "1.0", str(path))
+    sha = reg.info("M", "1.0")["sha1"]
+    save(path, seed=1)
+    bump_mtime(path)
+    new = reg.get("M", "1.0")
+    assert new is not old
+    assert not np.array_equal(new.theta, old.theta)
+    assert reg.info("M", "1.0")["sha1"] != sha
+
+
+def test_touched_file_is_kept(tmp_path):
+    path = tmp_path / "m.json"
+    save(path)
+    reg = ModelRegistry(poll_seconds=0)
+    mod = reg.register("M", "1.0", str(path))
+    bump_mtime(path)
+    assert reg.get("M", "1.0") is mod
+
+
+def test_broken_file_keeps_the_loaded_model(tmp_path):
+    path = tmp_path / "m.json"
+    save(path)
+    reg = ModelRegistry(poll_seconds=0)
+    mod = reg.register("M", "1.0", str(path))
+    path.write_text("{not json")
+    bump_mtime(path)
+    assert reg.get("M", "1.0") is mod
+
+
+def test_not_rechecked_within_the_poll_interval(tmp_path):
+    path = tmp_path / "m.json"
+    save(path, seed=0)
+    reg = ModelRegistry(poll_seconds=3600)
+    mod = reg.register("M", "1.0", str(path))
+    save(path, seed=1)
+    bump_mtime(path)
+    assert reg.get("M", "1.0") is mod
+    reg.refresh()
+    assert reg.get("M", "1.0") is not mod
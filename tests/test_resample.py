@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from botsorted.trading.resample import FIELDS, CandleResampler, aggregate
+
+MINUTE_MS = 60000
+# Wednesday 2021-03-17 13:37 UTC, so no bucket starts on the first bar
+START = int(pd.Timestamp("2021-03-17 13:37", tz="UTC").value // 10 ** 6)
+N = 3 * 7 * 1440 + 500
+
+RULES = {"1h": "1h", "4h": "4h", "1d": "1D", "1w": "W-MON"}
+
+
+@pytest.fixture(scope="module")
+def bars():
+    rng = np.random.default_rng(7)
+    close = 100 + np.cumsum(rng.normal(0, 0.1, N))
+    open_ = np.r_[100.0, close[:-1]]
+    spread = np.abs(rng.normal(0, 0.05, (2, N)))
+    return {
+        "openTime": START + np.arange(N, dtype=np.int64) * MINUTE_MS,
+        "open": open_,
+        "high": np.maximum(open_, close) + spread[0],
+        "low": np.minimum(open_, close) - spread[1],
+        "close": close,
+        "volume": rng.uniform(0, 10, N),
+    }
+
+
+def pandas_resample(bars, interval):
+    df = pd.DataFrame(bars)
+    df.index = pd.to_datetime(df.openTime, unit="ms", utc=True)
+    out = (
+        df.drop(columns="openTime")
+        .resample(RULES[interval], closed="left", label="left")
+        .agg({"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"})
+        .dropna()
+    )
+    out.insert(0, "openTime", out.index.asi8 // 10 ** 6)
+    return out.reset_index(drop=True)
+
+
+def assert_frames(ours, theirs):
+    for k in FIELDS:
+        np.testing.assert_allclose(
+            np.asarray(ours[k], dtype=np.float64), theirs[k].to_numpy(np.float64), err_msg=k
+        )
+
+
+@pytest.mark.parametrize("interval", list(RULES))
+def test_aggregate_matches_pandas(bars, interval):
+    ours = aggregate(bars, interval)
+    assert_frames(ours, pandas_resample(bars, interval))
+
+
+def test_weeks_start_on_monday(bars):
+    starts = pd.to_datetime(aggregate(bars, "1w")["openTime"], unit="ms", utc=True)
+    assert (starts[1:].dayofweek == 0).all()
+    assert (starts[1:].hour == 0).all()
+    # the first, partial, week is the one the Wednesday start falls in
+    assert starts[0] == pd.Timestamp("2021-03-15", tz="UTC")
+
+
+@pytest.mark.parametrize("interval", list(RULES))
+def test_resampler_matches_pandas(bars, interval):
+    resampler = CandleResampler("1m", [interval], max_bars=N)
+    closed = []
+    resampler.on_bar_closed(lambda symbol, iv, bar: closed.append(bar))
+    # fed in uneven chunks like successive polls
+    for lo, hi in zip([0, 1, 700, 5000, 20000], [1, 700, 5000, 20000, N]):
+        resampler.add_bars("BTCUSDT", {k: v[lo:hi] for k, v in bars.items()})
+
+    expected = pandas_resample(bars, interval)
+    # the last bucket is still open at the end of the data
+    assert_frames(resampler.candles("BTCUSDT", interval), expected.iloc[:-1])
+    assert_frames(pd.DataFrame(closed), expected.iloc[:-1])
+    assert_frames(
+        resampler.candles("BTCUSDT", interval, include_partial=True).tail(1),
+        expected.tail(1),
+    )
@@ -0,0 +1,74 @@
+import json
+import os
+import subprocess
+import sys
+import time
+
+from botsorted.serve import supervise
+from botsorted.trading.state import EngineStateReader
+from conftest import fixture_path
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# what botsorted.trading.run does with the scanners, against the fixture page
+SCANNER = """
+from botsorted.fred.arb import ArbitrageEngine
+from botsorted.fred.scanner import TennisScanner
+
+page = open({fixture!r}).read()
+TennisScanner(fetch=lambda: page).scan()
+arb = ArbitrageEngine(fetch=lambda url: page)
+arb.scan()
+arb.write()
+"""
+
+
+def run_scanner(tmp_path):
+    env = {
+        **os.environ,
+        "BOTSORTED_CONFIG": json.dumps(
+            {
+                "tennisScanFile": str(tmp_path / "tennis_scan.json"),
+                "arbScanFile": str(tmp_path / "arb_scan.json"),
+                "arbPages": [
+                    {"sport": "tennis", "market": "match-winner", "url": "http://odds/tennis"}
+                ],
+                "logFile": str(tmp_path / "botsorted.log"),
+            }
+        ),
+    }
+    script = SCANNER.format(fixture=fixture_path("oddschecker_tennis.html"))
+    subprocess.run([sys.executable, "-c", script], cwd=REPO_ROOT, env=env, check=True)
+
+
+def test_web_reads_scans_from_another_process(tmp_path):
+    run_scanner(tmp_path)
+    tennis = EngineStateReader(str(tmp_path / "tennis_scan.json")).read()
+    assert tennis["scannedAt"] is not None
+    assert tennis["error"] is None
+    assert len(tennis["opportunities"]) > 0
+    arb = EngineStateReader(str(tmp_path / "arb_scan.json")).read()
+    assert arb["scannedAt"] is not None
+    assert arb["markets"] == 5
+
+
+def test_web_rereads_a_newer_scan(tmp_path):
+    run_scanner(tmp_path)
+    reader = EngineStateReader(str(tmp_path / "tennis_scan.json"))
+    first = reader.read()["scannedAt"]
+    time.sleep(0.01)
+    run_scanner(tmp_path)
+    assert reader.read()["scannedAt"] > first
+
+
+def test_supervise_stops_the_rest_when_one_exits():
+    start = time.time()
+    code = supervise(
+        [
+            [sys.executable, "-c", "import time; time.sleep(60)"],
+            [sys.executable, "-c", "import sys; sys.exit(3)"],
+        ],
+        poll=0.1,
+    )
+    assert code == 3
+    assert time.time() - start < 30
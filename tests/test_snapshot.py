@@ -0,0 +1,43 @@
+import pytest
+
+from botsorted.trading.snapshot import (
+    SnapshotStore,
+    next_poll_time,
+    snapshot_key,
+    validate_snapshot,
+)
+
+SNAPSHOT = {"modelSha1": "abc", "lastCandleTime": 1000, "position": "long"}
+
+
+def test_valid_snapshot():
+    assert validate_snapshot(SNAPSHOT, "abc", 1000, "long") == (True, "ok")
+
+
+def test_model_changed():
+    ok, reason = validate_snapshot(SNAPSHOT, "def", 1000, "long")
+    assert not ok and "model" in reason
+
+
+def test_candle_closed_since():
+    ok, reason = validate_snapshot(SNAPSHOT, "abc", 2000, "long")
+    assert not ok and "candle" in reason
+
+
+def test_position_changed():
+    ok, reason = validate_snapshot(SNAPSHOT, "abc", 1000, None)
+    assert not ok and "position" in reason
+
+
+def test_next_poll_time():
+    # a day after the close of the candle, in seconds
+    assert next_poll_time(86400000 - 1, "1d") == pytest.approx(2 * 86400 - 0.001)
+
+
+def test_store_round_trip():
+    store = SnapshotStore()
+    key = snapshot_key("BTCUSDT", "1d", "SnapTest", "1.0")
+    assert store.load(key) is None
+    store.save(key, {**SNAPSHOT, "ft": [0.0, 0.5]})
+    store.save(key, {**SNAPSHOT, "ft": [0.0, -0.5]})
+    assert store.load(key)["ft"] == [0.0, -0.5]
@@ -0,0 +1,113 @@
+import json
+
+import numpy as np
+import pytest
+
+from botsorted.trading.state import EngineStateReader
+from botsorted.trading.stream import EngineStateStream
+
+DAY_MS = 86400000
+
+
+def state(n_closed=20, open_close=None, seed=0, signal="BUY"):
+    """
+    engine state with n_closed closed bars and an open one, tails of one
+    series so consecutive calls line up like consecutive candles
+    """
+    rng = np.random.RandomState(seed)
+    close = list(100 * np.exp(np.cumsum(rng.randn(40) * 0.01)))[: n_closed + 1]
+    ft = list(np.tanh(rng.randn(40)))[: n_closed + 1]
+    ft[0] = 0.0
+    if open_close is not None:
+        close[-1] = open_close
+    return {
+        "symbol": "BTCUSDT",
+        "closeTime": [(i + 1) * DAY_MS - 1 for i in range(n_closed + 1)],
+        "close": close,
+        "ft": ft,
+        "signal": signal,
+        "lastFt": ft[-1],
+        "position": None,
+    }
+
+
+def parse(message: bytes):
+    lines = message.decode().strip().split("\n")
+    event = lines[0][len("event: ") :]
+    data = json.loads(lines[-1][len("data: ") :])
+    return event, data
+
+
+@pytest.fixture
+def stream(tmp_path):
+    return EngineStateStream(EngineStateReader(str(tmp_path / "state.json")))
+
+
+def fresh_total(s: dict) -> float:
+    """
+    cumulative model return a new client's snapshot ends at
+    """
+    _, data = parse(EngineStateStream(EngineStateReader("unused")).ingest(s))
+    return data["modelReturns"][-1]
+
+
+def test_first_state_is_a_snapshot(stream):
+    event, data = parse(stream.ingest(state()))
+    assert event == "snapshot"
+    assert len(data["close"]) == 21
+    assert data["modelReturns"][0] == 0
+    assert data["signal"] == "BUY"
+
+
+def test_unchanged_state_sends_nothing(stream):
+    stream.ingest(state())
+    # only the heartbeat or lastLoopAt moved
+    assert stream.ingest({**state(), "lastLoopAt": 1.0}) is None
+
+
+def test_open_bar_moving_is_an_in_place_update(stream):
+    stream.ingest(state())
+    s = state(open_close=123.0)
+    event, data = parse(stream.ingest(s))
+    assert event == "update"
+    assert data["newCandle"] is False
+    assert data["close"] == 123.0
+    assert "closed" not in data
+    assert data["modelReturns"] == pytest.approx(fresh_total(s))
+
+
+def test_new_candle_closes_the_bar_in_place(stream):
+    first = state(20)
+    stream.ingest(first)
+    s = state(21)
+    event, data = parse(stream.ingest(s))
+    assert event == "update"
+    assert data["newCandle"] is True
+    assert data["closed"]["closeTime"] == first["closeTime"][-1]
+    assert data["closed"]["close"] == s["close"][-2]
+    assert data["modelReturns"] == pytest.approx(fresh_total(s))
+
+
+def test_missed_candles_send_a_new_snapshot(stream):
+    stream.ingest(state(20))
+    event, data = parse(stream.ingest(state(22)))
+    assert event == "snapshot"
+    assert data["modelReturns"][-1] == pytest.approx(fresh_total(state(22)))
+
+
+def test_signal_change_alone_is_an_update(stream):
+    stream.ingest(state(signal="BUY"))
+    event, data = parse(stream.ingest(state(signal="SELL")))
+    assert event == "update"
+    assert data["signal"] == "SELL"
+
+
+def test_new_candle_with_the_tail_moved_on(stream):
+    stream.ingest(state(20))
+    s = state(21)
+    # the engine publishes a fixed length tail, so the oldest bar drops off
+    for k in ("closeTime", "close", "ft"):
+        s[k] = s[k][1:]
+    event, data = parse(stream.ingest(s))
+    assert event == "update"
+    assert data["newCandle"] is True
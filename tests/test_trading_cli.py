@@ -0,0 +1,86 @@
+import pytest
+
+from botsorted.config import config
+from botsorted.models import Symbol
+from botsorted.trading.cli import PartialFillException, TradingClient
+from botsorted.trading.engine import TradingEngine
+
+SYM = Symbol(base="BTC", quote="USDT")
+
+
+class FakeResponse(object):
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+        self.text = "{}" if status_code == 200 else '{"code": -1001}'
+
+
+class FakeBook(object):
+    # deep enough for a quarter of the order at a time within the slippage
+    is_live = True
+
+    def expected_fill(self, side, qty):
+        return {"price": 100.0, "slippageBps": 50.0}
+
+    def max_qty_for_slippage(self, side, bps):
+        return 0.25
+
+    def best(self):
+        return 100.0
+
+
+class FakeClient(TradingClient):
+    def __init__(self, fail_calls=()):
+        super().__init__(books={SYM.conc(): FakeBook()})
+        self.fail_calls = set(fail_calls)
+        self.calls = []
+        self.filled = 0.0
+
+    def quantity_precision(self, symbol):
+        return 3
+
+    def new_order(self, symbol, side, quantity):
+        self.calls.append(quantity)
+        if len(self.calls) - 1 in self.fail_calls:
+            return FakeResponse(400)
+        self.filled += quantity
+        return FakeResponse(200)
+
+
+@pytest.fixture(autouse=True)
+def no_waiting(monkeypatch):
+    monkeypatch.setitem(config, "orderSplitWaitSeconds", 0)
+    monkeypatch.setitem(config, "tradeCallWaitTimeSeconds", 0)
+    monkeypatch.setitem(config, "orderSplitMaxChunks", 4)
+    monkeypatch.setitem(config, "maxSlippageBps", 10)
+
+
+def test_split_order_fills_in_chunks():
+    cli = FakeClient()
+    resp = cli.market_order(SYM, "BUY", 1.0)
+    assert resp.status_code == 200
+    assert cli.calls == [0.25, 0.25, 0.25, 0.25]
+
+
+def test_first_child_failing_returns_the_response():
+    cli = FakeClient(fail_calls={0})
+    resp = cli.market_order(SYM, "BUY", 1.0)
+    assert resp.status_code == 400
+    assert cli.filled == 0
+
+
+def test_child_failing_after_a_fill_raises():
+    cli = FakeClient(fail_calls={1})
+    with pytest.raises(PartialFillException) as e:
+        cli.market_order(SYM, "SELL", 1.0)
+    assert e.value.filled == 0.25
+    assert e.value.remaining == 0.75
+    assert e.value.side == "SELL"
+
+
+def test_engine_only_retries_the_remainder():
+    cli = FakeClient(fail_calls={1})
+    engine = TradingEngine.__new__(TradingEngine)
+    engine.client = cli
+    assert engine.try_call(0, "open long", cli.market_order, SYM, "BUY", 1.0)
+    assert cli.filled == pytest.approx(1.0)
+    assert cli.calls == [0.25, 0.25, 0.25, 0.25, 0.25]